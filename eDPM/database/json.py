@@ -1,19 +1,27 @@
 import json
 from pydantic.json import custom_pydantic_encoder
 import numpy as np
+import scipy.sparse as sparse
 import functools
+from scipy.integrate import OdeSolution
 
 from eDPM.model import FisherResults
+from eDPM.solving.profiling import Profiler
 
 
 def _get_encoder(fsr: FisherResults):
     encoders = {
         np.ndarray: lambda x: x.tolist(),
+        # The inverse covariance matrix is diagonal. Only store its diagonal entries.
+        sparse.spmatrix: lambda x: x.diagonal().tolist(),
         np.int32: lambda x: str(x),
         np.int64: lambda x: "here",
         fsr.ode_fun.__class__.__mro__[-2]: lambda x: getattr(x, '__name__', 'unknown'),
         fsr.criterion_fun.__class__.__mro__[-2]: lambda x: getattr(x, '__name__', 'unknown'),
         type(functools.partial(lambda x: x)): lambda x: 'autogenerated_function',
+        # Dense solutions of cached ODE solutions are not stored. The solution values are kept.
+        OdeSolution: lambda x: None,
+        Profiler: lambda x: x.as_dict(),
     }
 
     # Define the encoder as a modification of the pydantic encoder
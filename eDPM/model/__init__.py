@@ -1,2 +1,3 @@
 from .fisher_model import *
 from .preprocessing import *
+from .symbolic import *
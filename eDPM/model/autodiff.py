@@ -0,0 +1,94 @@
+import numpy as np
+
+
+class _ComplexStepDerivatives:
+    r"""Derivatives of the right-hand side :math:`f` of the ODEs with respect to the state variables and parameters obtained by the complex-step method
+
+    .. math::
+
+        \frac{\partial f}{\partial z_k} = \frac{\text{Im} f(z + i h e_k)}{h}
+
+    which is exact up to machine precision since no difference of function values is taken.
+    All directions :math:`e_k` of the state variables and parameters are appended as a last axis to the arguments
+    such that both Jacobians are obtained from a single call of :math:`f`. If the function can not be evaluated in this way
+    (eg. since it builds arrays of fixed shape), every direction is evaluated by a separate call.
+    Which of the two variants is used is decided at the first evaluation and kept for the model.
+
+    The function needs to accept complex arguments, ie. it must not use ``abs``, comparisons or other non-analytic operations on the state variables and parameters.
+
+    :param ode_fun: The ODEs right-hand side function :math:`f`.
+    :type ode_fun: callable
+    :param step: The size of the imaginary step :math:`h`. Defaults to 1e-20.
+    :type step: float, optional
+    """
+    def __init__(self, ode_fun, step: float=1e-20):
+        self.ode_fun = ode_fun
+        self.step = step
+        self.vectorized = None
+        # The derivatives with respect to the states and parameters are requested one after another with identical arguments
+        self._last = (None, None)
+
+    def _evaluate_vectorized(self, t, x, inputs, parameters, ode_args):
+        n_x, n_p = x.shape[0], len(parameters)
+        batch = x.shape[1:]
+        directions = np.eye(n_x + n_p) * self.step
+        x_c = x[..., np.newaxis] + 1j * directions[:n_x].reshape((n_x,) + (1,)*len(batch) + (n_x + n_p,))
+        p_c = tuple(p + 1j * directions[n_x + i] for i, p in enumerate(parameters))
+        inputs_c = [np.asarray(q)[..., np.newaxis] for q in inputs] if len(batch) > 0 else inputs
+        shape = batch + (n_x + n_p,)
+        f = [np.broadcast_to(fi, shape) for fi in self.ode_fun(t, x_c, inputs_c, p_c, ode_args)]
+        if len(f) != n_x:
+            raise ValueError("The function returned {} instead of {} components.".format(len(f), n_x))
+        # Move the directions to the second axis: (n_x, n_x + n_p) + batch
+        return np.moveaxis(np.imag(np.array(f)) / self.step, -1, 1)
+
+    def _evaluate_directions(self, t, x, inputs, parameters, ode_args):
+        n_x, n_p = x.shape[0], len(parameters)
+        columns = []
+        for k in range(n_x):
+            x_c = x.astype(complex)
+            x_c[k] += 1j * self.step
+            columns.append(self.ode_fun(t, x_c, inputs, parameters, ode_args))
+        for k in range(n_p):
+            p_c = tuple(p + 1j * self.step if i == k else p for i, p in enumerate(parameters))
+            columns.append(self.ode_fun(t, x, inputs, p_c, ode_args))
+        values = [np.array([np.broadcast_to(fi, x.shape[1:]) for fi in column]) for column in columns]
+        return np.imag(np.stack(values, axis=1)) / self.step
+
+    def jacobians(self, t, x, inputs, parameters, ode_args):
+        """Calculate the derivatives with respect to the state variables and parameters.
+
+        :return: The derivatives dfdx of shape (n_x, n_x) and dfdp of shape (n_x, n_p). If the arguments contain multiple conditions, the conditions are the last axis.
+        :rtype: np.ndarray, np.ndarray
+        """
+        x = np.asarray(x, dtype=float)
+        key = (t, x.shape, x.tobytes(), tuple(np.asarray(q).tobytes() for q in inputs), tuple(parameters), id(ode_args))
+        last_key, jac = self._last
+        if last_key != key:
+            if self.vectorized is None:
+                # Only keep the evaluation of all directions at once if it reproduces the evaluation of the individual directions
+                jac = self._evaluate_directions(t, x, inputs, parameters, ode_args)
+                try:
+                    jac_vectorized = self._evaluate_vectorized(t, x, inputs, parameters, ode_args)
+                    self.vectorized = jac_vectorized.shape == jac.shape and np.allclose(jac_vectorized, jac, rtol=1e-12, atol=1e-12*np.max(np.abs(jac), initial=0.0))
+                except Exception:
+                    self.vectorized = False
+            elif self.vectorized:
+                jac = self._evaluate_vectorized(t, x, inputs, parameters, ode_args)
+            else:
+                jac = self._evaluate_directions(t, x, inputs, parameters, ode_args)
+            self._last = (key, jac)
+        n_x = x.shape[0]
+        return jac[:, :n_x], jac[:, n_x:]
+
+    def __getstate__(self):
+        # The cached evaluation is not sent to worker processes
+        return {"ode_fun": self.ode_fun, "step": self.step, "vectorized": self.vectorized, "_last": (None, None)}
+
+
+def _ode_dfdx_autodiff(t, x, inputs, parameters, ode_args, derivatives):
+    return derivatives.jacobians(t, x, inputs, parameters, ode_args)[0]
+
+
+def _ode_dfdp_autodiff(t, x, inputs, parameters, ode_args, derivatives):
+    return derivatives.jacobians(t, x, inputs, parameters, ode_args)[1]
@@ -1,6 +1,7 @@
 import numpy as np
+import scipy.sparse as sparse
 # from dataclasses import dataclass
-from copy import deepcopy
+from copy import copy, deepcopy
 import functools
 from pydantic.dataclasses import dataclass
 from pydantic import root_validator, validator
@@ -11,6 +12,7 @@ except:
 from typing import Optional, Union, Any, List, Tuple, Dict
 
 from .preprocessing import VariableDefinition, MultiVariableDefinition, CovarianceDefinition
+from .autodiff import _ComplexStepDerivatives, _ode_dfdx_autodiff, _ode_dfdp_autodiff
 
 
 class Config:
@@ -141,6 +143,16 @@ class _FisherObservableFunctionsOptional:
     obs_dgdx0: Callable = None
 
 
+@dataclass(config=Config)
+class _FisherOdeFunctionsOptions:
+    ode_autodiff: bool = False
+    ode_vectorized: bool = False
+    obs_vectorized: bool = False
+    ode_rhs_fused: Callable = None
+    ode_jit: bool = False
+    obs_jit: bool = False
+
+
 @dataclass(config=Config)
 class FisherVariables(_FisherVariablesOptions, _FisherVariablesBase):
     # TODO - Documentation Fisher Variables
@@ -162,11 +174,16 @@ class FisherVariables(_FisherVariablesOptions, _FisherVariablesBase):
 
 @dataclass(config=Config)
 class _FisherModelBase(_FisherOdeFunctions, _FisherVariablesBase):
-    pass
+    # The derivatives can be generated automatically (see ode_autodiff).
+    # Redefining them keeps their position directly after ode_fun.
+    ode_dfdx: Callable = None
+    ode_dfdp: Callable = None
 
 
+# The options of the ODE functions are the first base such that their fields are placed
+# after all fields of the original model and positional arguments keep their meaning.
 @dataclass(config=Config)
-class _FisherModelOptions(_FisherVariablesOptions, _FisherObservableFunctionsOptional):
+class _FisherModelOptions(_FisherOdeFunctionsOptions, _FisherVariablesOptions, _FisherObservableFunctionsOptional):
     pass
 
 
@@ -209,6 +226,20 @@ class FisherModel(_FisherModelOptions, _FisherModelBase):
     def validate_covariance(cls, cov):
         return _general_validator(cov, _COVARIANCE_TYPE_CASTS)
 
+    @root_validator
+    def all_derivatives_defined(cls, values):
+        # Generate the derivatives of the right-hand side which were not supplied.
+        # Both are obtained from the same evaluations and thus share one object.
+        if values.get("ode_dfdx") is None or values.get("ode_dfdp") is None:
+            if not values.get("ode_autodiff"):
+                raise ValueError("Specify \'ode_dfdx\' and \'ode_dfdp\' or set \'ode_autodiff=True\' to calculate them automatically.")
+            derivatives = _ComplexStepDerivatives(values["ode_fun"])
+            if values["ode_dfdx"] is None:
+                values["ode_dfdx"] = functools.partial(_ode_dfdx_autodiff, derivatives=derivatives)
+            if values["ode_dfdp"] is None:
+                values["ode_dfdp"] = functools.partial(_ode_dfdp_autodiff, derivatives=derivatives)
+        return values
+
     @root_validator
     def all_observables_defined(cls, values):
         # Check if we can automatically calculate the new observable functions
@@ -517,12 +548,52 @@ class FisherModelParametrized(_FisherModelParametrizedOptions, _FisherModelParam
             obs_dgdp=fsm.obs_dgdp,
             ode_dfdx0=fsm.ode_dfdx0,
             obs_dgdx0=fsm.obs_dgdx0,
+            ode_autodiff=fsm.ode_autodiff,
+            ode_vectorized=fsm.ode_vectorized,
+            obs_vectorized=fsm.obs_vectorized,
+            ode_rhs_fused=fsm.ode_rhs_fused,
+            ode_jit=fsm.ode_jit,
+            obs_jit=fsm.obs_jit,
             identical_times=fsm.identical_times,
             ode_args=fsm.ode_args,
             covariance=covariance,
         )
         return fsmp
 
+    def with_values(self, ode_x0=None, ode_t0=None, times=None, inputs=None):
+        """Create a copy of the model with new values for the sampled variables.
+
+        In contrast to assigning the variables, the values are not validated and the model itself is not modified.
+        The copy shares every other attribute with this model. It is thus cheap to create and many designs can be evaluated concurrently.
+        The values need to be supplied in the form in which they are stored (eg. ``times`` with the full shape).
+
+        :param ode_x0: The new initial values. Defaults to None (unchanged).
+        :type ode_x0: list, optional
+        :param ode_t0: The new initial times. Defaults to None (unchanged).
+        :type ode_t0: np.ndarray, optional
+        :param times: The new evaluation times. Defaults to None (unchanged).
+        :type times: np.ndarray, optional
+        :param inputs: The new values of the inputs. Entries which are None are not changed. Defaults to None (unchanged).
+        :type inputs: list, optional
+
+        :return: The model with the new values.
+        :rtype: FisherModelParametrized
+        """
+        # Bypass the validation on assignment of the pydantic dataclasses
+        variable_values = copy(self.variable_values)
+        if ode_x0 is not None:
+            object.__setattr__(variable_values, "ode_x0", list(ode_x0))
+        if ode_t0 is not None:
+            object.__setattr__(variable_values, "ode_t0", np.asarray(ode_t0, dtype=float))
+        if times is not None:
+            object.__setattr__(variable_values, "times", np.asarray(times, dtype=float))
+        if inputs is not None:
+            object.__setattr__(variable_values, "inputs", [q if q_new is None else np.asarray(q_new) for q, q_new in zip(self.variable_values.inputs, inputs)])
+
+        fsmp = copy(self)
+        object.__setattr__(fsmp, "variable_values", variable_values)
+        return fsmp
+
 
 @dataclass(config=Config)
 class _FisherResultSingleBase(_FisherVariablesBase):
@@ -546,7 +617,7 @@ class FisherResultSingle(_FisherResultSingleOptions, _FisherResultSingleBase):
 class _FisherResultsBase(_FisherModelParametrizedBase):
     criterion: float
     S: np.ndarray
-    C: np.ndarray
+    C: Union[np.ndarray, sparse.spmatrix]
     criterion_fun: Callable
     individual_results: list
     relative_sensitivities: bool
@@ -555,6 +626,9 @@ class _FisherResultsBase(_FisherModelParametrizedBase):
 @dataclass(config=Config)
 class _FisherResultsOptions(_FisherModelParametrizedOptions):
     penalty_discrete_summary: Any = None
+    ensemble: Any = None
+    termination: Any = None
+    profile: Any = None
 
 
 @dataclass(config=Config)
@@ -29,7 +29,7 @@ class VariableDefinition():
             self.discrete = np.array(self.discrete)
         
         # Check if we want to specify more values than possible given the range with discretization)
-        if self.unique==True and self.discrete!=None:
+        if self.unique==True and self.discrete is not None:
             # TODO test this statement
             if self.n > len(self.discrete):
                 raise ValueError("Too many steps ({}) in interval [{}, {}] with discretization {}".format(self.n, self.ub, self.lb, self.discrete))
@@ -0,0 +1,276 @@
+import os
+import hashlib
+import numpy as np
+
+from .fisher_model import FisherModel
+from .preprocessing import VariableDefinition, MultiVariableDefinition
+
+
+# Increase whenever the generated code changes such that old files of the cache are not used anymore
+_GENERATOR_VERSION = 1
+
+
+class _GeneratedFunction:
+    # A function compiled from generated source code (and optionally by numba).
+    # It is pickled as its source such that it can be sent to worker processes.
+    def __init__(self, name: str, source: str, jit=False):
+        self.__name__ = name
+        self.source = source
+        self.jit = jit
+        self._compile()
+
+    def _compile(self):
+        namespace = {}
+        exec(compile(self.source, "<eDPM symbolic {}>".format(self.__name__), "exec"), namespace)
+        self._fun = namespace[self.__name__]
+        if self.jit:
+            # Imported here since the solving package itself depends on the model package
+            from eDPM.solving.jit import _import_numba
+            self._fun = _import_numba().njit(self._fun)
+
+    def __call__(self, *args):
+        return self._fun(*args)
+
+    def __getstate__(self):
+        return {"__name__": self.__name__, "source": self.source, "jit": self.jit}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._compile()
+
+
+def _import_sympy():
+    try:
+        import sympy
+    except ImportError:
+        raise ImportError("The symbolic model compiler requires sympy. Install it with 'pip install sympy'.")
+    return sympy
+
+
+def _numpy_printer(sym):
+    try:
+        from sympy.printing.numpy import NumPyPrinter
+    except ImportError:
+        from sympy.printing.pycode import NumPyPrinter
+    return NumPyPrinter({"fully_qualified_modules": True, "inline": True})
+
+
+def _function_source(sym, printer, name: str, exprs, arg_groups: list, cse=True, state="x", as_array=False) -> str:
+    # Generate a function with the signature of the user functions (t, x, inputs, parameters, ode_args) returning nested lists.
+    # Nested lists (instead of arrays) allow constant entries next to entries which are arrays when the functions are vectorized.
+    # The fused right-hand side only works on single states and returns an array.
+    shape = np.shape(np.array(exprs, dtype=object))
+    flat = [sym.sympify(e) for e in np.array(exprs, dtype=object).ravel()]
+    if cse:
+        replacements, flat = sym.cse(flat, symbols=sym.numbered_symbols("_cse"))
+    else:
+        replacements = []
+
+    used = set().union(*[e.free_symbols for e in flat], *[e.free_symbols for _, e in replacements])
+    lines = ["def {}(t, {}, inputs, parameters, ode_args):".format(name, state)]
+    for arg, symbols in arg_groups:
+        if len(symbols) > 0 and any(s in used for s in symbols):
+            lines.append("    {}, = {}".format(", ".join(str(s) for s in symbols), arg))
+    for s, e in replacements:
+        lines.append("    {} = {}".format(s, printer.doprint(e)))
+
+    entries = [printer.doprint(e) for e in flat]
+    if as_array:
+        result = "numpy.array([{}], dtype=numpy.float64)".format(", ".join(entries))
+    elif len(shape) == 1:
+        result = "[{}]".format(", ".join(entries))
+    else:
+        n_cols = shape[1]
+        rows = ["[{}]".format(", ".join(entries[i:i+n_cols])) for i in range(0, len(entries), n_cols)]
+        result = "[{}]".format(", ".join(rows))
+    lines.append("    return {}".format(result))
+    return "\n".join(lines) + "\n"
+
+
+def _symbolic_expressions(sym, ode_fun, obs_fun, n_x: int, n_inputs: int, n_parameters: int, n_ode_args: int):
+    t = sym.Symbol("t")
+    x = list(sym.symbols("x_0:{}".format(n_x)))
+    inputs = list(sym.symbols("u_0:{}".format(n_inputs)))
+    parameters = tuple(sym.symbols("p_0:{}".format(n_parameters)))
+    ode_args = tuple(sym.symbols("c_0:{}".format(n_ode_args)))
+    arg_groups = [("x", x), ("inputs", inputs), ("parameters", parameters), ("ode_args", ode_args)]
+
+    f = [sym.sympify(e) for e in np.ravel(np.array(ode_fun(t, x, inputs, parameters, ode_args if n_ode_args > 0 else None), dtype=object))]
+    if len(f) != n_x:
+        raise ValueError("The symbolic ode_fun returned {} components but the model has {} state variables.".format(len(f), n_x))
+    g = None
+    if callable(obs_fun):
+        g = [sym.sympify(e) for e in np.ravel(np.array(obs_fun(t, x, inputs, parameters, ode_args if n_ode_args > 0 else None), dtype=object))]
+    return t, x, parameters, arg_groups, f, g
+
+
+def _fused_source(sym, printer, f, dfdx, dfdp, x, arg_groups, x0_as_parameter: bool, cse: bool) -> str:
+    # The augmented right-hand side (f, dfdx s + dfdp, dfdx s_x0 + dfdx0) with the layout of the state vector of OdeRhs.
+    # Common subexpressions are shared between the state variables and all sensitivities.
+    n_x, n_p = len(x), len(dfdp[0]) if len(dfdp) > 0 else 0
+    s = sym.Matrix(n_x, n_p, lambda i, j: sym.Symbol("s_{}_{}".format(i, j)))
+    exprs = list(f) + list(sym.Matrix(dfdx) * s + sym.Matrix(n_x, n_p, lambda i, j: dfdp[i][j]))
+    y = list(x) + list(s)
+    if x0_as_parameter:
+        s_x0 = sym.Matrix(n_x, n_x, lambda i, j: sym.Symbol("z_{}_{}".format(i, j)))
+        exprs += list(sym.Matrix(dfdx) * s_x0)
+        y += list(s_x0)
+    groups = [("y", y)] + [group for group in arg_groups if group[0] != "x"]
+    return _function_source(sym, printer, "ode_rhs_fused", exprs, groups, cse, state="y", as_array=True)
+
+
+def _generate_source(sym, f, g, x, parameters, arg_groups, x0_as_parameter: bool, cse: bool, fused=False):
+    # Differentiate the right-hand side and the observable and generate the code of all functions as one module
+    printer = _numpy_printer(sym)
+    n_x = len(x)
+    dfdx = [[sym.diff(fi, xj) for xj in x] for fi in f]
+    dfdp = [[sym.diff(fi, pj) for pj in parameters] for fi in f]
+    functions = [
+        ("ode_fun", f),
+        ("ode_dfdx", dfdx),
+        ("ode_dfdp", dfdp),
+    ]
+    if x0_as_parameter:
+        # The right-hand side does not depend on the initial values explicitly
+        functions.append(("ode_dfdx0", [[0] * n_x for _ in range(n_x)]))
+    if g is not None:
+        functions += [
+            ("obs_fun", g),
+            ("obs_dgdx", [[sym.diff(gi, xj) for xj in x] for gi in g]),
+            ("obs_dgdp", [[sym.diff(gi, pj) for pj in parameters] for gi in g]),
+        ]
+        if x0_as_parameter:
+            functions.append(("obs_dgdx0", [[0] * n_x for _ in range(len(g))]))
+    sources = [_function_source(sym, printer, name, exprs, arg_groups, cse) for name, exprs in functions]
+    names = [name for name, _ in functions]
+    if fused:
+        sources.append(_fused_source(sym, printer, f, dfdx, dfdp, x, arg_groups, x0_as_parameter, cse))
+        names.append("ode_rhs_fused")
+    return names, "import numpy\n\n\n" + "\n\n".join(sources)
+
+
+def symbolic_functions(ode_fun, n_x: int, n_inputs: int, n_parameters: int, n_ode_args: int=0, obs_fun=None, x0_as_parameter=False, cse=True, cache_dir=None, fused=False, jit=False) -> dict:
+    r"""Derive the Jacobians of a symbolic right-hand side (and observable) and compile them into numpy functions.
+
+    The functions ``ode_fun`` and ``obs_fun`` have the usual signature ``(t, x, inputs, parameters, ode_args)`` but are called once with `sympy <https://www.sympy.org>`__ symbols.
+    They thus need to use sympy functions (eg. ``sympy.exp``) instead of numpy functions.
+    All derivatives are calculated symbolically. Common subexpressions of every matrix are eliminated and each matrix is compiled into a single numpy function.
+    The generated functions return nested lists and only use numpy operations. Thus they can also be used with ``ode_vectorized=True`` and ``obs_vectorized=True``.
+
+    :param ode_fun: The right-hand side of the ODEs.
+    :type ode_fun: callable
+    :param n_x: The number of state variables.
+    :type n_x: int
+    :param n_inputs: The number of inputs.
+    :type n_inputs: int
+    :param n_parameters: The number of estimated parameters.
+    :type n_parameters: int
+    :param n_ode_args: The number of (scalar) ode_args. Defaults to 0.
+    :type n_ode_args: int, optional
+    :param obs_fun: The observable. Defaults to None (the states are observed).
+    :type obs_fun: callable, optional
+    :param x0_as_parameter: Also generate ``ode_dfdx0`` and ``obs_dgdx0`` to use the initial values as parameters.
+        The right-hand side may not depend on the initial values explicitly. Defaults to False.
+    :type x0_as_parameter: bool, optional
+    :param cse: Eliminate common subexpressions. Defaults to True.
+    :type cse: bool, optional
+    :param cache_dir: A directory in which the generated code is stored. Later calls with the same expressions load the code instead of differentiating again. Defaults to None (no cache).
+    :type cache_dir: str, optional
+    :param fused: Also generate ``ode_rhs_fused`` which calculates the state variables and all sensitivities in one function (see :py:class:`OdeRhs`).
+        Common subexpressions are shared between all components. Defaults to False.
+    :type fused: bool, optional
+    :param jit: Compile ``ode_rhs_fused`` with ``numba.njit``. Defaults to False.
+    :type jit: bool, optional
+
+    :raises ImportError: Raised if sympy (or numba with ``jit=True``) is not installed.
+    :raises ValueError: Raised if the number of components of ``ode_fun`` does not match ``n_x``.
+    :return: The generated functions as arguments of the :py:class:`FisherModel` (``ode_fun``, ``ode_dfdx``, ``ode_dfdp`` and optionally ``ode_dfdx0``, ``obs_fun``, ``obs_dgdx``, ``obs_dgdp``, ``obs_dgdx0``, ``ode_rhs_fused``).
+    :rtype: dict
+    """
+    sym = _import_sympy()
+    t, x, parameters, arg_groups, f, g = _symbolic_expressions(sym, ode_fun, obs_fun, n_x, n_inputs, n_parameters, n_ode_args)
+
+    path = None
+    if cache_dir is not None:
+        key = repr((_GENERATOR_VERSION, sym.__version__, [sym.srepr(e) for e in f], None if g is None else [sym.srepr(e) for e in g], n_x, n_inputs, n_parameters, n_ode_args, bool(x0_as_parameter), bool(cse), bool(fused)))
+        path = os.path.join(os.fspath(cache_dir), "eDPM_symbolic_{}.py".format(hashlib.sha256(key.encode()).hexdigest()[:32]))
+
+    if path is not None and os.path.isfile(path):
+        with open(path) as fp:
+            source = fp.read()
+        names = [line[4:line.index("(")] for line in source.splitlines() if line.startswith("def ")]
+    else:
+        names, source = _generate_source(sym, f, g, x, parameters, arg_groups, x0_as_parameter, cse, fused)
+        if path is not None:
+            # Write to a temporary file first such that concurrent runs never read an incomplete file
+            os.makedirs(os.fspath(cache_dir), exist_ok=True)
+            tmp = "{}.{}.tmp".format(path, os.getpid())
+            with open(tmp, "w") as fp:
+                fp.write(source)
+            os.replace(tmp, path)
+    return {name: _GeneratedFunction(name, source, jit=jit and name == "ode_rhs_fused") for name in names}
+
+
+def _n_states(ode_x0) -> int:
+    if isinstance(ode_x0, (VariableDefinition, MultiVariableDefinition)):
+        return np.atleast_1d(ode_x0.lb).size
+    if isinstance(ode_x0, dict):
+        return np.atleast_1d(ode_x0["lb"]).size
+    x0 = np.asarray(ode_x0, dtype=float)
+    return 1 if x0.ndim == 0 else x0.shape[-1]
+
+
+def symbolic_fisher_model(ode_fun, obs_fun=None, x0_as_parameter=False, cse=True, cache_dir=None, fused=False, jit=False, **kwargs) -> FisherModel:
+    r"""Create a :py:class:`FisherModel` from a symbolic right-hand side. All derivatives are generated by :py:meth:`symbolic_functions`.
+
+    .. code-block:: python
+
+        import sympy
+
+        def f(t, x, inputs, parameters, ode_args):
+            (A,) = x
+            (T,) = inputs
+            (a, b) = parameters
+            return [a * T * A * sympy.exp(-b * t)]
+
+        fsm = symbolic_fisher_model(f, ode_t0=0.0, ode_x0=1.0, times={"lb": 0.0, "ub": 10.0, "n": 3}, inputs=[np.array([1.0, 2.0])], parameters=(0.5, 0.1))
+
+    The numbers of state variables, inputs, parameters and ode_args are determined from ``ode_x0``, ``inputs``, ``parameters`` and ``ode_args``.
+
+    :param ode_fun: The symbolic right-hand side of the ODEs.
+    :type ode_fun: callable
+    :param obs_fun: The symbolic observable or the index (list of indices) of the observed states. Defaults to None (all states are observed).
+    :type obs_fun: callable, int, list, optional
+    :param x0_as_parameter: Use the initial values as parameters (see :py:meth:`symbolic_functions`). Defaults to False.
+    :type x0_as_parameter: bool, optional
+    :param cse: Eliminate common subexpressions. Defaults to True.
+    :type cse: bool, optional
+    :param cache_dir: A directory in which the generated code is stored. Defaults to None (no cache).
+    :type cache_dir: str, optional
+    :param fused: Integrate the ODEs with a generated function calculating the state variables and all sensitivities at once (``ode_rhs_fused`` of the model). Defaults to False.
+    :type fused: bool, optional
+    :param jit: Compile the fused function with ``numba.njit``. Defaults to False.
+    :type jit: bool, optional
+    :param kwargs: All other arguments of the :py:class:`FisherModel`.
+
+    :raises ImportError: Raised if sympy (or numba with ``jit=True``) is not installed.
+    :return: The model with generated derivatives.
+    :rtype: FisherModel
+    """
+    ode_args = kwargs.get("ode_args")
+    functions = symbolic_functions(
+        ode_fun,
+        n_x=_n_states(kwargs["ode_x0"]),
+        n_inputs=len(kwargs["inputs"]),
+        n_parameters=len(kwargs["parameters"]),
+        n_ode_args=0 if ode_args is None else len(ode_args),
+        obs_fun=obs_fun if callable(obs_fun) else None,
+        x0_as_parameter=x0_as_parameter,
+        cse=cse,
+        cache_dir=cache_dir,
+        fused=fused,
+        jit=jit,
+    )
+    if obs_fun is not None and not callable(obs_fun):
+        functions["obs_fun"] = obs_fun
+    return FisherModel(**functions, **kwargs)
@@ -2,3 +2,7 @@ from .scipy_global_optim import *
 from .caller import *
 from .display import *
 from .penalty import *
+from .sequential import *
+from .parametrization import *
+from .checkpoint import *
+from .budget import *
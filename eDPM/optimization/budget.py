@@ -0,0 +1,191 @@
+import time
+import inspect
+import numpy as np
+
+from eDPM.solving.profiling import _ode_solve_count, _WorkerCall, _merge_profile
+
+
+# Reasons for the termination of a run which are reported by Budget.status
+BUDGET_STATUS = ["max_time", "max_evaluations", "max_solves", "stagnation"]
+
+
+class BudgetExhausted(Exception):
+    """Raised by the objective function or the callbacks of an optimization once a :py:class:`Budget` is exhausted.
+    The optimization strategies catch it and return the best design found so far.
+
+    :param status: The budget which terminated the run (one of :py:data:`BUDGET_STATUS`).
+    :type status: str
+    """
+    def __init__(self, status: str):
+        super().__init__("The budget {} of the optimization is exhausted.".format(status))
+        self.status = status
+
+
+class Budget:
+    """Limits of the computational effort of an optimization which are shared by all strategies of :py:meth:`find_optimal`.
+    The objective evaluations and integrations of the ODEs are counted, the best value of the objective is tracked
+    and every iteration (eg. a generation of the differential evolution) checks for stagnation.
+    All limits which are None are not enforced.
+
+    :param max_time: The maximum wall-clock time of the run in seconds.
+    :type max_time: float, optional
+    :param max_evaluations: The maximum number of evaluated designs.
+    :type max_evaluations: int, optional
+    :param max_solves: The maximum number of integrations of the ODEs (solutions served by a :py:class:`SolutionCache` are not counted).
+    :type max_solves: int, optional
+    :param stagnation_iterations: Stop if the best value did not improve by more than ``stagnation_tol`` within this number of iterations.
+    :type stagnation_iterations: int, optional
+    :param stagnation_tol: The relative improvement of the best value which is required within ``stagnation_iterations`` iterations. Defaults to 1e-3.
+    :type stagnation_tol: float, optional
+
+    :raises ValueError: Raised if a limit is not positive.
+    """
+    def __init__(self, max_time: float=None, max_evaluations: int=None, max_solves: int=None, stagnation_iterations: int=None, stagnation_tol: float=1e-3):
+        for name, value in [("max_time", max_time), ("max_evaluations", max_evaluations), ("max_solves", max_solves), ("stagnation_iterations", stagnation_iterations)]:
+            if value is not None and value <= 0:
+                raise ValueError("The {} of the Budget needs to be positive but was {}.".format(name, value))
+        if stagnation_tol < 0:
+            raise ValueError("The stagnation_tol of the Budget needs to be non-negative but was {}.".format(stagnation_tol))
+        self.max_time = max_time
+        self.max_evaluations = max_evaluations
+        self.max_solves = max_solves
+        self.stagnation_iterations = stagnation_iterations
+        self.stagnation_tol = stagnation_tol
+        self.start()
+
+    def start(self):
+        """Reset all counters and start the clock."""
+        self.start_time = time.perf_counter()
+        self.evaluations = 0
+        self.solves = 0
+        self.iterations = 0
+        self.best_fun = np.inf
+        self.best_x = None
+        self.history = []
+        self.status = None
+
+    @property
+    def elapsed(self) -> float:
+        """The wall-clock time in seconds since the start of the run."""
+        return time.perf_counter() - self.start_time
+
+    def record(self, x, fun, solves: int=0, evaluations: int=1):
+        """Count evaluations of the objective and remember the best design.
+
+        :param x: The evaluated vector of the optimizer.
+        :type x: np.ndarray
+        :param fun: The value of the objective which is minimized.
+        :type fun: float
+        :param solves: The number of integrations of the ODEs which were needed. Defaults to 0.
+        :type solves: int, optional
+        :param evaluations: The number of evaluated designs. Defaults to 1.
+        :type evaluations: int, optional
+        """
+        self.evaluations += evaluations
+        self.solves += solves
+        if fun < self.best_fun:
+            self.best_fun = fun
+            self.best_x = None if x is None else np.array(x, dtype=float)
+
+    def exhausted(self):
+        """Check the limits of the time, evaluations and solves.
+
+        :return: The exhausted budget (one of :py:data:`BUDGET_STATUS`) or None.
+        :rtype: str
+        """
+        if self.max_time is not None and self.elapsed >= self.max_time:
+            return "max_time"
+        if self.max_evaluations is not None and self.evaluations >= self.max_evaluations:
+            return "max_evaluations"
+        if self.max_solves is not None and self.solves >= self.max_solves:
+            return "max_solves"
+        return None
+
+    def check(self):
+        """Raise :py:class:`BudgetExhausted` if a limit is reached.
+
+        :raises BudgetExhausted: Raised if the time, evaluations or solves are exhausted.
+        """
+        status = self.exhausted()
+        if status is not None:
+            self.status = status
+            raise BudgetExhausted(status)
+
+    def iteration(self):
+        """Finish an iteration of the optimizer and check all limits including the stagnation of the best value.
+
+        :raises BudgetExhausted: Raised if a limit is reached or the optimization stagnates.
+        """
+        self.iterations += 1
+        self.history.append(self.best_fun)
+        n = self.stagnation_iterations
+        if n is not None and len(self.history) > n:
+            previous, current = self.history[-1-n], self.history[-1]
+            if np.isfinite(previous) and previous - current <= self.stagnation_tol * abs(previous):
+                self.status = "stagnation"
+                raise BudgetExhausted("stagnation")
+        self.check()
+
+
+def _objective_value(value):
+    # Objectives which also return the gradient are tuples
+    return value[0] if isinstance(value, tuple) else value
+
+
+class _BudgetedObjective:
+    # Objective function evaluated in the current process which checks the budget before every evaluation
+    def __init__(self, func, budget: Budget, vectorized=False):
+        self.func = func
+        self.budget = budget
+        self.vectorized = vectorized
+
+    def __call__(self, x, *args):
+        self.budget.check()
+        n0 = _ode_solve_count()
+        value = self.func(x, *args)
+        solves = _ode_solve_count() - n0
+        if self.vectorized:
+            fun = np.asarray(value, dtype=float)
+            i = np.argmin(fun)
+            self.budget.record(np.asarray(x)[:, i], fun[i], solves, evaluations=fun.size)
+        else:
+            self.budget.record(x, _objective_value(value), solves)
+        return value
+
+
+class _WorkerMap:
+    # Map-like callable distributing the candidates to workers. The evaluations, integrations of the ODEs and
+    # profiles of the workers are collected in the main process. The candidates are mapped in chunks such that
+    # the budget is also checked within large populations or grids.
+    def __init__(self, mapper, chunksize: int, budget: Budget=None):
+        self.mapper = mapper
+        self.chunksize = chunksize
+        self.budget = budget
+
+    def __call__(self, func, iterable):
+        xs = list(iterable)
+        call = _WorkerCall(func)
+        values = []
+        for i in range(0, len(xs), self.chunksize):
+            if self.budget is not None:
+                self.budget.check()
+            chunk = xs[i:i+self.chunksize]
+            for x, (value, solves, profile) in zip(chunk, self.mapper(call, chunk)):
+                _merge_profile(profile)
+                if self.budget is not None:
+                    self.budget.record(x, _objective_value(value), solves)
+                values.append(value)
+        return values
+
+
+def _budget_callback(budget: Budget, user_callback=None):
+    # Finish an iteration of the budget before calling the callback supplied by the user
+    if user_callback is not None and set(inspect.signature(user_callback).parameters) == {"intermediate_result"}:
+        def callback(intermediate_result):
+            budget.iteration()
+            return user_callback(intermediate_result=intermediate_result)
+    else:
+        def callback(*args, **kwargs):
+            budget.iteration()
+            return None if user_callback is None else user_callback(*args, **kwargs)
+    return callback
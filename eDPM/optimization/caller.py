@@ -1,16 +1,28 @@
+import os
+
 from eDPM.model import FisherModel, FisherModelParametrized
-from .scipy_global_optim import __scipy_differential_evolution, __scipy_basinhopping, __scipy_brute
+from .scipy_global_optim import __scipy_differential_evolution, __scipy_basinhopping, __scipy_brute, __scipy_minimize, __scipy_multistart
+from .sequential import __fedorov_exchange
 from .display import display_optimization_start, display_optimization_end
+from .budget import Budget
+from eDPM.solving.profiling import Profiler, profiling
 
 
 OPTIMIZATION_STRATEGIES = {
     "scipy_differential_evolution": __scipy_differential_evolution,
     "scipy_basinhopping": __scipy_basinhopping,
     "scipy_brute": __scipy_brute,
+    "scipy_minimize": __scipy_minimize,
+    "multistart": __scipy_multistart,
+    "fedorov_exchange": __fedorov_exchange,
 }
 
 
-def find_optimal(fsm: FisherModel, optimization_strategy: str="scipy_differential_evolution", discrete_penalizer="default", verbose=True, **kwargs):
+# Optimization strategies which can store their state in a Checkpoint and resume from it
+CHECKPOINT_STRATEGIES = ["scipy_differential_evolution"]
+
+
+def find_optimal(fsm: FisherModel, optimization_strategy: str="scipy_differential_evolution", discrete_penalizer="default", verbose=True, resume_from=None, budget: Budget=None, profile=None, **kwargs):
     r"""Find the global optimum of the supplied FisherModel.
 
     :param fsm: The FisherModel object that defines the studied system with its all constraints.
@@ -46,6 +58,23 @@ def find_optimal(fsm: FisherModel, optimization_strategy: str="scipy_differentia
             The global optimization method uses the `scipy.optimize.brute <https://docs.scipy.org/doc/scipy/reference/generated/scipy.optimize.brute.html>`__ function.
             It is a grid search algorithm calculating the objective function value at each point of a multidimensional grid in a chosen region.
             The technique is rather slow and inefficient but the global minimum can be guaranteed.
+        - "scipy_minimize"
+            The local optimization method uses the `scipy.optimize.minimize <https://docs.scipy.org/doc/scipy/reference/generated/scipy.optimize.minimize.html>`__ function with the "L-BFGS-B" method starting from the initial guess of the sampled variables.
+            The gradient of the criterion with respect to the times is calculated analytically from the right-hand side of the ODEs (see :py:meth:`calculate_fisher_criterion_gradient`)
+            while all other sampled variables are differentiated numerically. The discretization penalty is treated as a constant.
+            With ``method="trust-constr"`` the minimal distances between the sampled values are enforced as linear constraints.
+            The analytic gradient is also used by the local minimizer of "scipy_basinhopping" and the polishing step of "scipy_differential_evolution".
+        - "multistart"
+            Run ``n_starts`` (default 10) local optimizations with `scipy.optimize.minimize <https://docs.scipy.org/doc/scipy/reference/generated/scipy.optimize.minimize.html>`__ using the "SLSQP" method and the gradient of "scipy_minimize".
+            The first start is the initial guess and the others are drawn by latin hypercube sampling within the bounds (reproducible with ``seed``).
+            The ordering and minimal distances of the sampled values are enforced as linear constraints.
+            The local optimizations run in a process pool with ``workers`` processes (-1 for all cores, 1 to run serially or a ``concurrent.futures.Executor``).
+            Converged designs which differ by less than ``unique_tol`` relative to the bounds are merged.
+            The best result is returned and all distinct local optima are stored in its attribute ``ensemble`` sorted from best to worst.
+        - "fedorov_exchange"
+            Choose the times from a grid of candidates given by the discretization of the times (or ``n_candidates`` uniformly spaced points if no discretization was specified).
+            The ODEs are solved only once for all candidates. The design is built greedily and improved by exchanging single time points (see :py:class:`SequentialDesign`).
+            Only the times may be sampled and the criterion needs to be one of :py:data:`SEQUENTIAL_CRITERIA`.
     
     :type optimization_strategy: str
     :param discrete_penalizer: A function that takes two 1d arrays (values, discretization) and returns a float. It calculates the penalty (1=no penalty, 0=maximum penalty) for datapoints which do not sit on the desired discretization points.
@@ -64,8 +93,33 @@ def find_optimal(fsm: FisherModel, optimization_strategy: str="scipy_differentia
         - "individual_gauss"
             Uses the discretization penalty function described by the function :py:meth:`discrete_penalty_individual_template` with the penalty structure *pen_structure=penalty_structure_gauss*.
     :type discrete_penalizer: str
+    :param resume_from: The file of a checkpoint from which the optimization is continued (see :py:class:`Checkpoint`).
+        Checkpoints are written when the argument ``checkpoint`` (a filename or a :py:class:`Checkpoint`) is supplied.
+        They store the population and its energies, the best design and the state of the random number generator.
+        The model is not evaluated to write a checkpoint. The :py:class:`FisherResults` of the stored best design are calculated by :py:meth:`checkpoint_results`.
+        The resumed run starts from the stored population without evaluating it again and only runs the remaining generations of ``maxiter``.
+        Since scipy keeps some internal random state which can not be stored, the resumed run is not identical to an uninterrupted one.
+        Only "scipy_differential_evolution" supports checkpoints (see :py:data:`CHECKPOINT_STRATEGIES`).
+    :type resume_from: str, optional
+    :param budget: Limits of the computational effort which are enforced by all strategies (see :py:class:`Budget`).
+        Instead of a :py:class:`Budget` the limits can be given as the arguments ``max_time`` (seconds of wall-clock time), ``max_evaluations`` (evaluated designs),
+        ``max_solves`` (integrations of the ODEs), ``stagnation_iterations`` and ``stagnation_tol`` (stop if the best criterion did not improve by more than the relative tolerance within this number of iterations).
+        An iteration is a generation of "scipy_differential_evolution", a hop of "scipy_basinhopping", an iteration of "scipy_minimize", a finished local optimization of "multistart" and an exchange of "fedorov_exchange" ("scipy_brute" has no iterations).
+        When a limit is reached the best design found so far is returned and the attribute ``termination`` of the result names the exhausted limit (None if the strategy finished on its own).
+        Evaluations by worker processes are counted when they are returned to the main process. Thus the local optimizations of "multistart" which are already running in other processes are finished.
+    :type budget: Budget, optional
+    :param profile: Measure the time spent in the stages of the evaluations (validation, integration of the ODEs, criterion, ...) and count the evaluations of the right-hand side (see :py:class:`Profiler`).
+        Either True, a :py:class:`Profiler` which collects the measurements or a filename in which the measurements are stored in json format.
+        The measurements of the worker processes are included. The profiler is stored in the attribute ``profile`` of the result and its summary is displayed if ``verbose`` is enabled.
+        Defaults to None (no profiling).
+    :type profile: bool, Profiler or str, optional
+    :param kwargs: Additional arguments are passed to the chosen scipy routine if it accepts them and to :py:meth:`calculate_fisher_criterion` otherwise (eg. ``criterion``, ``solver_mode`` or ``solver_options``).
+        During the global search the ODEs are solved with the coarse options given by :py:meth:`SolverOptions.coarse` and the final result is calculated with the supplied ``solver_options``.
+        The strategies "scipy_differential_evolution", "scipy_basinhopping" and "scipy_brute" accept ``parametrization="increments"`` to search over the increments between the sorted sampled values (see :py:class:`OrderedParametrization`).
+        Every point of the search space is then an ordered design which respects the minimal distances and the permutations of the same design are no longer searched separately.
 
     :raises KeyError: Raised if the chosen optimization strategy is not implemented.
+    :raises ValueError: Raised if a checkpoint is used with a strategy which does not support it or does not match the optimization problem.
     :return: The result of the optimization as an object *FisherResults*. Important attributes are the conditions of the Optimal Experimental Design *times*, *inputs*, the resultion value of the objective function *criterion*.
     :rtype: FisherResults
     """
@@ -78,7 +132,29 @@ def find_optimal(fsm: FisherModel, optimization_strategy: str="scipy_differentia
         # TODO test this statement
         raise KeyError("Please specify one of the following optimization_strategies for optimization: " + str(OPTIMIZATION_STRATEGIES.keys()))
 
-    fsr = OPTIMIZATION_STRATEGIES[optimization_strategy](fsmp, discrete_penalizer, **kwargs)
+    if (resume_from is not None or kwargs.get("checkpoint") is not None) and optimization_strategy not in CHECKPOINT_STRATEGIES:
+        raise ValueError("Checkpoints are only supported by the optimization strategies {}.".format(CHECKPOINT_STRATEGIES))
+    if resume_from is not None:
+        kwargs["resume_from"] = resume_from
+
+    # Collect the limits of the computational effort
+    limits = {key: kwargs.pop(key) for key in ["max_time", "max_evaluations", "max_solves", "stagnation_iterations", "stagnation_tol"] if key in kwargs}
+    if budget is None and len(limits) > 0:
+        budget = Budget(**limits)
+    elif len(limits) > 0:
+        raise ValueError("Please specify the limits {} either in the Budget or as arguments.".format(list(limits.keys())))
+    if budget is not None:
+        kwargs["budget"] = budget
+
+    if profile is None or profile is False:
+        fsr = OPTIMIZATION_STRATEGIES[optimization_strategy](fsmp, discrete_penalizer, **kwargs)
+    else:
+        profiler = profile if isinstance(profile, Profiler) else Profiler()
+        with profiling(profiler):
+            fsr = OPTIMIZATION_STRATEGIES[optimization_strategy](fsmp, discrete_penalizer, **kwargs)
+        fsr.profile = profiler
+        if isinstance(profile, (str, os.PathLike)):
+            profiler.to_json(profile)
 
     if verbose==True:
         display_optimization_end(fsr)
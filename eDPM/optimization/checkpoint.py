@@ -0,0 +1,135 @@
+import os
+import pickle
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Checkpoint:
+    """Periodically store the state of a running optimization in a local file such that it can be resumed after a crash.
+    The state is written by a background thread. While a write is in progress, newer states replace the pending one
+    and only the most recent state is written afterwards. Thus the optimization never waits for the file system.
+    Every file is first written to a temporary file and then moved into place, so an interrupted write never
+    destroys the previous checkpoint.
+
+    :param path: The file in which the state is stored.
+    :type path: str
+    :param interval: Store the state every ``interval`` generations. Defaults to 1.
+    :type interval: int, optional
+
+    :raises ValueError: Raised if the interval is smaller than 1.
+    """
+    def __init__(self, path, interval: int=1):
+        if interval < 1:
+            raise ValueError("The interval of the Checkpoint needs to be at least 1 but was {}.".format(interval))
+        self.path = os.fspath(path)
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pending = None
+        self._executor = None
+        self._futures = []
+
+    def save(self, state: dict):
+        """Schedule writing the state and return immediately.
+
+        :param state: The state of the optimization. Values which are callable are evaluated by the writing thread
+            before the state is stored. They must not evaluate the model since this would be counted as part of the running optimization.
+        :type state: dict
+        """
+        with self._lock:
+            busy = self._pending is not None
+            self._pending = state
+            if not busy:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=1)
+                self._futures = [f for f in self._futures if not f.done() or f.exception() is not None]
+                self._futures.append(self._executor.submit(self._write_pending))
+
+    def flush(self):
+        """Wait until all scheduled states are written and raise errors which occured while writing."""
+        with self._lock:
+            futures = list(self._futures)
+            self._futures = []
+        for future in futures:
+            future.result()
+
+    def close(self):
+        """Write all scheduled states and stop the background thread."""
+        try:
+            self.flush()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def _write_pending(self):
+        while True:
+            with self._lock:
+                state = self._pending
+            try:
+                self._write(state)
+            finally:
+                with self._lock:
+                    if self._pending is state:
+                        self._pending = None
+                        done = True
+                    else:
+                        done = False
+            if done:
+                return
+
+    def _write(self, state: dict):
+        state = {key: value() if callable(value) else value for key, value in state.items()}
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as fp:
+            pickle.dump(state, fp)
+        os.replace(tmp, self.path)
+
+
+def load_checkpoint(path) -> dict:
+    """Read the state of an optimization which was stored by a :py:class:`Checkpoint`.
+
+    :param path: The file of the checkpoint.
+    :type path: str
+    :return: The state with the entries ``strategy``, ``nit`` (number of completed generations), ``x`` and ``fun``
+        (best vector and objective value), ``design`` (the best vector as values of the sampled variables),
+        ``population`` and ``population_energies`` (None if not available) and ``rng_state`` (state of the bit generator or None).
+        The :py:class:`FisherResults` of the best design are calculated by :py:meth:`checkpoint_results`.
+    :rtype: dict
+    """
+    with open(path, "rb") as fp:
+        return pickle.load(fp)
+
+
+class _ResumedObjective:
+    # Return the stored energies of the resumed population instead of evaluating it again.
+    # Every stored energy is used at most once and all other vectors are passed to the objective.
+    # The optimizer scales the initial population to the unit cube and back. Thus the vectors
+    # are not bit-identical to the stored ones and are matched up to a relative tolerance.
+    def __init__(self, func, population, energies, vectorized=False, rtol: float=1e-9):
+        self.func = func
+        self.vectorized = vectorized
+        self.population = np.asarray(population, dtype=float).reshape((len(energies), -1))
+        self.energies = np.asarray(energies, dtype=float)
+        self.unused = np.ones(len(self.energies), dtype=bool)
+        self.tol = rtol * np.max(np.abs(self.population), axis=0, initial=0.0)
+
+    def _pop(self, x):
+        match = np.flatnonzero(self.unused & np.all(np.abs(self.population - x) <= self.tol, axis=1))
+        if match.size == 0:
+            return None
+        self.unused[match[0]] = False
+        return self.energies[match[0]]
+
+    def __call__(self, x, *args):
+        x = np.asarray(x, dtype=float)
+        if not self.vectorized:
+            e = self._pop(x)
+            return self.func(x, *args) if e is None else e
+        # The columns of the vectorized input are the candidates
+        known = [self._pop(c) for c in x.T]
+        missing = [i for i, e in enumerate(known) if e is None]
+        res = np.array([np.nan if e is None else e for e in known], dtype=float)
+        if len(missing) > 0:
+            res[missing] = self.func(x[:, missing], *args)
+        return res
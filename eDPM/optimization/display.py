@@ -21,3 +21,6 @@ def display_optimization_end(fsr: FisherResults):
     print()
     pp = pprint.PrettyPrinter(indent=2, width=terminal_size[0])
     display_fsr_details(fsr, pp)
+    if fsr.profile is not None:
+        display_heading("PROFILE")
+        print(fsr.profile.summary())
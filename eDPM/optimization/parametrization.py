@@ -0,0 +1,93 @@
+import numpy as np
+
+
+# Available parametrizations of the design vector used by the optimization strategies
+PARAMETRIZATIONS = [None, "increments"]
+
+
+class OrderedParametrization:
+    r"""Map an unconstrained box onto designs whose ordered variables respect their minimal distances.
+
+    The optimization routines decode a design vector into times and inputs which are sorted before the evaluation.
+    Thus every design is represented by all permutations of its values and most of the search volume is spent on symmetric copies.
+    This parametrization describes every block of :math:`n` ordered values :math:`x_1 \le \dots \le x_n` in :math:`[lb, ub]`
+    with minimal distance :math:`d` by the increments between consecutive values.
+    The increments are obtained from coordinates :math:`u_i \in [0, 1]` by
+
+    .. math::
+
+        y_i = y_{i-1} + (R - y_{i-1}) \left(1 - (1 - u_i)^{\frac{1}{n-i+1}}\right), \qquad x_i = lb + (i-1) d + y_i,
+
+    with :math:`y_0 = 0` and the remaining room :math:`R = ub - lb - (n-1) d`.
+    Every point of the box is mapped to a valid design and uniformly distributed coordinates result in uniformly distributed ordered designs.
+    Compared to the original box the search space is smaller by the factor :math:`n!` for every block.
+    All other variables are passed through unchanged.
+
+    :param bounds: The lower and upper bounds of all variables of the design vector.
+    :type bounds: list
+    :param blocks: The ordered blocks given as tuples of the indices in the design vector, the lower and upper bound and the minimal distance (or None).
+    :type blocks: list
+
+    :raises ValueError: Raised if the values of a block do not fit into their bounds with the minimal distance.
+    """
+    def __init__(self, bounds, blocks):
+        self.blocks = []
+        self.bounds = list(bounds)
+        for indices, lb, ub, min_distance in blocks:
+            indices = np.asarray(indices, dtype=int)
+            d = 0.0 if min_distance is None else float(min_distance)
+            room = ub - lb - d * (indices.size - 1)
+            if room < 0.0:
+                raise ValueError("{} values with a minimal distance of {} do not fit into the interval [{}, {}].".format(indices.size, d, lb, ub))
+            self.blocks.append((indices, lb, d, room))
+            for i in indices:
+                self.bounds[i] = (0.0, 1.0)
+
+    def to_design(self, U):
+        """Calculate the design vector from the coordinates of the box.
+
+        :param U: The coordinates with shape ``(n_variables,)`` or ``(n_variables, n_candidates)`` for many candidates at once.
+        :type U: np.ndarray
+
+        :return: The design vector(s) with the same shape.
+        :rtype: np.ndarray
+        """
+        U = np.asarray(U, dtype=float)
+        X = U.copy()
+        for indices, lb, d, room in self.blocks:
+            n = indices.size
+            y = np.zeros(U.shape[1:])
+            for i, j in enumerate(indices):
+                y = y + (room - y) * (1.0 - (1.0 - np.clip(U[j], 0.0, 1.0))**(1.0 / (n - i)))
+                X[j] = lb + i*d + y
+        return X
+
+    def from_design(self, X):
+        """Calculate the coordinates of the box which represent a design vector.
+        The values of every block are sorted and moved apart if they violate the minimal distance.
+
+        :param X: The design vector with shape ``(n_variables,)`` or ``(n_variables, n_candidates)``.
+        :type X: np.ndarray
+
+        :return: The coordinates with the same shape.
+        :rtype: np.ndarray
+        """
+        X = np.asarray(X, dtype=float)
+        U = X.copy()
+        for indices, lb, d, room in self.blocks:
+            n = indices.size
+            values = np.sort(X[indices], axis=0)
+            y_prev = np.zeros(X.shape[1:])
+            for i, j in enumerate(indices):
+                y = np.clip(values[i] - lb - i*d, y_prev, room)
+                rest = room - y_prev
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    fraction = np.where(rest > 0.0, (y - y_prev) / rest, 0.0)
+                U[j] = 1.0 - (1.0 - fraction)**(n - i)
+                y_prev = y
+        return U
+
+
+def _reparametrized_objective(U, parametrization: OrderedParametrization, func, *args):
+    # Evaluate an objective of the design vector at the coordinates of the box
+    return func(parametrization.to_design(U), *args)
@@ -2,10 +2,21 @@ import numpy as np
 import scipy as sp
 import scipy.optimize as optimize
 import itertools
-
-from eDPM.model import FisherModel, FisherModelParametrized, VariableDefinition, MultiVariableDefinition
-from eDPM.solving import calculate_fisher_criterion, fisher_determinant
+import inspect
+import functools
+import os
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, as_completed
+from scipy.optimize import OptimizeResult
+
+from eDPM.model import FisherModel, FisherModelParametrized, FisherResults, VariableDefinition, MultiVariableDefinition
+from eDPM.solving import calculate_fisher_criterion, calculate_fisher_criterion_population, calculate_fisher_criterion_batch, calculate_fisher_criterion_gradient, get_S_matrix, fisher_determinant, fisher_logdeterminant, get_solver_options, SolutionCache
+from eDPM.solving.criteria import _CRITERION_GRADIENTS
+from eDPM.solving.profiling import get_profiler, _stage, _count, _WorkerCall, _merge_profile
 from .penalty import _discrete_penalizer
+from .parametrization import OrderedParametrization, PARAMETRIZATIONS, _reparametrized_objective
+from .checkpoint import Checkpoint, load_checkpoint, _ResumedObjective
+from .budget import Budget, BudgetExhausted, _BudgetedObjective, _WorkerMap, _budget_callback
 
 
 def _create_comparison_matrix(n, value=1.0):
@@ -34,12 +45,15 @@ def _create_comparison_matrix(n, value=1.0):
     return A
 
 
-def __scipy_optimizer_function(X, fsmp: FisherModelParametrized, full=False, discrete_penalizer="default", kwargs_dict={}):
+def __evaluation_context(X, fsmp: FisherModelParametrized) -> FisherModelParametrized:
+    # Decode the design vector into a copy of the model.
+    # The shared model is never modified such that the objective can be evaluated concurrently (eg. by threads).
     total = 0
+    values = {}
     # Get values for ode_t0
     if fsmp.ode_t0_def is not None:
         # TODO test these statements
-        fsmp.ode_t0 = X[:fsmp.ode_t0_def.n]
+        values["ode_t0"] = X[:fsmp.ode_t0_def.n]
         total += fsmp.ode_t0_def.n
     
     # Get values for ode_x0
@@ -47,26 +61,51 @@ def __scipy_optimizer_function(X, fsmp: FisherModelParametrized, full=False, dis
         # TODO test these statements
         n_x = len(fsmp.ode_x0[0])
         temp = X[total:total + fsmp.ode_x0_def.n * n_x].reshape(fsmp.ode_x0_def.n, n_x)
-        fsmp.ode_x0 = [t for t in temp]
+        values["ode_x0"] = [t for t in temp]
         total += fsmp.ode_x0_def.n * n_x
 
     # Get values for times
     if fsmp.times_def is not None:
-        fsmp.times = np.sort(X[total:total+fsmp.times.size].reshape(fsmp.times.shape), axis=-1)
+        values["times"] = np.sort(X[total:total+fsmp.times.size].reshape(fsmp.times.shape), axis=-1)
         total += fsmp.times.size
 
     # Get values for inputs
+    inputs = [None] * len(fsmp.inputs_def)
     for i, inp_def in enumerate(fsmp.inputs_def):
         if inp_def is not None:
             # TODO test these statements
-            fsmp.inputs[i]=X[total:total+inp_def.n]
+            inputs[i] = X[total:total+inp_def.n]
             total += inp_def.n
+    values["inputs"] = inputs
+
+    return fsmp.with_values(**values)
+
+
+def _penalized_objective(criterion, crit, penalty):
+    # The penalty is a factor between 0 and 1 which multiplies the criterion.
+    # Logarithmic criteria can be negative such that the logarithm of the penalty is added instead.
+    if criterion is fisher_logdeterminant:
+        with np.errstate(divide="ignore"):
+            return -(crit + np.log(penalty))
+    return -crit * penalty
+
+
+def __scipy_optimizer_function(X, fsmp: FisherModelParametrized, full=False, discrete_penalizer="default", kwargs_dict={}):
+    with _stage("objective"):
+        return __scipy_optimizer_function_stages(X, fsmp, full, discrete_penalizer, kwargs_dict)
+
+
+def __scipy_optimizer_function_stages(X, fsmp: FisherModelParametrized, full=False, discrete_penalizer="default", kwargs_dict={}):
+    _count("evaluations")
+    with _stage("validation"):
+        fsmp = __evaluation_context(X, fsmp)
 
     # Calculate the correct criterion
     fsr = calculate_fisher_criterion(fsmp, **kwargs_dict)
 
     # Calculate the discretization penalty
-    penalty, penalty_summary = _discrete_penalizer(fsmp, discrete_penalizer)
+    with _stage("penalty"):
+        penalty, penalty_summary = _discrete_penalizer(fsmp, discrete_penalizer)
     
     # Include information about the penalty
     fsr.penalty_discrete_summary = penalty_summary
@@ -74,7 +113,113 @@ def __scipy_optimizer_function(X, fsmp: FisherModelParametrized, full=False, dis
     # Return full result if desired
     if full:
         return fsr
-    return -fsr.criterion * penalty
+    return _penalized_objective(fsr.criterion_fun, fsr.criterion, penalty)
+
+
+def __scipy_optimizer_function_population(X, fsmp: FisherModelParametrized, full=False, discrete_penalizer="default", kwargs_dict={}):
+    # Evaluate the whole population of differential_evolution (vectorized=True) at once.
+    # X has shape (n_variables, n_candidates).
+    with _stage("objective"):
+        return __scipy_optimizer_function_population_stages(X, fsmp, full, discrete_penalizer, kwargs_dict)
+
+
+def __scipy_optimizer_function_population_stages(X, fsmp: FisherModelParametrized, full=False, discrete_penalizer="default", kwargs_dict={}):
+    _count("evaluations", X.shape[1])
+    penalties = np.ones(X.shape[1])
+    if _only_times_sampled(fsmp):
+        # All candidates are obtained from the same dense solutions of the ODEs
+        times_population = np.sort(X.T.reshape((-1,) + fsmp.times.shape), axis=-1)
+
+        # Arguments which only determine how the individual ODEs are solved are not needed here
+        keys = inspect.signature(calculate_fisher_criterion_population).parameters.keys()
+        crits = calculate_fisher_criterion_population(fsmp, times_population, **{key: value for key, value in kwargs_dict.items() if key in keys})
+
+        for i, times in enumerate(times_population):
+            with _stage("validation"):
+                fsmp_i = fsmp.with_values(times=times)
+            with _stage("penalty"):
+                penalties[i], _ = _discrete_penalizer(fsmp_i, discrete_penalizer)
+    else:
+        # Solve the candidates one after the other but share the solutions of identical conditions
+        # via the cache and evaluate the criterion for all stacked sensitivity matrices at once.
+        keys = inspect.signature(get_S_matrix).parameters.keys()
+        S_kwargs = {key: value for key, value in kwargs_dict.items() if key in keys}
+        if S_kwargs.get("solution_cache") is None:
+            S_kwargs["solution_cache"] = SolutionCache()
+
+        S_pop = []
+        C_pop = []
+        for i, x in enumerate(X.T):
+            with _stage("validation"):
+                fsmp_x = __evaluation_context(x, fsmp)
+            with _stage("sensitivities"):
+                S, C, _ = get_S_matrix(fsmp_x, **S_kwargs)
+            S_pop.append(S)
+            C_pop.append(C)
+            with _stage("penalty"):
+                penalties[i], _ = _discrete_penalizer(fsmp_x, discrete_penalizer)
+        with _stage("criterion"):
+            crits = calculate_fisher_criterion_batch(fsmp, np.array(S_pop), C_pop, kwargs_dict.get("criterion", fisher_determinant))
+    return _penalized_objective(kwargs_dict.get("criterion", fisher_determinant), crits, penalties)
+
+
+def _times_slice(fsmp: FisherModelParametrized) -> slice:
+    # Position of the times in the design vector as decoded by __evaluation_context
+    start = 0
+    if fsmp.ode_t0_def is not None:
+        start += fsmp.ode_t0_def.n
+    if fsmp.ode_x0_def is not None:
+        start += fsmp.ode_x0_def.n * len(fsmp.ode_x0[0])
+    return slice(start, start + (fsmp.times.size if fsmp.times_def is not None else 0))
+
+
+def _gradient_available(kwargs_dict) -> bool:
+    return kwargs_dict.get("criterion", fisher_determinant) in _CRITERION_GRADIENTS
+
+
+def __scipy_optimizer_function_and_gradient(X, fsmp: FisherModelParametrized, full=False, discrete_penalizer="default", kwargs_dict={}):
+    # Objective together with its gradient as needed for jac=True in scipy.optimize.minimize.
+    # The derivatives with respect to the times are calculated analytically.
+    # All other sampled variables are differentiated by forward differences.
+    with _stage("objective"):
+        return __scipy_optimizer_function_and_gradient_stages(X, fsmp, full, discrete_penalizer, kwargs_dict)
+
+
+def __scipy_optimizer_function_and_gradient_stages(X, fsmp: FisherModelParametrized, full=False, discrete_penalizer="default", kwargs_dict={}):
+    _count("evaluations")
+    with _stage("validation"):
+        fsmp_x = __evaluation_context(X, fsmp)
+    criterion = kwargs_dict.get("criterion", fisher_determinant)
+    keys = inspect.signature(calculate_fisher_criterion_gradient).parameters.keys()
+    crit, grad_times = calculate_fisher_criterion_gradient(fsmp_x, **{key: value for key, value in kwargs_dict.items() if key in keys})
+
+    # The penalty is treated as a constant factor
+    with _stage("penalty"):
+        penalty, _ = _discrete_penalizer(fsmp_x, discrete_penalizer)
+    fun = _penalized_objective(criterion, crit, penalty)
+    scale = -1.0 if criterion is fisher_logdeterminant else -penalty
+
+    # The times were sorted when decoding the design vector
+    grad = np.zeros(X.size)
+    ts = _times_slice(fsmp)
+    if ts.stop > ts.start:
+        order = np.argsort(X[ts].reshape(fsmp.times.shape), axis=-1, kind="stable")
+        grad_sorted = np.empty(fsmp.times.shape)
+        np.put_along_axis(grad_sorted, order, grad_times, axis=-1)
+        grad[ts] = scale * grad_sorted.ravel()
+
+    # The step is chosen according to the accuracy of the integrator
+    rtol = get_solver_options(kwargs_dict.get("solver_options")).rtol
+    for i in itertools.chain(range(ts.start), range(ts.stop, X.size)):
+        h = np.sqrt(max(rtol, np.finfo(float).eps)) * max(1.0, abs(X[i]))
+        X_h = np.array(X, dtype=float)
+        X_h[i] += h
+        grad[i] = (__scipy_optimizer_function_stages(X_h, fsmp, False, discrete_penalizer, kwargs_dict) - fun) / h
+    return fun, grad
+
+
+def _only_times_sampled(fsmp: FisherModelParametrized):
+    return fsmp.times_def is not None and fsmp.ode_t0_def is None and fsmp.ode_x0_def is None and all(inp_def is None for inp_def in fsmp.inputs_def)
 
 
 def _scipy_calculate_bounds_constraints(fsmp: FisherModelParametrized):
@@ -133,17 +278,20 @@ def _scipy_calculate_bounds_constraints(fsmp: FisherModelParametrized):
     if type(fsmp.times_def)==VariableDefinition:
         # How many time points are we sampling?
         n_times = np.prod(fsmp.times.shape)
+        # Only the times of the same experimental condition (last axis) are compared with each other
+        n_rows = n_times // fsmp.times.shape[-1]
+        n_cols = fsmp.times.shape[-1]
 
         # Store lower and upper bound
         lb += [fsmp.times_def.lb] * n_times
         ub += [fsmp.times_def.ub] * n_times
 
         # Constraints on variables
-        lc += [-np.inf] * (n_times-1)
-        uc += [-fsmp.times_def.min_distance if fsmp.times_def.min_distance is not None else 0.0] * (n_times-1)
+        lc += [-np.inf] * (n_rows * (n_cols-1))
+        uc += [-fsmp.times_def.min_distance if fsmp.times_def.min_distance is not None else 0.0] * (n_rows * (n_cols-1))
 
         # Extend matrix B
-        A = _create_comparison_matrix(n_times)
+        A = np.kron(np.eye(n_rows), _create_comparison_matrix(n_cols))
         B = np.block([[B,np.zeros((B.shape[0],A.shape[1]))],[np.zeros((A.shape[0],B.shape[1])),A]])
     
     # Check which inputs are sampled
@@ -181,7 +329,8 @@ def __initial_guess(fsmp: FisherModelParametrized):
 
 def __update_arguments(optim_func, optim_args, kwargs):
     # Gather all arguments which can be supplied to the optimization function and check for intersections
-    o_keys = set(optim_func.__code__.co_varnames)
+    # We use the signature instead of the code object since newer versions of scipy wrap these functions
+    o_keys = set(inspect.signature(optim_func).parameters.keys())
 
     # Take all keys which are ment to go into the routine and put it in the corresponding dictionary
     intersect = {key: kwargs.pop(key) for key in o_keys & kwargs.keys()}
@@ -192,7 +341,106 @@ def __update_arguments(optim_func, optim_args, kwargs):
     return optim_args, kwargs
 
 
-def __scipy_differential_evolution(fsmp: FisherModelParametrized, discrete_penalizer="default", **kwargs):
+def __solver_schedule(fsmp: FisherModelParametrized, kwargs):
+    # If only the times are optimized, every condition needs to be solved only once.
+    # All further candidates are obtained by interpolating the cached dense solutions.
+    if _only_times_sampled(fsmp) and "solution_cache" not in kwargs:
+        kwargs["solution_cache"] = SolutionCache()
+
+    # The global search only needs to rank the candidates. It is done with loosened tolerances
+    # of the integrator while the final result is calculated with the original tolerances.
+    solver_options = get_solver_options(kwargs.get("solver_options"))
+    kwargs_coarse = {**kwargs, "solver_options": solver_options.coarse()}
+    kwargs_fine = {**kwargs, "solver_options": solver_options}
+    return kwargs_coarse, kwargs_fine
+
+
+def _design_parametrization(fsmp: FisherModelParametrized, bounds, parametrization=None):
+    # Create the mapping between the coordinates seen by the optimizer and the design vector (None for the identity)
+    if parametrization is None:
+        return None
+    elif parametrization == "increments":
+        blocks = [(indices, var_def.lb, var_def.ub, var_def.min_distance) for indices, var_def in _ordered_blocks(fsmp)]
+        return OrderedParametrization(bounds, blocks)
+    raise ValueError("Unknown parametrization {}. Please specify one of {}.".format(parametrization, PARAMETRIZATIONS))
+
+
+def _worker_map(workers, budget: Budget=None):
+    # Distribute the candidates to the workers with a map-like callable which collects the budget and profile in the main process
+    n_workers = os.cpu_count() if workers == -1 or callable(workers) else workers
+    if callable(workers):
+        return _WorkerMap(workers, 4 * n_workers, budget), None
+    pool = multiprocessing.Pool(n_workers)
+    return _WorkerMap(pool.map, 4 * n_workers, budget), pool
+
+
+def _budget_design(budget: Budget, to_design, default):
+    # The best design which was evaluated before the budget was exhausted
+    return default if budget.best_x is None else to_design(budget.best_x)
+
+
+def checkpoint_results(path, fsm: FisherModel, discrete_penalizer="default", **kwargs) -> FisherResults:
+    """Calculate the results of the best design stored in a checkpoint of :py:meth:`find_optimal` (see :py:class:`Checkpoint`).
+
+    The checkpoint only stores the vectors and objective values of the optimization. Thus the ODEs are solved again for the best design.
+
+    :param path: The file of the checkpoint.
+    :type path: str
+    :param fsm: The model which was optimized.
+    :type fsm: FisherModel
+    :param discrete_penalizer: The penalty of discrete variables which was used by the optimization. Defaults to "default".
+    :type discrete_penalizer: str, optional
+    :param kwargs: Additional arguments of :py:meth:`calculate_fisher_criterion` (eg. ``criterion`` or ``solver_options``).
+    :return: The results of the best design of the checkpoint.
+    :rtype: FisherResults
+    """
+    state = load_checkpoint(path)
+    fsmp = FisherModelParametrized.init_from(fsm)
+    return __scipy_optimizer_function(np.asarray(state["design"], dtype=float), fsmp, full=True, discrete_penalizer=discrete_penalizer, kwargs_dict=kwargs)
+
+
+def _callback_receives_result() -> bool:
+    # Since scipy 1.12 the callback of differential_evolution can receive the intermediate result including the population
+    return np.lib.NumpyVersion(sp.__version__) >= "1.12.0"
+
+
+def _differential_evolution_checkpointing(opt_args, checkpoint: Checkpoint, rng, nit_offset, parametrization, to_design):
+    # Store the state of the optimization after every interval of generations and call the callback supplied by the user
+    user_callback = opt_args.get("callback")
+    nit = [nit_offset]
+
+    def save(x, fun, population, energies):
+        nit[0] += 1
+        if nit[0] % checkpoint.interval == 0:
+            checkpoint.save({
+                "strategy": "scipy_differential_evolution",
+                "parametrization": parametrization,
+                "nit": nit[0],
+                "x": np.array(x),
+                "fun": fun,
+                "population": None if population is None else np.array(population),
+                "population_energies": None if energies is None else np.array(energies),
+                "rng_state": rng.bit_generator.state if isinstance(rng, np.random.Generator) else None,
+                "design": to_design(np.array(x)),
+            })
+
+    if _callback_receives_result():
+        def callback(intermediate_result):
+            save(intermediate_result.x, intermediate_result.fun, intermediate_result.population, intermediate_result.population_energies)
+            if user_callback is None:
+                return None
+            if set(inspect.signature(user_callback).parameters) == {"intermediate_result"}:
+                return user_callback(intermediate_result=intermediate_result)
+            return user_callback(intermediate_result.x, convergence=intermediate_result.convergence)
+    else:
+        def callback(xk, convergence=None):
+            save(xk, None, None, None)
+            if user_callback is not None:
+                return user_callback(xk, convergence=convergence)
+    opt_args["callback"] = callback
+
+
+def __scipy_differential_evolution(fsmp: FisherModelParametrized, discrete_penalizer="default", parametrization=None, checkpoint=None, resume_from=None, budget: Budget=None, **kwargs):
     # Create bounds, constraints and initial guess
     bounds, constraints = _scipy_calculate_bounds_constraints(fsmp)
     x0 = __initial_guess(fsmp)
@@ -209,17 +457,132 @@ def __scipy_differential_evolution(fsmp: FisherModelParametrized, discrete_penal
         "x0": x0
     }
 
+    # If only the times are optimized, the whole population is evaluated at once
+    # by interpolating the dense solutions of the ODEs (needs scipy>=1.9).
+    if _only_times_sampled(fsmp) and "vectorized" in inspect.signature(optimize.differential_evolution).parameters:
+        opt_args["vectorized"] = True
+    workers_supplied = "workers" in kwargs
+
     # Check for intersecting arguments and update the default arguments in opt_args with arguments from kwargs.
     opt_args, kwargs = __update_arguments(optimize.differential_evolution, opt_args, kwargs)
+    kwargs_coarse, kwargs = __solver_schedule(fsmp, kwargs)
+    opt_args["args"] = (fsmp, False, discrete_penalizer, kwargs_coarse)
+
+    # The population is evaluated in one batched call instead of distributing the candidates to workers.
+    # Explicitly supplied parallel workers take precedence over the vectorized evaluation as in scipy.
+    if opt_args.get("vectorized", False):
+        if not workers_supplied:
+            opt_args["workers"] = 1
+        if opt_args["workers"] == 1:
+            opt_args["func"] = __scipy_optimizer_function_population
+        else:
+            opt_args["vectorized"] = False
+
+    # Search over the coordinates of the parametrization instead of the design vector
+    param = _design_parametrization(fsmp, opt_args["bounds"], parametrization)
+    if param is not None:
+        opt_args["args"] = (param, opt_args["func"]) + opt_args["args"]
+        opt_args["func"] = _reparametrized_objective
+        opt_args["bounds"] = param.bounds
+        if opt_args.get("x0") is not None:
+            opt_args["x0"] = param.from_design(opt_args["x0"])
+
+    # Draw the random numbers from a generator whose state can be stored and restored
+    rng = None
+    if checkpoint is not None or resume_from is not None:
+        rng_key = "rng" if "rng" in inspect.signature(optimize.differential_evolution).parameters else "seed"
+        rng = opt_args.pop("rng", None)
+        seed = opt_args.pop("seed", None)
+        rng = seed if rng is None else rng
+        if rng is None or isinstance(rng, (int, np.integer, np.random.Generator)):
+            rng = np.random.default_rng(rng)
+        opt_args[rng_key] = rng
+
+    # Continue from the population and random state of a previous run
+    nit_offset = 0
+    if resume_from is not None:
+        state = load_checkpoint(resume_from)
+        if state.get("strategy") != "scipy_differential_evolution" or state.get("parametrization") != parametrization:
+            raise ValueError("The checkpoint {} was not created by scipy_differential_evolution with parametrization={}.".format(resume_from, parametrization))
+        if np.size(state["x"]) != len(opt_args["bounds"]):
+            raise ValueError("The checkpoint {} stores {} variables but the model samples {}.".format(resume_from, np.size(state["x"]), len(opt_args["bounds"])))
+        if state["population"] is None:
+            opt_args["x0"] = state["x"]
+        else:
+            opt_args["init"] = state["population"]
+            opt_args["x0"] = None
+            opt_args["func"] = _ResumedObjective(opt_args["func"], state["population"], state["population_energies"], opt_args.get("vectorized", False))
+        if state["rng_state"] is not None and isinstance(rng, np.random.Generator):
+            rng.bit_generator.state = state["rng_state"]
+        nit_offset = state["nit"]
+        maxiter = opt_args.get("maxiter", inspect.signature(optimize.differential_evolution).parameters["maxiter"].default)
+        opt_args["maxiter"] = max(maxiter - nit_offset, 0)
+
+    # Count the evaluations in the main process and stop the generations once the budget is exhausted
+    to_design = (lambda x: x) if param is None else param.to_design
+    pool = None
+    if budget is not None:
+        budget.start()
+        opt_args["callback"] = _budget_callback(budget, opt_args.get("callback"))
+    if opt_args.get("vectorized", False) or opt_args["workers"] == 1:
+        if budget is not None:
+            opt_args["func"] = _BudgetedObjective(opt_args["func"], budget, vectorized=opt_args.get("vectorized", False))
+    elif budget is not None or get_profiler() is not None:
+        opt_args["workers"], pool = _worker_map(opt_args["workers"], budget)
+
+    if checkpoint is not None:
+        if not isinstance(checkpoint, Checkpoint):
+            checkpoint = Checkpoint(checkpoint)
+        _differential_evolution_checkpointing(opt_args, checkpoint, rng, nit_offset, parametrization, to_design)
+
+    # Polish the result ourselves such that the original tolerances of the integrator are used
+    polish = opt_args.pop("polish")
 
     # Actually call the optimization function
-    res = optimize.differential_evolution(**opt_args)
+    try:
+        res = optimize.differential_evolution(**opt_args, polish=False)
+    except BudgetExhausted:
+        res = None
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+        if pool is not None:
+            pool.terminate()
+
+    if res is None:
+        x = _budget_design(budget, to_design, x0)
+    else:
+        x = to_design(_differential_evolution_polish(res, opt_args, polish, param, fsmp, discrete_penalizer, kwargs, budget))
 
     # Return the full result
-    return __scipy_optimizer_function(res.x, fsmp, full=True, discrete_penalizer=discrete_penalizer, kwargs_dict=kwargs)
-
-
-def __scipy_brute(fsmp: FisherModelParametrized, discrete_penalizer="default", **kwargs):
+    fsr = __scipy_optimizer_function(x, fsmp, full=True, discrete_penalizer=discrete_penalizer, kwargs_dict=kwargs)
+    fsr.termination = None if budget is None else budget.status
+    return fsr
+
+
+def _differential_evolution_polish(res, opt_args, polish, param, fsmp: FisherModelParametrized, discrete_penalizer, kwargs, budget: Budget=None):
+    if polish:
+        polish_args = {"constraints": opt_args["constraints"], "method": "trust-constr"} if "constraints" in opt_args else {"method": "L-BFGS-B"}
+        polish_fun = __scipy_optimizer_function
+        polish_fun_args = (fsmp, False, discrete_penalizer, kwargs)
+        if param is not None:
+            polish_fun_args = (param, polish_fun) + polish_fun_args
+            polish_fun = _reparametrized_objective
+        elif _gradient_available(kwargs):
+            polish_fun = __scipy_optimizer_function_and_gradient
+            polish_args["jac"] = True
+        if budget is not None:
+            polish_fun = _BudgetedObjective(polish_fun, budget)
+        try:
+            res_polish = optimize.minimize(polish_fun, res.x, args=polish_fun_args, bounds=opt_args["bounds"], **polish_args)
+        except BudgetExhausted:
+            res_polish = OptimizeResult(x=budget.best_x, fun=budget.best_fun, success=budget.best_x is not None)
+        if res_polish.success and res_polish.fun < res.fun:
+            res = res_polish
+    return res.x
+
+
+def __scipy_brute(fsmp: FisherModelParametrized, discrete_penalizer="default", parametrization=None, budget: Budget=None, **kwargs):
     # Create bounds and constraints
     bounds, constraints = _scipy_calculate_bounds_constraints(fsmp)
 
@@ -236,14 +599,42 @@ def __scipy_brute(fsmp: FisherModelParametrized, discrete_penalizer="default", *
 
     # Check for intersecting arguments and update the default arguments in opt_args with arguments from kwargs.
     opt_args, kwargs = __update_arguments(optimize.brute, opt_args, kwargs)
+    kwargs_coarse, kwargs = __solver_schedule(fsmp, kwargs)
+    opt_args["args"] = (fsmp, False, discrete_penalizer, kwargs_coarse)
+
+    # The grid is spanned in the coordinates of the parametrization
+    param = _design_parametrization(fsmp, opt_args["ranges"], parametrization)
+    if param is not None:
+        opt_args["args"] = (param, opt_args["func"]) + opt_args["args"]
+        opt_args["func"] = _reparametrized_objective
+        opt_args["ranges"] = param.bounds
+
+    # Count the evaluated grid points in the main process
+    to_design = (lambda x: x) if param is None else param.to_design
+    pool = None
+    if budget is not None:
+        budget.start()
+    if opt_args["workers"] == 1:
+        if budget is not None:
+            opt_args["func"] = _BudgetedObjective(opt_args["func"], budget)
+    elif budget is not None or get_profiler() is not None:
+        opt_args["workers"], pool = _worker_map(opt_args["workers"], budget)
 
     # Actually call the optimization function
-    res = optimize.brute(**opt_args)
+    try:
+        x = to_design(optimize.brute(**opt_args))
+    except BudgetExhausted:
+        x = _budget_design(budget, to_design, __initial_guess(fsmp))
+    finally:
+        if pool is not None:
+            pool.terminate()
 
-    return __scipy_optimizer_function(res, fsmp, full=True, discrete_penalizer=discrete_penalizer, kwargs_dict=kwargs)
+    fsr = __scipy_optimizer_function(x, fsmp, full=True, discrete_penalizer=discrete_penalizer, kwargs_dict=kwargs)
+    fsr.termination = None if budget is None else budget.status
+    return fsr
 
 
-def __scipy_basinhopping(fsmp: FisherModelParametrized, discrete_penalizer="default", **kwargs):
+def __scipy_basinhopping(fsmp: FisherModelParametrized, discrete_penalizer="default", parametrization=None, budget: Budget=None, **kwargs):
     # Create bounds, constraints and initial guess
     bounds, constraints = _scipy_calculate_bounds_constraints(fsmp)
     x0 = __initial_guess(fsmp)
@@ -251,14 +642,221 @@ def __scipy_basinhopping(fsmp: FisherModelParametrized, discrete_penalizer="defa
     opt_args = {
         "func": __scipy_optimizer_function,
         "x0": x0,
-        "minimizer_kwargs":{"args":(fsmp, False, discrete_penalizer, kwargs), "bounds": bounds},
+        "minimizer_kwargs":{"bounds": bounds},
         "disp":True,
     }
 
     # Check for intersecting arguments and update the default arguments in opt_args with arguments from kwargs.
     opt_args, kwargs = __update_arguments(optimize.basinhopping, opt_args, kwargs)
+    kwargs_coarse, kwargs = __solver_schedule(fsmp, kwargs)
+    opt_args["minimizer_kwargs"].setdefault("args", (fsmp, False, discrete_penalizer, kwargs_coarse))
+
+    param = _design_parametrization(fsmp, opt_args["minimizer_kwargs"].get("bounds", bounds), parametrization)
+    if param is not None:
+        # Hop and minimize in the coordinates of the parametrization
+        opt_args["minimizer_kwargs"]["args"] = (param, opt_args["func"]) + tuple(opt_args["minimizer_kwargs"]["args"])
+        opt_args["func"] = _reparametrized_objective
+        opt_args["minimizer_kwargs"]["bounds"] = param.bounds
+        opt_args["x0"] = param.from_design(opt_args["x0"])
+    elif opt_args["func"] is __scipy_optimizer_function and "jac" not in opt_args["minimizer_kwargs"] and _gradient_available(kwargs):
+        # The local minimizer uses the analytic gradient instead of numerical differences
+        opt_args["func"] = __scipy_optimizer_function_and_gradient
+        opt_args["minimizer_kwargs"]["jac"] = True
+
+    # Every hop is an iteration of the budget
+    to_design = (lambda x: x) if param is None else param.to_design
+    if budget is not None:
+        budget.start()
+        opt_args["func"] = _BudgetedObjective(opt_args["func"], budget)
+        opt_args["callback"] = _budget_callback(budget, opt_args.get("callback"))
+
+    # Actually call the optimization function
+    try:
+        x = to_design(optimize.basinhopping(**opt_args).x)
+    except BudgetExhausted:
+        x = _budget_design(budget, to_design, x0)
+
+    fsr = __scipy_optimizer_function(x, fsmp, full=True, discrete_penalizer=discrete_penalizer, kwargs_dict=kwargs)
+    fsr.termination = None if budget is None else budget.status
+    return fsr
+
+
+def __scipy_minimize(fsmp: FisherModelParametrized, discrete_penalizer="default", budget: Budget=None, **kwargs):
+    # Create bounds, constraints and initial guess
+    bounds, constraints = _scipy_calculate_bounds_constraints(fsmp)
+    x0 = __initial_guess(fsmp)
+
+    opt_args = {
+        "fun": __scipy_optimizer_function_and_gradient,
+        "x0": x0,
+        "args": (fsmp, False, discrete_penalizer, kwargs),
+        "method": "L-BFGS-B",
+        "jac": True,
+        "bounds": bounds,
+    }
+
+    # Check for intersecting arguments and update the default arguments in opt_args with arguments from kwargs.
+    jac_supplied = "jac" in kwargs
+    opt_args, kwargs = __update_arguments(optimize.minimize, opt_args, kwargs)
+    _, kwargs = __solver_schedule(fsmp, kwargs)
+    opt_args["args"] = (fsmp, False, discrete_penalizer, kwargs)
+
+    # Criteria without known derivative are differentiated numerically by scipy
+    if not jac_supplied and not _gradient_available(kwargs):
+        opt_args["jac"] = None
+    if opt_args["jac"] is not True:
+        opt_args["fun"] = __scipy_optimizer_function
+    if opt_args["method"] == "trust-constr":
+        opt_args.setdefault("constraints", constraints)
+
+    if budget is not None:
+        budget.start()
+        opt_args["fun"] = _BudgetedObjective(opt_args["fun"], budget)
+        opt_args["callback"] = _budget_callback(budget, opt_args.get("callback"))
 
     # Actually call the optimization function
-    res = optimize.basinhopping(**opt_args)
+    try:
+        x = optimize.minimize(**opt_args).x
+    except BudgetExhausted:
+        x = _budget_design(budget, lambda x: x, x0)
+
+    fsr = __scipy_optimizer_function(x, fsmp, full=True, discrete_penalizer=discrete_penalizer, kwargs_dict=kwargs)
+    fsr.termination = None if budget is None else budget.status
+    return fsr
+
+
+def _ordered_blocks(fsmp: FisherModelParametrized) -> list:
+    # Parts of the design vector which are ordered by the linear constraints (times of every condition and sampled inputs)
+    # together with their definition
+    blocks = []
+    ts = _times_slice(fsmp)
+    if ts.stop > ts.start:
+        n_cols = fsmp.times.shape[-1]
+        blocks += [(np.arange(i, i + n_cols), fsmp.times_def) for i in range(ts.start, ts.stop, n_cols)]
+    total = ts.stop
+    for inp_def in fsmp.inputs_def:
+        if inp_def is not None:
+            blocks.append((np.arange(total, total + inp_def.n), inp_def))
+            total += inp_def.n
+    return blocks
+
+
+def _feasible_starts(starts: np.ndarray, fsmp: FisherModelParametrized) -> np.ndarray:
+    # Sort the ordered variables and shift them apart such that the minimal distances are satisfied.
+    # The values are first compressed into the interval which leaves room for all distances.
+    for block, var_def in _ordered_blocks(fsmp):
+        values = np.sort(starts[:, block], axis=1)
+        d = var_def.min_distance if var_def.min_distance is not None else 0.0
+        width = var_def.ub - var_def.lb
+        room = width - d * (block.size - 1)
+        if d > 0.0 and room >= 0.0 and width > 0.0:
+            values = var_def.lb + (values - var_def.lb) * room / width + d * np.arange(block.size)
+        starts[:, block] = values
+    return starts
+
+
+def _latin_hypercube(bounds, n_samples: int, rng) -> np.ndarray:
+    # Every variable is divided into n_samples intervals of equal width such that every interval contains exactly one sample
+    lb, ub = np.array(bounds, dtype=float).T
+    strata = np.array([rng.permutation(n_samples) for _ in range(lb.size)]).T
+    return lb + (strata + rng.random((n_samples, lb.size))) / n_samples * (ub - lb)
+
+
+def _multistart_local(x0, fsmp: FisherModelParametrized, discrete_penalizer, kwargs, minimize_args, budget: Budget=None):
+    fun = __scipy_optimizer_function_and_gradient if minimize_args.get("jac") is True else __scipy_optimizer_function
+    if budget is not None:
+        fun = _BudgetedObjective(fun, budget)
+    return optimize.minimize(fun, x0, args=(fsmp, False, discrete_penalizer, kwargs), **minimize_args)
+
+
+def _multistart_serial(local, starts, budget: Budget=None):
+    # Every local optimization is an iteration of the budget. An interrupted optimization contributes its best design.
+    results = []
+    for x in starts:
+        try:
+            results.append(local(x, budget=budget))
+            if budget is not None:
+                budget.iteration()
+        except BudgetExhausted:
+            if budget.best_x is not None:
+                results.append(OptimizeResult(x=budget.best_x, fun=budget.best_fun))
+            break
+    return results
+
+
+def _multistart_parallel(executor: Executor, local, starts, budget: Budget=None):
+    # The budget is checked whenever a local optimization finishes and the remaining ones are cancelled once it is exhausted
+    call = _WorkerCall(local)
+    futures = [executor.submit(call, x) for x in starts]
+    results = []
+    for future in as_completed(futures):
+        res, solves, profile = future.result()
+        _merge_profile(profile)
+        results.append(res)
+        if budget is None:
+            continue
+        budget.record(res.x, res.fun, solves=solves, evaluations=res.nfev)
+        try:
+            budget.iteration()
+        except BudgetExhausted:
+            for f in futures:
+                f.cancel()
+            break
+    return results
+
+
+def __scipy_multistart(fsmp: FisherModelParametrized, discrete_penalizer="default", n_starts=10, workers=-1, seed=None, unique_tol=1e-3, budget: Budget=None, **kwargs):
+    # Create bounds, constraints and initial guess
+    bounds, constraints = _scipy_calculate_bounds_constraints(fsmp)
+    x0 = __initial_guess(fsmp)
 
-    return __scipy_optimizer_function(res.x, fsmp, full=True, discrete_penalizer=discrete_penalizer, kwargs_dict=kwargs)
+    minimize_args = {
+        "method": "SLSQP",
+        "bounds": bounds,
+        "jac": True,
+    }
+    if constraints.A.shape[0] > 0:
+        minimize_args["constraints"] = constraints
+
+    # Check for intersecting arguments and update the default arguments in minimize_args with arguments from kwargs.
+    jac_supplied = "jac" in kwargs
+    minimize_args, kwargs = __update_arguments(optimize.minimize, minimize_args, kwargs)
+    _, kwargs = __solver_schedule(fsmp, kwargs)
+    if not jac_supplied and not _gradient_available(kwargs):
+        minimize_args["jac"] = None
+
+    # The initial guess is the first start. The remaining starts are spread over the bounds by latin hypercube sampling.
+    # Ordered variables are sorted such that every start satisfies the monotonicity constraints.
+    rng = np.random.default_rng(seed)
+    starts = np.vstack([x0, _latin_hypercube(bounds, n_starts - 1, rng)]) if n_starts > 1 else np.array([x0])
+    starts = _feasible_starts(starts, fsmp)
+
+    local = functools.partial(_multistart_local, fsmp=fsmp, discrete_penalizer=discrete_penalizer, kwargs=kwargs, minimize_args=minimize_args)
+    if budget is not None:
+        budget.start()
+    if workers == 1:
+        results = _multistart_serial(local, starts, budget)
+    elif isinstance(workers, Executor):
+        results = _multistart_parallel(workers, local, starts, budget)
+    else:
+        with ProcessPoolExecutor(max_workers=None if workers == -1 else workers) as executor:
+            results = _multistart_parallel(executor, local, starts, budget)
+
+    # Keep one design per local optimum, compared in the scaled and sorted design space
+    lb, ub = np.array(bounds, dtype=float).T
+    scale = np.where(ub > lb, ub - lb, 1.0)
+    unique = []
+    for res in sorted((res for res in results if np.isfinite(res.fun)), key=lambda res: res.fun):
+        x = np.array(res.x, dtype=float)
+        for block, _ in _ordered_blocks(fsmp):
+            x[block] = np.sort(x[block])
+        if all(np.max(np.abs(x - y) / scale) > unique_tol for y in unique):
+            unique.append(x)
+    if len(unique) == 0:
+        unique.append(x0)
+
+    ensemble = [__scipy_optimizer_function(x, fsmp, full=True, discrete_penalizer=discrete_penalizer, kwargs_dict=kwargs) for x in unique]
+    fsr = ensemble[0]
+    fsr.ensemble = ensemble
+    fsr.termination = None if budget is None else budget.status
+    return fsr
@@ -0,0 +1,303 @@
+import numpy as np
+import scipy.linalg as linalg
+
+from eDPM.model import FisherModelParametrized
+from eDPM.solving import get_S_matrix, calculate_fisher_criterion, fisher_determinant, fisher_logdeterminant, fisher_sumeigenval
+from .penalty import _discrete_penalizer
+from .budget import Budget, BudgetExhausted
+from eDPM.solving.profiling import _ode_solve_count
+
+
+def _cholesky_update(L, x, downdate=False):
+    # Update the lower Cholesky factor L of F in-place such that it becomes the factor of F + x x^T (or F - x x^T).
+    # This needs O(n^2) operations instead of O(n^3) for a new factorization.
+    x = np.array(x, dtype=float)
+    sign = -1.0 if downdate else 1.0
+    for k in range(len(x)):
+        r2 = L[k, k]**2 + sign * x[k]**2
+        if r2 <= 0.0:
+            raise np.linalg.LinAlgError("The downdated matrix is not positive definite.")
+        r = np.sqrt(r2)
+        c = r / L[k, k]
+        s = x[k] / L[k, k]
+        L[k, k] = r
+        L[k+1:, k] = (L[k+1:, k] + sign * s * x[k+1:]) / c
+        x[k+1:] = c * x[k+1:] - s * L[k+1:, k]
+    return L
+
+
+# Criteria which can be updated incrementally
+SEQUENTIAL_CRITERIA = [fisher_determinant, fisher_logdeterminant, fisher_sumeigenval]
+
+
+class SequentialDesign:
+    r"""Build an experimental design by adding and removing one candidate measurement at a time.
+
+    The Fisher information matrix is the sum of the contributions :math:`w_i s_i s_i^T` of the individual data points.
+    Every candidate measurement (eg. a time point) is a group of :math:`k` data points (eg. all observables and conditions measured at this time).
+    Instead of calculating the Fisher matrix from scratch, its Cholesky factor is updated by rank-one updates for every data point
+    and the determinant is updated with the matrix determinant lemma :math:`\det(F + v v^T) = \det(F) (1 + v^T F^{-1} v)`.
+    The gains of all candidates are obtained from one triangular solve such that greedy and exchange algorithms scale to
+    choosing hundreds of measurements from thousands of candidates.
+
+    The Fisher matrix is regularized by :math:`\varepsilon I` such that it can be factorized before the design has full rank.
+    All reported values refer to the regularized matrix.
+
+    :param S: The sensitivities of the candidates with shape ``(n_p, n_candidates, k)`` or ``(n_p, n_candidates)`` for :math:`k=1`.
+    :type S: np.ndarray
+    :param weights: The inverse variances of the data points with shape ``(n_candidates, k)``. Candidates with non-finite weights are never chosen. Defaults to None (all weights are 1).
+    :type weights: np.ndarray, optional
+    :param criterion: The optimality criterion. One of :py:data:`SEQUENTIAL_CRITERIA`. The determinant is internally maximized in logarithmic form. Defaults to fisher_logdeterminant.
+    :type criterion: callable, optional
+    :param regularization: The regularization relative to the mean diagonal entry of the Fisher matrix of all candidates. Defaults to 1e-8.
+    :type regularization: float, optional
+    :param replace: Allow choosing the same candidate multiple times. Defaults to False.
+    :type replace: bool, optional
+    :param min_distance: The minimal distance between the times of chosen candidates. Only used if ``candidate_times`` is supplied. Defaults to None.
+    :type min_distance: float, optional
+    :param candidate_times: The times of the candidates. Defaults to None.
+    :type candidate_times: np.ndarray, optional
+
+    :raises ValueError: If the criterion can not be updated incrementally.
+    """
+    def __init__(self, S, weights=None, criterion=fisher_logdeterminant, regularization: float=1e-8, replace: bool=False, min_distance: float=None, candidate_times=None):
+        if criterion not in SEQUENTIAL_CRITERIA:
+            raise ValueError("The criterion {} can not be updated incrementally. Please specify one of {}.".format(criterion, SEQUENTIAL_CRITERIA))
+        S = np.asarray(S, dtype=float)
+        if S.ndim == 2:
+            S = S[:, :, np.newaxis]
+        self.n_p, self.n_candidates, self.k = S.shape
+        weights = np.ones(S.shape[1:]) if weights is None else np.asarray(weights, dtype=float).reshape(S.shape[1:])
+
+        # Candidates with non-finite weights are excluded
+        self._valid = np.all(np.isfinite(weights), axis=-1)
+        weights = np.where(self._valid[:, np.newaxis], weights, 0.0)
+        self._V = S * np.sqrt(weights)[np.newaxis]
+
+        self.criterion = criterion
+        self.replace = replace
+        self.counts = np.zeros(self.n_candidates, dtype=int)
+
+        # Start from the regularized empty design
+        trace = np.sum(self._V**2)
+        self.epsilon = regularization * trace / self.n_p if trace > 0 else regularization
+        self.F = self.epsilon * np.eye(self.n_p)
+        self.L = np.sqrt(self.epsilon) * np.eye(self.n_p)
+        self.logdet = self.n_p * np.log(self.epsilon)
+        self.min_distance = min_distance
+        self.candidate_times = None if candidate_times is None else np.asarray(candidate_times, dtype=float)
+
+    @classmethod
+    def from_model(cls, fsmp: FisherModelParametrized, candidate_times, relative_sensitivities=False, solver_options=None, **kwargs):
+        """Create the candidates from the evaluation times of a model.
+        Every candidate is one time point at which all observables are measured for every experimental condition.
+
+        :param fsmp: The parametrized FisherModel. Only identical times are supported.
+        :type fsmp: FisherModelParametrized
+        :param candidate_times: The times from which the design is chosen.
+        :type candidate_times: np.ndarray
+        :param relative_sensitivities: Use relative local sensitivities instead of absolute. Defaults to False.
+        :type relative_sensitivities: bool, optional
+        :param solver_options: The options of the numerical integration. See :py:class:`SolverOptions`. Defaults to None.
+        :type solver_options: SolverOptions, dict, optional
+        :param kwargs: Further arguments of :py:class:`SequentialDesign`.
+
+        :raises ValueError: If the model does not use identical times.
+        :return: The sequential design with all candidate times.
+        :rtype: SequentialDesign
+        """
+        if fsmp.identical_times != True:
+            raise ValueError("Sequential designs can only be created for models with identical_times=True.")
+        candidate_times = np.sort(np.asarray(candidate_times, dtype=float))
+        n_t = candidate_times.size
+        S, C, _ = get_S_matrix(fsmp.with_values(times=candidate_times), relative_sensitivities, solver_options=solver_options)
+
+        # The times are the last axis of the flattened data points
+        S_cand = np.moveaxis(S.reshape((S.shape[0], -1, n_t)), -1, 1)
+        weights = C.diagonal().reshape((-1, n_t)).T
+
+        return cls(S_cand, weights, candidate_times=candidate_times, **kwargs)
+
+    @property
+    def selected(self) -> np.ndarray:
+        """The indices of the chosen candidates. Candidates chosen multiple times are repeated."""
+        return np.repeat(np.arange(self.n_candidates), self.counts)
+
+    @property
+    def design_times(self) -> np.ndarray:
+        """The sorted times of the chosen candidates if the design was created by :py:meth:`from_model`."""
+        if self.candidate_times is None:
+            raise ValueError("The candidates were not created from times.")
+        return np.sort(self.candidate_times[self.selected])
+
+    @property
+    def value(self) -> float:
+        """The value of the criterion for the chosen design."""
+        if self.criterion is fisher_determinant:
+            return np.exp(self.logdet)
+        elif self.criterion is fisher_logdeterminant:
+            return self.logdet
+        return np.trace(self.F)
+
+    def _changes(self, V, remove=False):
+        # Change of the (logarithmic) criterion when adding or removing the groups of columns in V with shape (n_p, n, k)
+        if self.criterion is fisher_sumeigenval:
+            d = np.sum(V**2, axis=(0, 2))
+            return -d if remove else d
+        Z = linalg.solve_triangular(self.L, V.reshape((self.n_p, -1)), lower=True).reshape(V.shape)
+        G = np.einsum("pgk,pgl->gkl", Z, Z)
+        G = np.eye(self.k) - G if remove else np.eye(self.k) + G
+        sign, logdet = np.linalg.slogdet(G)
+        return np.where(sign > 0, logdet, -np.inf)
+
+    def gains(self) -> np.ndarray:
+        """Calculate the change of the criterion when adding any of the candidates.
+        For the determinant the change of its logarithm is returned.
+        Candidates which can not be chosen have a gain of ``-np.inf``.
+
+        :return: The gains of all candidates.
+        :rtype: np.ndarray
+        """
+        gains = self._changes(self._V)
+        gains[~self._valid] = -np.inf
+        if not self.replace:
+            gains[self.counts > 0] = -np.inf
+        if self.min_distance is not None and self.candidate_times is not None and np.any(self.counts > 0):
+            # Exclude candidates which are too close to the already chosen ones
+            distances = np.abs(self.candidate_times[:, np.newaxis] - self.candidate_times[np.newaxis, self.counts > 0])
+            gains[np.any(distances < self.min_distance, axis=1)] = -np.inf
+        return gains
+
+    def add(self, i: int):
+        """Add the candidate with index ``i`` and update the Fisher matrix, its Cholesky factor and the criterion.
+
+        :param i: The index of the candidate.
+        :type i: int
+        """
+        for v in self._V[:, i].T:
+            z = linalg.solve_triangular(self.L, v, lower=True)
+            self.logdet += np.log1p(z @ z)
+            self.F += np.outer(v, v)
+            _cholesky_update(self.L, v)
+        self.counts[i] += 1
+
+    def remove(self, i: int):
+        """Remove one measurement of the candidate with index ``i``.
+
+        :param i: The index of the candidate.
+        :type i: int
+
+        :raises ValueError: If the candidate was not chosen.
+        """
+        if self.counts[i] == 0:
+            raise ValueError("The candidate {} was not chosen.".format(i))
+        for v in self._V[:, i].T:
+            z = linalg.solve_triangular(self.L, v, lower=True)
+            self.logdet += np.log1p(-z @ z)
+            self.F -= np.outer(v, v)
+            _cholesky_update(self.L, v, downdate=True)
+        self.counts[i] -= 1
+
+    def greedy(self, n: int) -> np.ndarray:
+        """Add ``n`` candidates one after the other by always choosing the one with the largest gain.
+
+        :param n: The number of candidates to add.
+        :type n: int
+
+        :return: The indices of the chosen candidates.
+        :rtype: np.ndarray
+        """
+        for _ in range(n):
+            gains = self.gains()
+            i = np.argmax(gains)
+            if not np.isfinite(gains[i]):
+                raise ValueError("No candidate is left which can be added.")
+            self.add(i)
+        return self.selected
+
+    def exchange(self, max_iter: int=100, tol: float=1e-10, callback=None) -> np.ndarray:
+        """Improve the chosen design by exchanging one chosen candidate for another one (Fedorov exchange).
+        In every iteration the exchange with the largest improvement is done until no improvement is possible.
+
+        :param max_iter: The maximum number of exchanges. Defaults to 100.
+        :type max_iter: int, optional
+        :param tol: The minimal improvement of the criterion to accept an exchange. Defaults to 1e-10.
+        :type tol: float, optional
+        :param callback: A function which is called with the SequentialDesign after every exchange.
+        :type callback: callable, optional
+
+        :return: The indices of the chosen candidates.
+        :rtype: np.ndarray
+        """
+        for _ in range(max_iter):
+            best = (tol, None, None)
+            for i in np.nonzero(self.counts)[0]:
+                loss = self._changes(self._V[:, i:i+1], remove=True)[0]
+                # Evaluate the gains with respect to the design without candidate i
+                self.remove(i)
+                gains = self.gains()
+                self.add(i)
+                gains[i] = -np.inf
+                j = np.argmax(gains)
+                if loss + gains[j] > best[0]:
+                    best = (loss + gains[j], i, j)
+            if best[1] is None:
+                break
+            self.remove(best[1])
+            self.add(best[2])
+            if callback is not None:
+                callback(self)
+        return self.selected
+
+
+def __fedorov_exchange(fsmp: FisherModelParametrized, discrete_penalizer="default", criterion=fisher_determinant, relative_sensitivities=False, solver_options=None, n_candidates: int=None, max_iter: int=100, regularization: float=1e-8, budget: Budget=None, **kwargs):
+    # Only the times can be chosen from candidates since their contributions to the Fisher matrix are additive
+    if fsmp.times_def is None or fsmp.ode_t0_def is not None or fsmp.ode_x0_def is not None or any(inp_def is not None for inp_def in fsmp.inputs_def):
+        raise ValueError("The fedorov_exchange strategy can only be used if the times are the only sampled variable.")
+
+    # Use the discretization of the times as candidates or create a uniform grid
+    times_def = fsmp.times_def
+    if times_def.discrete is not None:
+        candidate_times = np.asarray(times_def.discrete, dtype=float)
+        candidate_times = candidate_times[(candidate_times >= times_def.lb) & (candidate_times <= times_def.ub)]
+    else:
+        candidate_times = np.linspace(times_def.lb, times_def.ub, n_candidates if n_candidates is not None else 10 * times_def.n + 1)
+
+    if budget is not None:
+        budget.start()
+    n0 = _ode_solve_count()
+    sd = SequentialDesign.from_model(
+        fsmp,
+        candidate_times,
+        relative_sensitivities=relative_sensitivities,
+        solver_options=solver_options,
+        criterion=criterion,
+        regularization=regularization,
+        replace=not times_def.unique,
+        min_distance=times_def.min_distance,
+    )
+    sd.greedy(times_def.n)
+
+    # Every exchange evaluates all candidates for every chosen one. The design stays valid if the budget stops the exchanges.
+    def _budget_callback(sd):
+        budget.record(None, -sd.value, evaluations=sd.n_candidates * times_def.n)
+        budget.iteration()
+
+    if budget is not None:
+        budget.record(None, -sd.value, solves=_ode_solve_count() - n0, evaluations=sd.n_candidates * times_def.n)
+        callback = _budget_callback
+    else:
+        callback = None
+    try:
+        if budget is not None:
+            budget.check()
+        sd.exchange(max_iter=max_iter, callback=callback)
+    except BudgetExhausted:
+        pass
+
+    # Calculate the full result of the chosen design
+    fsmp = fsmp.with_values(times=sd.design_times)
+    fsr = calculate_fisher_criterion(fsmp, criterion=criterion, relative_sensitivities=relative_sensitivities, solver_options=solver_options, **kwargs)
+    _, fsr.penalty_discrete_summary = _discrete_penalizer(fsmp, discrete_penalizer)
+    fsr.termination = None if budget is None else budget.status
+    return fsr
@@ -1,3 +1,7 @@
+from .solver_options import *
+from .solution_cache import *
+from .profiling import *
+from .jit import *
 from .solve_fsm import *
 from .criteria import *
 from .display import *
@@ -1,94 +1,362 @@
 import numpy as np
+import scipy.sparse as sparse
 
 from eDPM.model import FisherModelParametrized
 
 
+def calculate_fisher_matrix(S, C):
+    r"""Calculate the Fisher information matrix :math:`F = S C S^T` from the sensitivity matrix and the inverse covariance matrix.
+
+    The inverse covariance matrix may be supplied as a dense 2D array, as a 1D vector of weights
+    (ie. the diagonal of the inverse covariance matrix) or as a ``scipy.sparse`` matrix.
+    For the latter two the Fisher matrix is calculated as a weighted Gram product which scales linearly with the number of data points.
+
+    :param S: The sensitivity matrix.
+    :type S: np.ndarray
+    :param C: The inverse covariance matrix of the measurement errors.
+    :type C: np.ndarray, scipy.sparse.spmatrix
+
+    :return: The Fisher information matrix.
+    :rtype: np.ndarray
+    """
+    if sparse.issparse(C):
+        return S @ np.asarray(C @ S.T)
+    C = np.asarray(C)
+    if C.ndim == 1:
+        return (S * C) @ S.T
+    return S @ C @ S.T
+
+
+class FisherMatrix:
+    r"""The Fisher information matrix :math:`F = S C S^T` together with the factorizations needed by the optimality criteria.
+
+    The matrix is calculated once and every factorization is computed on first access and stored afterwards.
+    Since :math:`F` is symmetric positive semi-definite, the determinant is obtained from the Cholesky factor
+    (or ``np.linalg.slogdet`` if the matrix is singular) and the eigenvalues from ``np.linalg.eigvalsh``.
+
+    :param S: The sensitivity matrix.
+    :type S: np.ndarray
+    :param C: The inverse covariance matrix of the measurement errors. See :py:meth:`calculate_fisher_matrix`.
+    :type C: np.ndarray, scipy.sparse.spmatrix
+    """
+    def __init__(self, S, C):
+        self._reset(calculate_fisher_matrix(S, C))
+
+    def _reset(self, F):
+        self.F = F
+        self._cholesky = None
+        self._cholesky_failed = False
+        self._slogdet = None
+        self._eigvalsh = None
+
+    @classmethod
+    def from_matrix(cls, F):
+        """Create the object from an already calculated Fisher information matrix.
+
+        :param F: The Fisher information matrix.
+        :type F: np.ndarray
+
+        :return: The Fisher information matrix with its factorizations.
+        :rtype: FisherMatrix
+        """
+        fm = cls.__new__(cls)
+        fm._reset(np.asarray(F, dtype=float))
+        return fm
+
+    @property
+    def finite(self) -> bool:
+        """Check if all entries of the matrix are finite.
+        Non-finite entries are obtained when an uncertainty of a measurement vanishes such that the inverse covariance is not defined.
+        """
+        return bool(np.all(np.isfinite(self.F)))
+
+    @property
+    def cholesky(self):
+        """The lower triangular Cholesky factor :math:`L` with :math:`F = L L^T` or None if the matrix is not positive definite."""
+        if self._cholesky is None and not self._cholesky_failed:
+            try:
+                self._cholesky = np.linalg.cholesky(self.F)
+            except np.linalg.LinAlgError:
+                self._cholesky_failed = True
+        return self._cholesky
+
+    @property
+    def slogdet(self):
+        """The sign and the natural logarithm of the absolute value of the determinant."""
+        if self._slogdet is None:
+            L = self.cholesky
+            if L is not None:
+                self._slogdet = (1.0, 2.0 * np.sum(np.log(np.diag(L))))
+            else:
+                sign, logdet = np.linalg.slogdet(self.F)
+                self._slogdet = (float(sign), float(logdet))
+        return self._slogdet
+
+    @property
+    def eigvalsh(self):
+        """The eigenvalues of the symmetric matrix in ascending order."""
+        if self._eigvalsh is None:
+            self._eigvalsh = np.linalg.eigvalsh(self.F)
+        return self._eigvalsh
+
+    @property
+    def determinant(self) -> float:
+        """The determinant of the matrix."""
+        sign, logdet = self.slogdet
+        # Very large determinants overflow to inf
+        with np.errstate(over="ignore"):
+            return sign * np.exp(logdet)
+
+    @property
+    def logdeterminant(self) -> float:
+        """The natural logarithm of the determinant or ``-np.inf`` if the matrix is singular."""
+        sign, logdet = self.slogdet
+        return logdet if sign > 0 else -np.inf
+
+    @property
+    def inverse(self):
+        """The inverse of the matrix obtained from the Cholesky factor or the pseudo-inverse if the matrix is not positive definite."""
+        L = self.cholesky
+        if L is not None:
+            L_inv = np.linalg.inv(L)
+            return L_inv.T @ L_inv
+        return np.linalg.pinv(self.F, hermitian=True)
+
+    @property
+    def trace(self) -> float:
+        """The trace of the matrix which equals the sum of its eigenvalues."""
+        return np.trace(self.F)
+
+
 def fisher_determinant(fsmp: FisherModelParametrized, S, C):
     """Calculate the determinant of the Fisher information matrix (the D-optimality criterion) using the sensitivity matrix.
+    Fisher matrices with non-finite entries are rated with 0.
 
     :param fsmp: The parametrized FisherModel with a chosen values for the sampled variables.
     :type fsmp: FisherModelParametrized
     :param S: The sensitivity matrix.
     :type S: np.ndarray
-    :param C: The covariance matrix of the measurement errors.
-    :type C: np.ndarray
+    :param C: The inverse covariance matrix of the measurement errors.
+    :type C: np.ndarray, scipy.sparse.spmatrix
 
     :return: The determinant of the Fisher information matrix.
     :rtype: float
     """
-    # Calculate Fisher Matrix
-    F = S @ C @ S.T
+    F = FisherMatrix(S, C)
+    if not F.finite:
+        return 0.0
+    return F.determinant
+
+
+def fisher_logdeterminant(fsmp: FisherModelParametrized, S, C):
+    """Calculate the logarithm of the determinant of the Fisher information matrix (the D-optimality criterion in logarithmic form) using the sensitivity matrix.
+    In contrast to :py:meth:`fisher_determinant` the value does not over- or underflow for large systems.
+    Singular Fisher matrices and matrices with non-finite entries are rated with ``-np.inf``.
+
+    :param fsmp: The parametrized FisherModel with a chosen values for the sampled variables.
+    :type fsmp: FisherModelParametrized
+    :param S: The sensitivity matrix.
+    :type S: np.ndarray
+    :param C: The inverse covariance matrix of the measurement errors.
+    :type C: np.ndarray, scipy.sparse.spmatrix
 
-    # Calculate Determinant
-    det = np.linalg.det(F)
-    return det
+    :return: The logarithm of the determinant of the Fisher information matrix.
+    :rtype: float
+    """
+    F = FisherMatrix(S, C)
+    if not F.finite:
+        return -np.inf
+    return F.logdeterminant
 
 
 def fisher_sumeigenval(fsmp: FisherModelParametrized, S, C):
     """Calculate the sum of the all eigenvalues of the Fisher information matrix (the A-optimality criterion) using the sensitivity matrix.
+    The sum is obtained as the trace of the matrix. Fisher matrices with non-finite entries are rated with 0.
 
     :param fsmp: The parametrized FisherModel with a chosen values for the sampled variables.
     :type fsmp: FisherModelParametrized
     :param S: The sensitivity matrix.
     :type S: np.ndarray
-    :param C: The covariance matrix of the measurement errors.
-    :type C: np.ndarray
+    :param C: The inverse covariance matrix of the measurement errors.
+    :type C: np.ndarray, scipy.sparse.spmatrix
 
     :return: The sum of the eigenvalues of the Fisher information matrix.
     :rtype: float
     """
-    # Calculate Fisher Matrix
-    F = S @ C @ S.T
-
-    # Calculate sum eigenvals
-    sumeigval = np.sum(np.linalg.eigvals(F))
-    return sumeigval
+    F = FisherMatrix(S, C)
+    if not F.finite:
+        return 0.0
+    return F.trace
 
 
 def fisher_mineigenval(fsmp: FisherModelParametrized, S, C):
     """Calculate the minimal eigenvalue of the Fisher information matrix (the E-optimality criterion) using the sensitivity matrix.
+    Fisher matrices with non-finite entries are rated with 0.
 
     :param fsmp: The parametrized FisherModel with a chosen values for the sampled variables.
     :type fsmp: FisherModelParametrized
     :param S: The sensitivity matrix.
     :type S: np.ndarray
-    :param C: The covariance matrix of the measurement errors.
-    :type C: np.ndarray
+    :param C: The inverse covariance matrix of the measurement errors.
+    :type C: np.ndarray, scipy.sparse.spmatrix
 
     :return: The minimal eigenvalue of the Fisher information matrix.
     :rtype: float
     """
-    # Calculate Fisher Matrix
-    F = S @ C @ S.T
-
-    # Calculate sum eigenvals
-    try:
-        mineigval = np.min(np.linalg.eigvals(F))
-    except:
-        mineigval = 0.0
-    return mineigval
+    F = FisherMatrix(S, C)
+    if not F.finite:
+        return 0.0
+    return F.eigvalsh[0]
 
 
 def fisher_ratioeigenval(fsmp: FisherModelParametrized, S, C):
     """Calculate the ratio of the minimal and maximal eigenvalues of the Fisher information matrix (the modified E-optimality criterion) using the sensitivity matrix.
+    Fisher matrices with non-finite entries are rated with 0.
 
     :param fsmp: The parametrized FisherModel with a chosen values for the sampled variables.
     :type fsmp: FisherModelParametrized
     :param S: The sensitivity matrix.
     :type S: np.ndarray
-    :param C: The covariance matrix of the measurement errors.
-    :type C: np.ndarray
+    :param C: The inverse covariance matrix of the measurement errors.
+    :type C: np.ndarray, scipy.sparse.spmatrix
 
     :return: The ratio of the minimal and maximal eigenvalues of the Fisher information matrix.
     :rtype: float
     """
-    # Calculate Fisher Matrix
-    F = S @ C @ S.T
-
-    # Calculate sum eigenvals
-    try:
-        eigvals = np.linalg.eigvals(F)
-        ratioeigval = np.min(eigvals) / np.max(eigvals)
-    except:
-        ratioeigval = 0.0
-    return ratioeigval
\ No newline at end of file
+    F = FisherMatrix(S, C)
+    if not F.finite:
+        return 0.0
+    eigvals = F.eigvalsh
+    return eigvals[0] / eigvals[-1]
+
+
+def calculate_fisher_matrices(S, C):
+    r"""Calculate the Fisher information matrices :math:`F_k = S_k C_k S_k^T` of many designs at once.
+
+    :param S: The stacked sensitivity matrices with shape ``(n_designs, n_p, n_data)``.
+    :type S: np.ndarray
+    :param C: The inverse covariance matrices of the individual designs. See :py:meth:`calculate_fisher_matrix`.
+    :type C: list
+
+    :return: The stacked Fisher information matrices with shape ``(n_designs, n_p, n_p)``.
+    :rtype: np.ndarray
+    """
+    S = np.asarray(S)
+    if all(sparse.issparse(Ck) and Ck.format == "dia" for Ck in C):
+        # Diagonal matrices are reduced to their weights such that all products are done in one batched call
+        W = np.array([Ck.diagonal() for Ck in C])
+        return np.matmul(S * W[:, np.newaxis, :], np.swapaxes(S, 1, 2))
+    return np.array([calculate_fisher_matrix(Sk, Ck) for Sk, Ck in zip(S, C)])
+
+
+def _determinant_batch(F):
+    sign, logdet = np.linalg.slogdet(F)
+    return sign * np.exp(logdet)
+
+
+def _logdeterminant_batch(F):
+    sign, logdet = np.linalg.slogdet(F)
+    return np.where(sign > 0, logdet, -np.inf)
+
+
+def _sumeigenval_batch(F):
+    return np.trace(F, axis1=-2, axis2=-1)
+
+
+def _mineigenval_batch(F):
+    return np.linalg.eigvalsh(F)[..., 0]
+
+
+def _ratioeigenval_batch(F):
+    eigvals = np.linalg.eigvalsh(F)
+    return eigvals[..., 0] / eigvals[..., -1]
+
+
+# Criteria which can be evaluated for a stack of Fisher matrices in one call
+# together with their value for matrices with non-finite entries
+_BATCHED_CRITERIA = {
+    fisher_determinant: (_determinant_batch, 0.0),
+    fisher_logdeterminant: (_logdeterminant_batch, -np.inf),
+    fisher_sumeigenval: (_sumeigenval_batch, 0.0),
+    fisher_mineigenval: (_mineigenval_batch, 0.0),
+    fisher_ratioeigenval: (_ratioeigenval_batch, 0.0),
+}
+
+
+def calculate_fisher_criterion_batch(fsmp: FisherModelParametrized, S, C, criterion=fisher_determinant):
+    """Evaluate an optimality criterion for many designs at once.
+    The predefined criteria compute the determinants and eigenvalues of all Fisher information matrices in one batched call.
+    Other criteria are evaluated one design after the other.
+
+    :param fsmp: The parametrized FisherModel with a chosen values for the sampled variables.
+    :type fsmp: FisherModelParametrized
+    :param S: The stacked sensitivity matrices with shape ``(n_designs, n_p, n_data)``.
+    :type S: np.ndarray
+    :param C: The inverse covariance matrices of the individual designs.
+    :type C: list
+    :param criterion: The optimality criterion. Defaults to fisher_determinant.
+    :type criterion: callable
+
+    :return: The values of the criterion for all designs.
+    :rtype: np.ndarray
+    """
+    if criterion in _BATCHED_CRITERIA:
+        batch_fun, default = _BATCHED_CRITERIA[criterion]
+        F = calculate_fisher_matrices(S, C)
+        finite = np.all(np.isfinite(F), axis=(-2, -1))
+        crits = np.full(len(F), default, dtype=float)
+        if np.any(finite):
+            crits[finite] = batch_fun(F[finite])
+        return crits
+    return np.array([criterion(fsmp, Sk, Ck) for Sk, Ck in zip(S, C)])
+
+
+def _determinant_gradient(F: FisherMatrix):
+    return F.determinant * F.inverse
+
+
+def _logdeterminant_gradient(F: FisherMatrix):
+    return F.inverse
+
+
+def _sumeigenval_gradient(F: FisherMatrix):
+    return np.eye(F.F.shape[0])
+
+
+def _mineigenval_gradient(F: FisherMatrix):
+    _, v = np.linalg.eigh(F.F)
+    return np.outer(v[:, 0], v[:, 0])
+
+
+def _ratioeigenval_gradient(F: FisherMatrix):
+    w, v = np.linalg.eigh(F.F)
+    return (np.outer(v[:, 0], v[:, 0]) * w[-1] - np.outer(v[:, -1], v[:, -1]) * w[0]) / w[-1]**2
+
+
+# Derivatives of the predefined criteria with respect to the entries of the Fisher matrix
+_CRITERION_GRADIENTS = {
+    fisher_determinant: _determinant_gradient,
+    fisher_logdeterminant: _logdeterminant_gradient,
+    fisher_sumeigenval: _sumeigenval_gradient,
+    fisher_mineigenval: _mineigenval_gradient,
+    fisher_ratioeigenval: _ratioeigenval_gradient,
+}
+
+
+def calculate_fisher_criterion_matrix_gradient(F: FisherMatrix, criterion=fisher_determinant):
+    r"""Calculate the derivative :math:`G = \frac{\partial \Phi}{\partial F}` of an optimality criterion with respect to the entries of the Fisher information matrix.
+    Any change of the matrix :math:`dF` changes the criterion by :math:`\text{tr}(G \, dF)`.
+    The eigenvalue criteria are only differentiable if the minimal (and maximal) eigenvalue is simple.
+
+    :param F: The Fisher information matrix.
+    :type F: FisherMatrix
+    :param criterion: The optimality criterion. Only the predefined criteria are supported. Defaults to fisher_determinant.
+    :type criterion: callable
+
+    :raises ValueError: Raised if no derivative is known for the criterion.
+    :return: The symmetric matrix :math:`G` with the shape of the Fisher information matrix.
+    :rtype: np.ndarray
+    """
+    if criterion not in _CRITERION_GRADIENTS:
+        raise ValueError("The derivative of the criterion {} is unknown. Please specify one of {}.".format(getattr(criterion, "__name__", criterion), [c.__name__ for c in _CRITERION_GRADIENTS]))
+    return _CRITERION_GRADIENTS[criterion](F)
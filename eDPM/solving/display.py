@@ -106,7 +106,7 @@ def display_fsr_details(fsr: FisherResults, pp=pprint.PrettyPrinter(indent=2, wi
         (getattr(fsr.criterion_fun, '__name__', 'unknown'), fsr.criterion),
     ]
     cols += generate_matrix_cols(fsr.S.T, "sensitivity matrix", terminal_size)
-    cols += generate_matrix_cols(fsr.C.T, "inverse covariance matrix", terminal_size)
+    cols += generate_matrix_cols(fsr.C.diagonal(), "inverse covariance matrix (diagonal)", terminal_size)
     display_entries(cols, terminal_size)
 
     display_heading("INDIVIDUAL RESULTS")
@@ -0,0 +1,182 @@
+import functools
+import numpy as np
+
+
+# Compiled kernels of every combination of user functions and dimensions.
+# They are built once per process and reused for all conditions and evaluations of the model.
+_KERNELS = {}
+
+
+def _import_numba():
+    try:
+        import numba
+    except ImportError:
+        raise ImportError("Compiling functions (ode_jit=True, obs_jit=True or jit=True of symbolic models) requires numba. Install it with 'pip install numba' or disable the option.")
+    return numba
+
+
+def is_jitted(fun) -> bool:
+    """Check if the function was compiled with numba (eg. decorated with ``numba.njit``).
+
+    :param fun: The function to check.
+    :type fun: callable
+    :return: True if the function is a numba dispatcher.
+    :rtype: bool
+    """
+    return type(fun).__module__.split(".")[0] == "numba" and hasattr(fun, "py_func")
+
+
+def _njit(fun, njit):
+    return fun if is_jitted(fun) else njit(fun)
+
+
+def _use_ode_jit(fsmp) -> bool:
+    return fsmp.ode_rhs_fused is None and (fsmp.ode_jit or all(is_jitted(f) for f in (fsmp.ode_fun, fsmp.ode_dfdx, fsmp.ode_dfdp)))
+
+
+def _use_obs_jit(fsmp) -> bool:
+    funs = (fsmp.obs_fun, fsmp.obs_dgdx, fsmp.obs_dgdp)
+    # The functions generated for observables given as indices of the state variables are not compiled
+    if fsmp.obs_vectorized or any(isinstance(f, functools.partial) for f in funs):
+        return False
+    return fsmp.obs_jit or all(is_jitted(f) for f in funs)
+
+
+def _jit_arguments(inputs, parameters, ode_args):
+    # numba can not type lists of mixed or reflected types efficiently. Thus the values are passed as tuples of floats.
+    inputs = tuple(float(q) for q in inputs)
+    parameters = tuple(float(p) for p in parameters)
+    if isinstance(ode_args, list):
+        ode_args = tuple(ode_args)
+    return inputs, parameters, ode_args
+
+
+def _build_ode_rhs(ode_fun, ode_dfdx, ode_dfdp, ode_dfdx0, n_x: int, n_p: int, njit):
+    f = _njit(ode_fun, njit)
+    dfdx = _njit(ode_dfdx, njit)
+    dfdp = _njit(ode_dfdp, njit)
+    i_s = n_x
+    i_s_x0 = n_x + n_x*n_p
+
+    def sensitivities(out, y, jac, inhom, offset, n_cols):
+        # out[offset:] = jac @ s + inhom where s starts at the same offset in y
+        for i in range(n_x):
+            for j in range(n_cols):
+                value = inhom[i, j]
+                for k in range(n_x):
+                    value += jac[i, k] * y[offset + k*n_cols + j]
+                out[offset + i*n_cols + j] = value
+
+    sensitivities = njit(sensitivities)
+
+    if callable(ode_dfdx0):
+        dfdx0 = _njit(ode_dfdx0, njit)
+
+        def rhs(t, y, inputs, parameters, ode_args):
+            x = y[:i_s]
+            out = np.empty(i_s_x0 + n_x*n_x)
+            out[:i_s] = np.ascontiguousarray(np.asarray(f(t, x, inputs, parameters, ode_args), dtype=np.float64)).reshape(n_x)
+            jac = np.ascontiguousarray(np.asarray(dfdx(t, x, inputs, parameters, ode_args), dtype=np.float64)).reshape((n_x, n_x))
+            inhom = np.ascontiguousarray(np.asarray(dfdp(t, x, inputs, parameters, ode_args), dtype=np.float64)).reshape((n_x, n_p))
+            sensitivities(out, y, jac, inhom, i_s, n_p)
+            inhom_x0 = np.ascontiguousarray(np.asarray(dfdx0(t, x, inputs, parameters, ode_args), dtype=np.float64)).reshape((n_x, n_x))
+            sensitivities(out, y, jac, inhom_x0, i_s_x0, n_x)
+            return out
+    else:
+        def rhs(t, y, inputs, parameters, ode_args):
+            x = y[:i_s]
+            out = np.empty(i_s_x0)
+            out[:i_s] = np.ascontiguousarray(np.asarray(f(t, x, inputs, parameters, ode_args), dtype=np.float64)).reshape(n_x)
+            jac = np.ascontiguousarray(np.asarray(dfdx(t, x, inputs, parameters, ode_args), dtype=np.float64)).reshape((n_x, n_x))
+            inhom = np.ascontiguousarray(np.asarray(dfdp(t, x, inputs, parameters, ode_args), dtype=np.float64)).reshape((n_x, n_p))
+            sensitivities(out, y, jac, inhom, i_s, n_p)
+            return out
+    return njit(rhs)
+
+
+def _build_observable(obs_fun, obs_dgdx, obs_dgdp, obs_dgdx0, n_x: int, n_obs: int, n_p: int, njit):
+    g = _njit(obs_fun, njit)
+    dgdx = _njit(obs_dgdx, njit)
+    dgdp = _njit(obs_dgdp, njit)
+    with_x0 = callable(obs_dgdx0)
+    dgdx0 = _njit(obs_dgdx0, njit) if with_x0 else None
+
+    def observable(t, x, inputs, parameters, ode_args):
+        # x has the shape (n_t, n_x) such that the states of every time point are contiguous
+        n_t = t.size
+        obs = np.empty((n_obs, n_t))
+        d_p = np.empty((n_obs, n_p, n_t))
+        d_x = np.empty((n_obs, n_x, n_t))
+        for i in range(n_t):
+            xi = x[i]
+            obs[:, i] = np.asarray(g(t[i], xi, inputs, parameters, ode_args), dtype=np.float64).reshape(n_obs)
+            d_p[:, :, i] = np.ascontiguousarray(np.asarray(dgdp(t[i], xi, inputs, parameters, ode_args), dtype=np.float64)).reshape((n_obs, n_p))
+            d_x[:, :, i] = np.ascontiguousarray(np.asarray(dgdx(t[i], xi, inputs, parameters, ode_args), dtype=np.float64)).reshape((n_obs, n_x))
+        return obs, d_p, d_x
+
+    def observable_x0(t, x, inputs, parameters, ode_args):
+        obs, d_p, d_x = observable(t, x, inputs, parameters, ode_args)
+        d_x0 = np.empty((n_obs, n_x, t.size))
+        for i in range(t.size):
+            d_x0[:, :, i] = np.ascontiguousarray(np.asarray(dgdx0(t[i], x[i], inputs, parameters, ode_args), dtype=np.float64)).reshape((n_obs, n_x))
+        return obs, d_p, d_x, d_x0
+
+    observable = njit(observable)
+    return njit(observable_x0) if with_x0 else observable
+
+
+def jit_ode_rhs(ode_fun, ode_dfdx, ode_dfdp, ode_dfdx0, n_x: int, n_p: int):
+    r"""Compile the right-hand side of the state variables and sensitivities (see :py:class:`OdeRhs`) with numba.
+
+    The user functions are compiled with ``numba.njit`` unless they are already numba dispatchers.
+    They have to be compatible with the nopython mode of numba and should return numpy arrays.
+    The inputs and parameters are passed as tuples of floats.
+    The kernel is cached such that it is only compiled once per process.
+
+    :param ode_fun: The ODEs right-hand side function :math:`f`.
+    :type ode_fun: callable
+    :param ode_dfdx: The derivative of :math:`f` with respect to the state variables.
+    :type ode_dfdx: callable
+    :param ode_dfdp: The derivative of :math:`f` with respect to the parameters.
+    :type ode_dfdp: callable
+    :param ode_dfdx0: The derivative of :math:`f` with respect to the initial values or None.
+    :type ode_dfdx0: callable
+    :param n_x: The number of state variables.
+    :type n_x: int
+    :param n_p: The number of parameters.
+    :type n_p: int
+    :return: The compiled function ``(t, y, inputs, parameters, ode_args)`` which can be passed as ``ode_rhs_fused`` to :py:class:`OdeRhs`.
+    :rtype: callable
+    """
+    key = ("ode", ode_fun, ode_dfdx, ode_dfdp, ode_dfdx0, n_x, n_p)
+    if key not in _KERNELS:
+        _KERNELS[key] = _build_ode_rhs(ode_fun, ode_dfdx, ode_dfdp, ode_dfdx0, n_x, n_p, _import_numba().njit)
+    return _KERNELS[key]
+
+
+def jit_observable(obs_fun, obs_dgdx, obs_dgdp, obs_dgdx0, n_x: int, n_obs: int, n_p: int):
+    r"""Compile the evaluation of the observable and its derivatives at all time points with numba.
+
+    :param obs_fun: The observable function :math:`g`.
+    :type obs_fun: callable
+    :param obs_dgdx: The derivative of :math:`g` with respect to the state variables.
+    :type obs_dgdx: callable
+    :param obs_dgdp: The derivative of :math:`g` with respect to the parameters.
+    :type obs_dgdp: callable
+    :param obs_dgdx0: The derivative of :math:`g` with respect to the initial values or None.
+    :type obs_dgdx0: callable
+    :param n_x: The number of state variables.
+    :type n_x: int
+    :param n_obs: The number of observables.
+    :type n_obs: int
+    :param n_p: The number of parameters.
+    :type n_p: int
+    :return: The compiled function ``(t, x, inputs, parameters, ode_args)`` taking the states with shape (n_t, n_x) and returning the observable (n_obs, n_t),
+        dgdp (n_obs, n_p, n_t), dgdx (n_obs, n_x, n_t) and if given dgdx0 (n_obs, n_x, n_t).
+    :rtype: callable
+    """
+    key = ("obs", obs_fun, obs_dgdx, obs_dgdp, obs_dgdx0, n_x, n_obs, n_p)
+    if key not in _KERNELS:
+        _KERNELS[key] = _build_observable(obs_fun, obs_dgdx, obs_dgdp, obs_dgdx0, n_x, n_obs, n_p, _import_numba().njit)
+    return _KERNELS[key]
+
@@ -0,0 +1,237 @@
+import os
+import json
+import contextlib
+import time
+import threading
+
+
+# Number of integrations of the ODEs done by the current process. Budgets of the optimization are based on it.
+_ODE_SOLVES = [0]
+_ODE_SOLVES_LOCK = threading.Lock()
+
+# The profiler which collects the measurements of the current process (None if profiling is disabled)
+_PROFILER = [None]
+
+
+class Profiler:
+    """Collect the time spent in the individual stages of the evaluation of a design and count events like evaluations of the right-hand side of the ODEs.
+    The stages are nested. The time of a stage includes the time of all stages within it.
+
+        - "objective"
+            One evaluation of the objective function of an optimization routine.
+        - "validation"
+            Creating and validating the model with the values of a design and the results (pydantic).
+        - "penalty"
+            Calculating the discretization penalty.
+        - "sensitivities"
+            Calculating the sensitivity matrix and the inverse covariance matrix (:py:meth:`get_S_matrix`).
+        - "ode_integration"
+            Integrating the ODEs and their sensitivities.
+        - "observable"
+            Transforming the sensitivities of the states to the observables.
+        - "covariance"
+            Calculating the inverse covariance matrix.
+        - "criterion"
+            Evaluating the optimality criterion.
+
+    The counters are "evaluations" (designs evaluated by the objective function), "ode_solves" and the numbers
+    "nfev", "njev" and "nlu" of evaluations of the right-hand side, of the Jacobian and LU decompositions reported by the integrator.
+
+    Profiling is enabled for the current process by :py:meth:`profiling` or the argument ``profile`` of :py:meth:`find_optimal`.
+    The measurements of worker processes of the optimization routines and of the solver mode "processes" are merged into the profiler of the main process.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timers = {}
+        self.counters = {}
+
+    def add_time(self, stage: str, seconds: float, calls: int=1):
+        """Add the time spent in a stage.
+
+        :param stage: The name of the stage.
+        :type stage: str
+        :param seconds: The time spent in seconds.
+        :type seconds: float
+        :param calls: The number of calls of the stage. Defaults to 1.
+        :type calls: int, optional
+        """
+        with self._lock:
+            timer = self.timers.setdefault(stage, [0, 0.0])
+            timer[0] += calls
+            timer[1] += seconds
+
+    def count(self, name: str, n: int=1):
+        """Increase a counter.
+
+        :param name: The name of the counter.
+        :type name: str
+        :param n: The increment. Defaults to 1.
+        :type n: int, optional
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, data: dict):
+        """Add the measurements of another profiler (eg. of a worker process) given by :py:meth:`as_dict`.
+
+        :param data: The measurements to add.
+        :type data: dict
+        """
+        for stage, timer in data["timers"].items():
+            self.add_time(stage, timer["time"], timer["calls"])
+        for name, n in data["counters"].items():
+            self.count(name, n)
+
+    def reset(self):
+        """Remove all measurements."""
+        with self._lock:
+            self.timers = {}
+            self.counters = {}
+
+    def as_dict(self) -> dict:
+        """The measurements as a dictionary with the entries "timers" (calls and time in seconds of every stage) and "counters".
+
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                "timers": {stage: {"calls": calls, "time": seconds} for stage, (calls, seconds) in self.timers.items()},
+                "counters": dict(self.counters),
+            }
+
+    def to_json(self, out=None, **args) -> str:
+        """Create a json string of the measurements and optionally save it to a file.
+
+        :param out: The filename to store the json string. Defaults to None (not stored).
+        :type out: str, optional
+        :param args: Additional arguments passed to ``json.dumps``.
+
+        :return: The measurements in json format.
+        :rtype: str
+        """
+        args.setdefault("indent", 4)
+        result = json.dumps(self.as_dict(), **args)
+        if out is not None:
+            with open(out, "w") as fp:
+                fp.write(result)
+        return result
+
+    def summary(self) -> str:
+        """Create a table of the time spent in every stage and of all counters.
+
+        :return: The formatted table.
+        :rtype: str
+        """
+        data = self.as_dict()
+        lines = ["{:<18}{:>12}{:>14}{:>14}".format("stage", "calls", "total [s]", "mean [ms]")]
+        for stage, timer in sorted(data["timers"].items(), key=lambda item: -item[1]["time"]):
+            mean = 1e3 * timer["time"] / timer["calls"] if timer["calls"] > 0 else 0.0
+            lines.append("{:<18}{:>12}{:>14.4f}{:>14.4f}".format(stage, timer["calls"], timer["time"], mean))
+        if len(data["counters"]) > 0:
+            lines.append("")
+            lines.append("{:<18}{:>12}".format("counter", "value"))
+            for name, n in sorted(data["counters"].items()):
+                lines.append("{:<18}{:>12}".format(name, n))
+        return "\n".join(lines)
+
+
+@contextlib.contextmanager
+def profiling(profiler: Profiler=None):
+    """Enable profiling for the current process within a ``with`` block.
+
+    .. code-block:: python
+
+        with profiling() as profiler:
+            calculate_fisher_criterion(fsmp)
+        print(profiler.summary())
+
+    :param profiler: The profiler which collects the measurements. Defaults to None (a new profiler).
+    :type profiler: Profiler, optional
+
+    :return: The profiler which collects the measurements.
+    :rtype: Profiler
+    """
+    profiler = Profiler() if profiler is None else profiler
+    previous = _PROFILER[0]
+    _PROFILER[0] = profiler
+    try:
+        yield profiler
+    finally:
+        _PROFILER[0] = previous
+
+
+def get_profiler():
+    """The profiler of the current process.
+
+    :return: The active profiler or None if profiling is disabled.
+    :rtype: Profiler
+    """
+    return _PROFILER[0]
+
+
+class _Stage:
+    # Measure the time of a stage if profiling is enabled
+    __slots__ = ("name", "profiler", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.profiler = _PROFILER[0]
+        if self.profiler is not None:
+            self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        if self.profiler is not None:
+            self.profiler.add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def _stage(name: str) -> _Stage:
+    return _Stage(name)
+
+
+def _count(name: str, n: int=1):
+    profiler = _PROFILER[0]
+    if profiler is not None:
+        profiler.count(name, n)
+
+
+def _count_ode_solve(res=None):
+    with _ODE_SOLVES_LOCK:
+        _ODE_SOLVES[0] += 1
+    profiler = _PROFILER[0]
+    if profiler is not None:
+        profiler.count("ode_solves")
+        if res is not None:
+            for key in ["nfev", "njev", "nlu"]:
+                profiler.count(key, int(getattr(res, key, 0) or 0))
+
+
+def _ode_solve_count() -> int:
+    return _ODE_SOLVES[0]
+
+
+class _WorkerCall:
+    # Call a function in a worker and return the integrations of the ODEs and the profile of the call next to the value.
+    # Calls within the creating process (eg. by threads) are measured by its profiler directly.
+    def __init__(self, func, profile: bool=None):
+        self.func = func
+        self.profile = _PROFILER[0] is not None if profile is None else profile
+        self.pid = os.getpid()
+
+    def __call__(self, *args):
+        n0 = _ode_solve_count()
+        if self.profile and os.getpid() != self.pid:
+            with profiling() as profiler:
+                value = self.func(*args)
+            return value, _ode_solve_count() - n0, profiler.as_dict()
+        value = self.func(*args)
+        return value, _ode_solve_count() - n0, None
+
+
+def _merge_profile(data):
+    # Add the profile of a worker to the profiler of the current process
+    profiler = _PROFILER[0]
+    if data is not None and profiler is not None:
+        profiler.merge(data)
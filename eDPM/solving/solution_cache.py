@@ -0,0 +1,118 @@
+import threading
+import uuid
+import pickle
+import numpy as np
+from collections import OrderedDict, namedtuple
+
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+# Caches which were sent to worker processes are registered here such that
+# every process keeps one persistent copy instead of starting empty for every task.
+_PROCESS_CACHES = {}
+
+
+def _restore_solution_cache(cache_id, maxsize):
+    if cache_id not in _PROCESS_CACHES:
+        cache = SolutionCache(maxsize)
+        cache._id = cache_id
+        _PROCESS_CACHES[cache_id] = cache
+    return _PROCESS_CACHES[cache_id]
+
+
+class SolutionCache:
+    """Bounded least-recently-used cache of dense solutions of the ODEs system and its sensitivities.
+    The solutions are stored per experimental condition and keyed on all arguments but the evaluation times.
+    If only the times change, the states and sensitivities are obtained by interpolating the cached
+    dense solution instead of solving the ODEs again.
+
+    The cache can be shared between threads. When it is sent to worker processes, every process
+    keeps its own copy and the statistics only count evaluations of the current process.
+
+    :param maxsize: The maximum number of stored solutions. Defaults to 128.
+    :type maxsize: int, optional
+    """
+    def __init__(self, maxsize: int=128):
+        if maxsize < 1:
+            raise ValueError("The maxsize of the SolutionCache needs to be at least 1 but was {}.".format(maxsize))
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._id = uuid.uuid4().hex
+
+    def __reduce__(self):
+        return (_restore_solution_cache, (self._id, self.maxsize))
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, t_end: float):
+        """Look up a stored solution which covers the time interval up to ``t_end``.
+
+        :param key: The key of the experimental condition.
+        :type key: tuple
+        :param t_end: The largest time at which the solution will be evaluated.
+        :type t_end: float
+
+        :return: The stored result of ``scipy.integrate.solve_ivp`` or None if no suitable solution is present.
+        :rtype: scipy.optimize.OptimizeResult, None
+        """
+        with self._lock:
+            res = self._data.get(key)
+            if res is None or res.t[-1] < t_end:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return res
+
+    def put(self, key, res):
+        """Store a dense solution and discard the least recently used one if the cache is full.
+
+        :param key: The key of the experimental condition.
+        :type key: tuple
+        :param res: The result of ``scipy.integrate.solve_ivp`` obtained with ``dense_output=True``.
+        :type res: scipy.optimize.OptimizeResult
+        """
+        with self._lock:
+            self._data[key] = res
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """Remove all stored solutions and reset the statistics."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def cache_info(self):
+        """Report the statistics of the cache analogously to ``functools.lru_cache``.
+
+        :return: The number of hits, misses, the maximum and current size of the cache.
+        :rtype: CacheInfo
+        """
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self._data))
+
+
+def _solution_cache_key(fsmp, x0, t0, Q, solver_options) -> tuple:
+    # The user-defined functions are compared by identity while all numerical values are compared by their bytes.
+    # Additional arguments which cannot be pickled are compared by identity as well.
+    try:
+        ode_args = pickle.dumps(fsmp.ode_args)
+    except (pickle.PicklingError, AttributeError, TypeError):
+        ode_args = id(fsmp.ode_args)
+    return (
+        fsmp.ode_fun, fsmp.ode_dfdx, fsmp.ode_dfdp, fsmp.ode_dfdx0,
+        np.asarray(x0, dtype=float).tobytes(),
+        float(t0),
+        np.asarray(Q, dtype=float).tobytes(),
+        np.asarray(fsmp.parameters, dtype=float).tobytes(),
+        ode_args,
+        repr(solver_options),
+    )
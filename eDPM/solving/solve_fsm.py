@@ -1,9 +1,163 @@
 import numpy as np
 import scipy.integrate as integrate
+import scipy.sparse as sparse
+from scipy.optimize import OptimizeResult
 import itertools
+import functools
+import os
+import atexit
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 from eDPM.model import FisherModelParametrized, FisherResults, FisherResultSingle
-from .criteria import fisher_determinant
+from .criteria import fisher_determinant, calculate_fisher_criterion_batch, calculate_fisher_criterion_matrix_gradient, FisherMatrix
+from .solver_options import SolverOptions, JACOBIAN_MODES, get_solver_options
+from .solution_cache import SolutionCache, _solution_cache_key
+from .profiling import _stage, _count_ode_solve, _WorkerCall, _merge_profile
+from .jit import jit_ode_rhs, jit_observable, _use_ode_jit, _use_obs_jit, _jit_arguments
+
+
+class OdeRhs:
+    r"""Right-hand side of the ODEs system containing the model definition with state variables :math:`\dot x = f(x, t, u, u, c)`
+    and the equations for the local sensitivities :math:`\dot s = \frac{\partial f}{\partial x} s + \frac{\partial f}{\partial p}`.
+    If the initial values are treated as parameters, the sensitivities :math:`\dot s_{x_0} = \frac{\partial f}{\partial x} s_{x_0} + \frac{\partial f}{\partial x_0}` are appended.
+
+    The object is created once per solve of the ODE. It precomputes the offsets of the individual
+    components of the state vector and holds buffers which are filled in-place on every evaluation.
+
+    :param ode_fun: The ODEs right-hand side function :math:`f` for the state variables :math:`x`.
+    :type ode_fun: callable
+    :param ode_dfdx: The derivative of the ODEs function with respect to state variables :math:`x`.
+    :type ode_dfdx: callable
+    :param ode_dfdp: The derivative of the ODEs function with respect to parameters :math:`p`.
+    :type ode_dfdp: callable
+    :param ode_dfdx0: The derivative of the ODEs function with respect to the initial values :math:`x_0` or None if the initial values are not treated as parameters.
+    :type ode_dfdx0: callable
+    :param inputs: The inputs of the system.
+    :type inputs: list
+    :param parameters: The estimated parameters of the system :math:`p`.
+    :type params: tuple
+    :param ode_args: The ode_args of the system :math:`c`.
+    :type ode_args: tuple
+    :param n_x: The number of the state variables of the system.
+    :type n_x: int
+    :param n_p: The number of the estimated parameters of the system.
+    :type n_p: int
+    :param jacobian: Choose which Jacobian of the full system is provided by :py:meth:`OdeRhs.jac`. See :py:data:`JACOBIAN_MODES`. Defaults to "full".
+    :type jacobian: str, optional
+    :param sparse_jacobian: Return the Jacobian as ``scipy.sparse.csc_matrix``. This is only supported by the "BDF" and "Radau" methods of ``scipy.integrate.solve_ivp``. Defaults to False.
+    :type sparse_jacobian: bool, optional
+    :param ode_rhs_fused: A function ``(t, y, inputs, parameters, ode_args)`` returning the whole right-hand side of the state variables and sensitivities
+        with the layout described above (eg. generated by :py:meth:`symbolic_fisher_model` with ``fused=True``).
+        It replaces the separate evaluation of ``ode_fun``, ``ode_dfdx``, ``ode_dfdp`` and ``ode_dfdx0``. The Jacobian is still calculated from ``ode_dfdx``. Defaults to None.
+    :type ode_rhs_fused: callable, optional
+    """
+    def __init__(self, ode_fun, ode_dfdx, ode_dfdp, ode_dfdx0, inputs, parameters, ode_args, n_x, n_p, jacobian="full", sparse_jacobian=False, ode_rhs_fused=None):
+        self.ode_fun = ode_fun
+        self.ode_dfdx = ode_dfdx
+        self.ode_dfdp = ode_dfdp
+        self.ode_dfdx0 = ode_dfdx0
+        self.inputs = inputs
+        self.parameters = parameters
+        self.ode_args = ode_args
+        self.n_x = n_x
+        self.n_p = n_p
+        self.with_x0 = callable(ode_dfdx0)
+        if jacobian not in JACOBIAN_MODES:
+            raise ValueError("Unknown jacobian {}. Please specify one of {}.".format(jacobian, JACOBIAN_MODES))
+        self.jacobian = jacobian
+        self.sparse_jacobian = sparse_jacobian
+        self.ode_rhs_fused = ode_rhs_fused
+
+        # Offsets of the individual components: x, s (n_x, n_p) and s_x0 (n_x, n_x)
+        self.i_s = n_x
+        self.i_s_x0 = n_x + n_x*n_p
+        self.n_total = self.i_s_x0 + (n_x*n_x if self.with_x0 else 0)
+
+        # Output buffer and views into its components
+        self.out = np.empty(self.n_total)
+        self.out_x = self.out[:self.i_s]
+        self.out_s = self.out[self.i_s:self.i_s_x0].reshape((n_x, n_p))
+        self.out_s_x0 = self.out[self.i_s_x0:].reshape((n_x, n_x)) if self.with_x0 else None
+
+    def __call__(self, t, x):
+        if self.ode_rhs_fused is not None:
+            return np.asarray(self.ode_rhs_fused(t, x, self.inputs, self.parameters, self.ode_args), dtype=float).reshape((self.n_total))
+
+        n_x, n_p = self.n_x, self.n_p
+        x_fun = x[:self.i_s]
+        s = x[self.i_s:self.i_s_x0].reshape((n_x, n_p))
+
+        self.out_x[:] = np.asarray(self.ode_fun(t, x_fun, self.inputs, self.parameters, self.ode_args), dtype=float).reshape((n_x))
+        dfdx = np.asarray(self.ode_dfdx(t, x_fun, self.inputs, self.parameters, self.ode_args), dtype=float).reshape((n_x, n_x))
+
+        # Calculate the rhs of the sensitivities
+        np.matmul(dfdx, s, out=self.out_s)
+        self.out_s += np.asarray(self.ode_dfdp(t, x_fun, self.inputs, self.parameters, self.ode_args), dtype=float).reshape((n_x, n_p))
+        if self.with_x0:
+            s_x0 = x[self.i_s_x0:].reshape((n_x, n_x))
+            np.matmul(dfdx, s_x0, out=self.out_s_x0)
+            self.out_s_x0 += np.asarray(self.ode_dfdx0(t, x_fun, self.inputs, self.parameters, self.ode_args), dtype=float).reshape((n_x, n_x))
+
+        # The solvers of scipy may keep references to the returned array.
+        # Thus we can not hand out the buffer itself.
+        return self.out.copy()
+
+    def _sensitivity_rhs(self, t, x_fun, s, s_x0):
+        # Right-hand side of the sensitivities only, used to approximate second derivatives
+        dfdx = np.asarray(self.ode_dfdx(t, x_fun, self.inputs, self.parameters, self.ode_args), dtype=float).reshape((self.n_x, self.n_x))
+        dfdp = np.asarray(self.ode_dfdp(t, x_fun, self.inputs, self.parameters, self.ode_args), dtype=float).reshape((self.n_x, self.n_p))
+        ds = (dfdx @ s + dfdp).ravel()
+        if self.with_x0:
+            dfdx0 = np.asarray(self.ode_dfdx0(t, x_fun, self.inputs, self.parameters, self.ode_args), dtype=float).reshape((self.n_x, self.n_x))
+            ds = np.concatenate((ds, (dfdx @ s_x0 + dfdx0).ravel()))
+        return dfdx, ds
+
+    def jac(self, t, x):
+        r"""Calculate the Jacobian of the full system of state variables and sensitivities.
+
+        Since :math:`\dot s = \frac{\partial f}{\partial x} s + \frac{\partial f}{\partial p}` is linear in :math:`s`,
+        the Jacobian is block-diagonal with :math:`\frac{\partial f}{\partial x}` acting on the state variables and every column of the sensitivities.
+        The remaining coupling of the sensitivities to the state variables contains second derivatives of :math:`f`.
+        It is neglected for ``jacobian="block"`` and approximated by forward differences of the user-supplied derivatives for ``jacobian="full"``.
+
+        :param t: The current time :math:`t`.
+        :type t: float
+        :param x: The array containing the state variables :math:`x` and sensitivities :math:`s`.
+        :type x: np.ndarray
+
+        :return: The Jacobian of the full system.
+        :rtype: np.ndarray, scipy.sparse.csc_matrix
+        """
+        n_x, n_p = self.n_x, self.n_p
+        x_fun = x[:self.i_s]
+        s = x[self.i_s:self.i_s_x0].reshape((n_x, n_p))
+        s_x0 = x[self.i_s_x0:].reshape((n_x, n_x)) if self.with_x0 else None
+
+        if self.jacobian == "full":
+            dfdx, ds = self._sensitivity_rhs(t, x_fun, s, s_x0)
+        else:
+            dfdx = np.asarray(self.ode_dfdx(t, x_fun, self.inputs, self.parameters, self.ode_args), dtype=float).reshape((n_x, n_x))
+
+        # Blocks on the diagonal
+        J = np.zeros((self.n_total, self.n_total))
+        J[:n_x, :n_x] = dfdx
+        J[self.i_s:self.i_s_x0, self.i_s:self.i_s_x0] = np.kron(dfdx, np.eye(n_p))
+        if self.with_x0:
+            J[self.i_s_x0:, self.i_s_x0:] = np.kron(dfdx, np.eye(n_x))
+
+        # Coupling of the sensitivities to the state variables
+        if self.jacobian == "full":
+            for m in range(n_x):
+                h = np.sqrt(np.finfo(float).eps) * max(1.0, abs(x_fun[m]))
+                x_h = np.array(x_fun, dtype=float)
+                x_h[m] += h
+                _, ds_h = self._sensitivity_rhs(t, x_h, s, s_x0)
+                J[n_x:, m] = (ds_h - ds) / h
+
+        if self.sparse_jacobian:
+            return sparse.csc_matrix(J)
+        return J
 
 
 def ode_rhs(t, x, ode_fun, ode_dfdx, ode_dfdp, ode_dfdx0, inputs, parameters, ode_args, n_x, n_p):
@@ -20,6 +174,8 @@ def ode_rhs(t, x, ode_fun, ode_dfdx, ode_dfdp, ode_dfdx0, inputs, parameters, od
     :type ode_dfdx: callable
     :param ode_dfdp: The derivative of the ODEs function with respect to parameters :math:`p`.
     :type ode_dfdp: callable
+    :param ode_dfdx0: The derivative of the ODEs function with respect to the initial values :math:`x_0` or None if the initial values are not treated as parameters.
+    :type ode_dfdx0: callable
     :param inputs: The inputs of the system.
     :type inputs: list
     :param parameters: The estimated parameters of the system :math:`p`.
@@ -34,26 +190,36 @@ def ode_rhs(t, x, ode_fun, ode_dfdx, ode_dfdp, ode_dfdx0, inputs, parameters, od
     :return: The right-hand side of the ODEs system for sensitivities calculation.
     :rtype: np.ndarray
     """
-    if callable(ode_dfdx0):
-        n_s_x0 = n_x
-    else:
-        n_s_x0 = 0
-    x_fun, s, s_x0, rest = np.split(x, [n_x, n_x + n_x*n_p, n_x + n_x*n_p + n_s_x0])
-    s = s.reshape((n_x, n_p))
-    s_x0 = s_x0.reshape((n_s_x0, n_s_x0))
-    dx_f = np.asarray(ode_fun(t, x_fun, inputs, parameters, ode_args), dtype=float).reshape((n_x))
-    dfdx = np.asarray(ode_dfdx(t, x_fun, inputs, parameters, ode_args), dtype=float).reshape((n_x, n_x))
-    dfdp = np.asarray(ode_dfdp(t, x_fun, inputs, parameters, ode_args), dtype=float).reshape((n_x, n_p))
-
-    # Calculate the rhs of the sensitivities
-    ds = np.dot(dfdx, s) + dfdp
-    if callable(ode_dfdx0):
-        dfdx0 = np.asarray(ode_dfdx0(t, x_fun, inputs, parameters, ode_args)).reshape((n_x, n_x))
-        ds_x0 = np.dot(dfdx, s_x0) + dfdx0
-        x_tot = np.concatenate((dx_f, *ds, *ds_x0))
-    else:
-        x_tot = np.concatenate((dx_f, *ds))
-    return x_tot
+    return OdeRhs(ode_fun, ode_dfdx, ode_dfdp, ode_dfdx0, inputs, parameters, ode_args, n_x, n_p)(t, x)
+
+
+def _observable_derivatives(fsmp: FisherModelParametrized, t: np.ndarray, x: np.ndarray, Q, n_x: int, n_obs: int, n_p: int, with_x0: bool):
+    # Evaluate the observable and its derivatives at all time points.
+    # The results have the time as last axis: obs (n_obs, n_t), dgdp (n_obs, n_p, n_t), dgdx and dgdx0 (n_obs, n_x, n_t).
+    n_t = t.size
+    args = (Q, fsmp.parameters, fsmp.ode_args)
+    if _use_obs_jit(fsmp):
+        # The compiled kernel loops over the time points and expects the states of every time point to be contiguous
+        observable = jit_observable(fsmp.obs_fun, fsmp.obs_dgdx, fsmp.obs_dgdp, fsmp.obs_dgdx0 if with_x0 else None, n_x, n_obs, n_p)
+        res = observable(np.ascontiguousarray(t, dtype=float), np.ascontiguousarray(x.T, dtype=float), *_jit_arguments(*args))
+        return tuple(res) if with_x0 else tuple(res) + (None,)
+    if fsmp.obs_vectorized:
+        # The functions are called once with all time points and states of shape (n_x, n_t)
+        obs = _stacked_array(fsmp.obs_fun(t, x, *args), (n_obs,), n_t)
+        dgdp = _stacked_array(fsmp.obs_dgdp(t, x, *args), (n_obs, n_p), n_t)
+        dgdx = _stacked_array(fsmp.obs_dgdx(t, x, *args), (n_obs, n_x), n_t)
+        dgdx0 = _stacked_array(fsmp.obs_dgdx0(t, x, *args), (n_obs, n_x), n_t) if with_x0 else None
+        return obs, dgdp, dgdx, dgdx0
+
+    def evaluate(fun, shape):
+        values = np.array([np.asarray(fun(ti, x[:,i], *args), dtype=float) for i, ti in enumerate(t)])
+        return np.moveaxis(values.reshape((n_t,) + shape), 0, -1)
+
+    obs = evaluate(fsmp.obs_fun, (n_obs,))
+    dgdp = evaluate(fsmp.obs_dgdp, (n_obs, n_p))
+    dgdx = evaluate(fsmp.obs_dgdx, (n_obs, n_x))
+    dgdx0 = evaluate(fsmp.obs_dgdx0, (n_obs, n_x)) if with_x0 else None
+    return obs, dgdp, dgdx, dgdx0
 
 
 def _calculate_sensitivities_with_observable(fsmp: FisherModelParametrized, t: np.ndarray, x: np.ndarray, s: np.ndarray, Q: np.ndarray, n_x:int, n_obs: int, n_p: int, relative_sensitivities=False, **kwargs):
@@ -61,66 +227,392 @@ def _calculate_sensitivities_with_observable(fsmp: FisherModelParametrized, t: n
     # t: (n_t)
     # x: (n_x, n_t)
     # s: (n_p_full, n_x, n_t)
-    # term1: (n_p, n_obs, n_t)
-    # term2: (n_p, n_obs, n_t)
-    # term1_full: (n_p_full, n_obs, n_t)
-    # term2_full: (n_p_full, n_obs, n_t)
-    n_t = t.size
+    # dgdp: (n_obs, n_p, n_t)
+    # dgdx, dgdx0: (n_obs, n_x, n_t)
+    # result: (n_p_full, n_obs, n_t)
     if callable(fsmp.obs_fun) and callable(fsmp.obs_dgdp) and callable(fsmp.obs_dgdx):
-        # Calculate the first term of the equation
-        term1 = np.array([fsmp.obs_dgdp(ti, x[:,i_t], Q, fsmp.parameters, fsmp.ode_args) for i_t, ti in enumerate(t)]).reshape((n_t, n_obs, n_p)).swapaxes(0, 2)
-
-        # Calculate the second term of the equation and add them
-        term2 = np.array([
-            # This has shape (n_x, n_obs)
-            np.array(fsmp.obs_dgdx(ti, x[:,i], Q, fsmp.parameters, fsmp.ode_args), dtype=float)
-                .reshape((n_obs, n_x))
-                .dot(s[:n_p,:,i].T)
-            for i, ti in enumerate(t)
-        ]).reshape((n_t, n_obs, n_p)).swapaxes(0, 2)
-
-        if callable(fsmp.ode_dfdx0) and callable(fsmp.obs_dgdx0):
-            # Calculate term1_add which is dgdx0_ik for every time point in t
-            term1_add = np.array([
-                fsmp.obs_dgdx0(ti, x[:,i_t], Q, fsmp.parameters, fsmp.ode_args)
-                for i_t, ti in enumerate(t)
-            ]).reshape((-1, n_obs, n_x)).swapaxes(0, 2)
-
-            # Calculate term2_add which is dgdx0_ij * s_jk
-            term2_add = np.array([
-                np.array(fsmp.obs_dgdx(ti, x[:,i], Q, fsmp.parameters, fsmp.ode_args), dtype=float)
-                    .reshape((n_x, n_obs))
-                    .T
-                    .dot(s[n_p:,:,i].T)
-                for i, ti in enumerate(t)
-            ]).reshape((n_t, n_obs, n_x)).swapaxes(0, 2)
-
-            term1_full = np.concatenate([term1, term1_add], axis=0)
-            term2_full = np.concatenate([term2, term2_add], axis=0)
-
-            s = term1_full + term2_full
-        else:
-            s = term1 + term2
+        with_x0 = callable(fsmp.ode_dfdx0) and callable(fsmp.obs_dgdx0)
+        obs, dgdp, dgdx, dgdx0 = _observable_derivatives(fsmp, t, x, Q, n_x, n_obs, n_p, with_x0)
 
-        # Also calculate the results for the observable which can be used later for relative sensitivities
-        obs = np.array([fsmp.obs_fun(ti, x[:,i_t], Q, fsmp.parameters, fsmp.ode_args) for i_t, ti in enumerate(t)]).reshape((-1, n_obs)).T
+        # Apply the chain rule dg/dp = dg/dp + dg/dx * dx/dp (and dg/dx0 = dg/dx0 + dg/dx * dx/dx0) at all time points at once
+        term1 = np.concatenate([dgdp, dgdx0], axis=1) if with_x0 else dgdp
+        term2 = np.einsum("oxt,pxt->pot", dgdx, s if with_x0 else s[:n_p])
+        s = np.swapaxes(term1, 0, 1) + term2
         return s, obs
     else:
         return s, x
 
 
-def get_S_matrix(fsmp: FisherModelParametrized, relative_sensitivities=False, **kwargs):
-    r"""Calculate the sensitivity matrix for a Fisher Model.
+def _inverse_covariance_diagonal(uncertainty: np.ndarray):
+    # The covariance matrix is diag(uncertainty**2) and thus its inverse is
+    # given by the reciprocal values. If any uncertainty is zero, the covariance
+    # matrix is singular and we cannot invert it.
+    if np.any(uncertainty == 0.0):
+        weights = np.full(uncertainty.shape, np.nan)
+    else:
+        weights = 1.0 / uncertainty**2
+    return sparse.diags(weights, format="dia")
 
-    :param fsmp: The parametrized FisherModel with a chosen values for the sampled variables.
-    :type fsmp: FisherModelParametrized
-    :param relative_sensitivities: Use relative local sensitivities :math:`s_{ij} = \frac{\partial y_i}{\partial p_j} \frac{p_j}{y_i}` instead of absolute. Defaults to False.
-    :type relative_sensitivities: bool, optional
 
-    :return: The sensitivity matrix S, the cobvariance matrix C, the object of type FisherResultSingle with ODEs solutions.
-    :rtype: np.ndarray, np.ndarray, FisherResultSingle
-    """   
-    # Helper variables
+def _prepare_single_condition(fsmp: FisherModelParametrized, condition, n_x0: int, n_p: int):
+    # Unpack the experimental condition which should be solved
+    (i_x0, x0), (i_t0, t0), index = condition
+
+    # pick one pair of input values
+    Q = [fsmp.inputs[i][j] for i, j in enumerate(index)]
+    # Check if identical times are being used
+    if fsmp.identical_times==True:
+        t = fsmp.times
+    else:
+        t = fsmp.times[index]
+
+    # solve_ivp cannot cope with repeating values.
+    # Thus we will filter for them and in post multiply them again
+    t_red, counts = np.unique(t, return_counts=True)
+
+    # Define initial values for ode
+    # The sensitivities with respect to the initial values start with the identity matrix
+    if callable(fsmp.ode_dfdx0):
+        x0_full = np.concatenate((x0, np.zeros(n_x0 * n_p), np.eye(n_x0).ravel()))
+    else:
+        x0_full = np.concatenate((x0, np.zeros(n_x0 * n_p)))
+    return Q, t, t_red, counts, x0_full
+
+
+def _process_single_condition(fsmp: FisherModelParametrized, condition, Q, t, t_red, counts, res, n_x0: int, n_p: int, n_p_full: int, n_obs: int, calculate_covar: bool, relative_sensitivities=False, **kwargs):
+    (i_x0, x0), (i_t0, t0), index = condition
+
+    # Obtain sensitivities dg/dp from the last components of the ode
+    # Check if t_red is made up of only initial values
+
+    # If time values were only made up of initial time,
+    # we simply set everything to zero, since these are the initial values for the sensitivities
+    if np.all(t_red == t0):
+        s = np.zeros((n_p_full, n_x0, t_red.size))
+    else:
+        r = np.array(res.y[n_x0:])
+        s = r[:n_x0*n_p].reshape((n_x0, n_p, -1))
+        if callable(fsmp.ode_dfdx0):
+            s = np.concatenate((s, r[n_x0*n_p:].reshape((n_x0, n_x0, -1))), axis=1)
+        s = np.swapaxes(s, 0, 1)
+
+    # If the observable was specified we will transform the result with
+    # dgdp = dgdp + dxdp * dgdx
+    x = res.y[:n_x0].reshape((n_x0, -1))
+    with _stage("observable"):
+        s, obs = _calculate_sensitivities_with_observable(fsmp, t_red, x, s, Q, n_x0, n_obs, n_p, relative_sensitivities, **kwargs)
+
+    # Multiply the values again to obtain desired shape for sensitivity matrix
+    s = np.repeat(s, counts, axis=2)
+    obs = np.repeat(obs, counts, axis=1)
+
+    # Define constants for covariance calculation
+    uncertainty = None
+    if calculate_covar:
+        c_abs = 0.0 if fsmp.covariance.abs is None else fsmp.covariance.abs
+        c_rel = 0.0 if fsmp.covariance.rel is None else fsmp.covariance.rel
+
+    # Calculate the S-Matrix from the sensitivities
+    # Depending on if we want to calculate the relative sensitivities
+    if relative_sensitivities==True:
+        # Multiply by parameter
+        if callable(fsmp.ode_dfdx0):
+            params = fsmp.parameters + (*fsmp.ode_x0[0],)
+        else:
+            params = fsmp.parameters
+        for i, p in enumerate(params):
+            s[i] *= p
+
+        # Divide by observable
+        for i, o in enumerate(obs):
+            s[(slice(None), i)] /= o
+
+        # Calculate the uncertainty
+        if calculate_covar:
+            uncertainty = c_rel + c_abs/obs
+    else:
+        # Calculate the uncertainty
+        if calculate_covar:
+            uncertainty = c_rel*obs + c_abs
+
+    # Assume that the error of the measurement is 25% from the measured value r[0] n 
+    # (use for covariance matrix calculation)
+    fsrs = FisherResultSingle(
+        ode_x0=x0,
+        ode_t0=t0,
+        times=t,
+        inputs=Q,
+        parameters=fsmp.parameters,
+        ode_args=fsmp.ode_args,
+        ode_solution=res,
+        sensitivities=s,
+        identical_times=fsmp.identical_times,
+        observables = obs
+    )
+    return s, uncertainty, fsrs
+
+
+def _condition_rhs(fsmp: FisherModelParametrized, Q, n_x0: int, n_p: int, solver_options: SolverOptions=SolverOptions()) -> OdeRhs:
+    inputs, parameters, ode_args = Q, fsmp.parameters, fsmp.ode_args
+    ode_rhs_fused = fsmp.ode_rhs_fused
+    if _use_ode_jit(fsmp):
+        # The whole right-hand side is evaluated by a single compiled function
+        ode_rhs_fused = jit_ode_rhs(fsmp.ode_fun, fsmp.ode_dfdx, fsmp.ode_dfdp, fsmp.ode_dfdx0, n_x0, n_p)
+        inputs, parameters, ode_args = _jit_arguments(Q, fsmp.parameters, fsmp.ode_args)
+    return OdeRhs(fsmp.ode_fun, fsmp.ode_dfdx, fsmp.ode_dfdp, fsmp.ode_dfdx0, inputs, parameters, ode_args, n_x0, n_p, jacobian=solver_options.jacobian, sparse_jacobian=solver_options.sparse_jacobian, ode_rhs_fused=ode_rhs_fused)
+
+
+def _solve_dense_cached(fsmp: FisherModelParametrized, x0, t0, Q, t_red, t_max, x0_full, n_x0: int, n_p: int, solver_options: SolverOptions, solution_cache: SolutionCache):
+    key = _solution_cache_key(fsmp, x0, t0, Q, solver_options)
+    res_dense = solution_cache.get(key, t_max)
+    if res_dense is None:
+        # Integrate up to the largest time which can be chosen such that
+        # later candidates with different times can be served from the cache.
+        t_end = max(t_max, fsmp.times_def.ub) if fsmp.times_def is not None else t_max
+        rhs = _condition_rhs(fsmp, Q, n_x0, n_p, solver_options)
+        args = solver_options.solve_ivp_args(rhs)
+        args["dense_output"] = True
+        with _stage("ode_integration"):
+            res_dense = integrate.solve_ivp(fun=rhs, t_span=(t0, t_end), y0=x0_full, **args)
+        _count_ode_solve(res_dense)
+        if res_dense.success:
+            solution_cache.put(key, res_dense)
+        nfev, njev, nlu = res_dense.nfev, res_dense.njev, res_dense.nlu
+    else:
+        nfev, njev, nlu = 0, 0, 0
+
+    # Evaluate the interpolant at the desired times
+    return OptimizeResult(
+        t=t_red,
+        y=res_dense.sol(t_red),
+        sol=res_dense.sol,
+        t_events=None,
+        y_events=None,
+        nfev=nfev,
+        njev=njev,
+        nlu=nlu,
+        status=res_dense.status,
+        message=res_dense.message,
+        success=res_dense.success,
+    )
+
+
+def _solve_condition(fsmp: FisherModelParametrized, condition, n_x0: int, n_p: int, solver_options: SolverOptions, solution_cache: SolutionCache=None):
+    (i_x0, x0), (i_t0, t0), index = condition
+    Q, t, t_red, counts, x0_full = _prepare_single_condition(fsmp, condition, n_x0, n_p)
+
+    # Make sure that the t_span interval is actually not empty (only for python 3.7)
+    t_max = np.max(t) if np.max(t)>t0 else t0+1e-30
+
+    # Actually solve the ODE for the selected parameter values
+    if solution_cache is not None:
+        res = _solve_dense_cached(fsmp, x0, t0, Q, t_red, t_max, x0_full, n_x0, n_p, solver_options, solution_cache)
+    else:
+        rhs = _condition_rhs(fsmp, Q, n_x0, n_p, solver_options)
+        with _stage("ode_integration"):
+            res = integrate.solve_ivp(fun=rhs, t_span=(t0, t_max), y0=x0_full, t_eval=t_red, **solver_options.solve_ivp_args(rhs))
+        _count_ode_solve(res)
+    return Q, t, t_red, counts, res
+
+
+def _solve_single_condition(fsmp: FisherModelParametrized, condition, n_x0: int, n_p: int, n_p_full: int, n_obs: int, calculate_covar: bool, relative_sensitivities=False, solver_options: SolverOptions=SolverOptions(), solution_cache: SolutionCache=None, **kwargs):
+    Q, t, t_red, counts, res = _solve_condition(fsmp, condition, n_x0, n_p, solver_options, solution_cache)
+    return _process_single_condition(fsmp, condition, Q, t, t_red, counts, res, n_x0, n_p, n_p_full, n_obs, calculate_covar, relative_sensitivities, **kwargs)
+
+
+def _stacked_array(values, shape: tuple, n_c: int) -> np.ndarray:
+    # Convert the result of a vectorized user function to an array of shape (*shape, n_c).
+    # Entries which do not depend on the condition (eg. constants) are broadcasted.
+    try:
+        arr = np.asarray(values, dtype=float)
+        if arr.size == np.prod(shape) * n_c:
+            return arr.reshape(shape + (n_c,))
+        elif arr.size == np.prod(shape):
+            return np.repeat(arr.reshape(shape + (1,)), n_c, axis=-1)
+    except ValueError:
+        # Nested lists mixing scalars and arrays can not be converted directly
+        pass
+    out = np.empty(shape + (n_c,))
+    out.reshape((-1, n_c))[:] = list(_stacked_leaves(values, n_c))
+    return out
+
+
+def _stacked_leaves(values, n_c: int):
+    if isinstance(values, (list, tuple)) or (isinstance(values, np.ndarray) and values.ndim > 1) or (isinstance(values, np.ndarray) and values.ndim == 1 and values.size != n_c):
+        for v in values:
+            yield from _stacked_leaves(v, n_c)
+    else:
+        yield np.broadcast_to(np.asarray(values, dtype=float), (n_c,))
+
+
+def ode_rhs_stacked(t, y, ode_fun, ode_dfdx, ode_dfdp, ode_dfdx0, inputs, parameters, ode_args, n_x, n_p, n_c, vectorized=False):
+    r"""Calculate the right-hand side of the ODEs system of many experimental conditions which are stacked into one block system.
+    Every block contains the state variables :math:`x` and the local sensitivities :math:`s` of one condition, identical to :py:meth:`ode_rhs`.
+
+    :param t: The measurement times :math:`t`.
+    :type t: np.ndarray
+    :param y: The array containing the state variables and sensitivities of all conditions one block after another.
+    :type y: np.ndarray
+    :param ode_fun: The ODEs right-hand side function :math:`f` for the state variables :math:`x`.
+    :type ode_fun: callable
+    :param ode_dfdx: The derivative of the ODEs function with respect to state variables :math:`x`.
+    :type ode_dfdx: callable
+    :param ode_dfdp: The derivative of the ODEs function with respect to parameters :math:`p`.
+    :type ode_dfdp: callable
+    :param inputs: The inputs of the system. Every entry is an array containing the input values of all conditions.
+    :type inputs: list
+    :param parameters: The estimated parameters of the system :math:`p`.
+    :type params: tuple
+    :param ode_args: The ode_args of the system :math:`c`.
+    :type ode_args: tuple
+    :param n_x: The number of the state variables of the system.
+    :type n_x: int
+    :param n_p: The number of the estimated parameters of the system.
+    :type n_p: int
+    :param n_c: The number of stacked conditions.
+    :type n_c: int
+    :param vectorized: If True, the user functions are called once with state variables of shape (n_x, n_c) and the input arrays of all conditions.
+        They need to return arrays with the condition as the last axis. Otherwise they are called once for every condition.
+    :type vectorized: bool, optional
+
+    :return: The right-hand side of the stacked ODEs system for sensitivities calculation.
+    :rtype: np.ndarray
+    """
+    Y = y.reshape((n_c, -1))
+    x_fun = Y[:, :n_x].T
+    s = Y[:, n_x:n_x + n_x*n_p].reshape((n_c, n_x, n_p))
+
+    if vectorized:
+        dx_f = _stacked_array(ode_fun(t, x_fun, inputs, parameters, ode_args), (n_x,), n_c)
+        dfdx = _stacked_array(ode_dfdx(t, x_fun, inputs, parameters, ode_args), (n_x, n_x), n_c)
+        dfdp = _stacked_array(ode_dfdp(t, x_fun, inputs, parameters, ode_args), (n_x, n_p), n_c)
+        if callable(ode_dfdx0):
+            dfdx0 = _stacked_array(ode_dfdx0(t, x_fun, inputs, parameters, ode_args), (n_x, n_x), n_c)
+    else:
+        dx_f = np.empty((n_x, n_c))
+        dfdx = np.empty((n_x, n_x, n_c))
+        dfdp = np.empty((n_x, n_p, n_c))
+        if callable(ode_dfdx0):
+            dfdx0 = np.empty((n_x, n_x, n_c))
+        for c in range(n_c):
+            Q = [q[c] for q in inputs]
+            dx_f[:, c] = np.asarray(ode_fun(t, x_fun[:, c], Q, parameters, ode_args), dtype=float).reshape((n_x))
+            dfdx[..., c] = np.asarray(ode_dfdx(t, x_fun[:, c], Q, parameters, ode_args), dtype=float).reshape((n_x, n_x))
+            dfdp[..., c] = np.asarray(ode_dfdp(t, x_fun[:, c], Q, parameters, ode_args), dtype=float).reshape((n_x, n_p))
+            if callable(ode_dfdx0):
+                dfdx0[..., c] = np.asarray(ode_dfdx0(t, x_fun[:, c], Q, parameters, ode_args), dtype=float).reshape((n_x, n_x))
+
+    # Calculate the rhs of the sensitivities for all conditions at once
+    ds = np.einsum("ijc,cjk->cik", dfdx, s) + np.moveaxis(dfdp, -1, 0)
+    blocks = [dx_f.T, ds.reshape((n_c, -1))]
+    if callable(ode_dfdx0):
+        s_x0 = Y[:, n_x + n_x*n_p:].reshape((n_c, n_x, -1))
+        ds_x0 = np.einsum("ijc,cjk->cik", dfdx, s_x0) + np.moveaxis(dfdx0, -1, 0)
+        blocks.append(ds_x0.reshape((n_c, -1)))
+    return np.concatenate(blocks, axis=1).ravel()
+
+
+def _solve_conditions_stacked(fsmp: FisherModelParametrized, conditions: list, n_x0: int, n_p: int, n_p_full: int, n_obs: int, calculate_covar: bool, relative_sensitivities=False, solver_options: SolverOptions=SolverOptions(), **kwargs):
+    results = [None] * len(conditions)
+
+    # Conditions can only be integrated together if they start at the same initial time
+    for i_t0, t0 in enumerate(fsmp.ode_t0):
+        positions = [i for i, cond in enumerate(conditions) if cond[1][0] == i_t0]
+        prepared = [_prepare_single_condition(fsmp, conditions[i], n_x0, n_p) for i in positions]
+        n_c = len(positions)
+
+        # Evaluate the stacked system at the union of all desired time points
+        t_all = np.unique(np.concatenate([t_red for _, _, t_red, _, _ in prepared]))
+        y0 = np.concatenate([x0_full for _, _, _, _, x0_full in prepared])
+        inputs = [np.array([Q[i] for Q, _, _, _, _ in prepared]) for i in range(len(fsmp.inputs))]
+
+        # Make sure that the t_span interval is actually not empty (only for python 3.7)
+        t_max = np.max(t_all) if np.max(t_all)>t0 else t0+1e-30
+
+        with _stage("ode_integration"):
+            res = integrate.solve_ivp(fun=ode_rhs_stacked, t_span=(t0, t_max), y0=y0, t_eval=t_all, args=(fsmp.ode_fun, fsmp.ode_dfdx, fsmp.ode_dfdp, fsmp.ode_dfdx0, inputs, fsmp.parameters, fsmp.ode_args, n_x0, n_p, n_c, fsmp.ode_vectorized), **solver_options.solve_ivp_args())
+        _count_ode_solve(res)
+        n_full = y0.size // n_c
+
+        for c, (i, (Q, t, t_red, counts, _)) in enumerate(zip(positions, prepared)):
+            # Pick the block of this condition at its own time points
+            t_index = np.searchsorted(t_all, t_red)
+            res_c = OptimizeResult(
+                t=t_red,
+                y=res.y[c*n_full:(c+1)*n_full, t_index],
+                sol=res.sol,
+                t_events=None,
+                y_events=None,
+                nfev=res.nfev,
+                njev=res.njev,
+                nlu=res.nlu,
+                status=res.status,
+                message=res.message,
+                success=res.success,
+            )
+            results[i] = _process_single_condition(fsmp, conditions[i], Q, t, t_red, counts, res_c, n_x0, n_p, n_p_full, n_obs, calculate_covar, relative_sensitivities, **kwargs)
+    return results
+
+
+SOLVER_MODES = ["serial", "threads", "processes", "stacked"]
+
+
+# Process pools of the "processes" solver mode by their number of workers.
+# Starting the worker processes is expensive compared to a single evaluation of the model.
+# Thus they are created once per process and reused for all evaluations (eg. within an optimization).
+_PROCESS_POOLS = {}
+
+
+def _process_pool(n_workers=None) -> ProcessPoolExecutor:
+    pid, executor = _PROCESS_POOLS.get(n_workers, (None, None))
+    # Pools inherited from a parent process can not be used
+    if executor is None or pid != os.getpid():
+        executor = ProcessPoolExecutor(max_workers=n_workers)
+        _PROCESS_POOLS[n_workers] = (os.getpid(), executor)
+    return executor
+
+
+@atexit.register
+def _shutdown_process_pools():
+    for pid, executor in _PROCESS_POOLS.values():
+        if pid == os.getpid():
+            executor.shutdown(wait=True)
+    _PROCESS_POOLS.clear()
+
+
+def _map_conditions(fun, conditions: list, solver_mode="serial", n_workers=None):
+    # Executors which were supplied by the user are not shut down after usage
+    # such that they can be reused for many evaluations.
+    if isinstance(solver_mode, Executor):
+        results = []
+        for value, _, profile in solver_mode.map(_WorkerCall(fun), conditions):
+            _merge_profile(profile)
+            results.append(value)
+        return results
+    elif solver_mode == "serial":
+        return [fun(cond) for cond in conditions]
+    elif solver_mode == "threads":
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            return list(executor.map(fun, conditions))
+    elif solver_mode == "processes":
+        executor = _process_pool(n_workers)
+        # Send multiple conditions at once to every process to reduce the pickling overhead
+        chunksize = max(1, len(conditions) // (4 * (n_workers or os.cpu_count() or 1)))
+        results = []
+        try:
+            for value, _, profile in executor.map(_WorkerCall(fun), conditions, chunksize=chunksize):
+                _merge_profile(profile)
+                results.append(value)
+        except BrokenProcessPool:
+            # Start a new pool at the next evaluation
+            _PROCESS_POOLS.pop(n_workers, None)
+            raise
+        return results
+    else:
+        raise ValueError("Unknown solver_mode {}. Please specify one of {} or an instance of concurrent.futures.Executor.".format(solver_mode, SOLVER_MODES))
+
+
+def _model_dimensions(fsmp: FisherModelParametrized):
     # How many initial times do we have?
     n_t0 = len(fsmp.ode_t0)
     # How large is the vector of one initial value? (ie. dimensionality of the ODE)
@@ -138,126 +630,113 @@ def get_S_matrix(fsmp: FisherModelParametrized, relative_sensitivities=False, **
         n_obs = np.array(fsmp.obs_fun(fsmp.ode_t0[0], fsmp.ode_x0[0], [q[0] for q in fsmp.inputs], fsmp.parameters, fsmp.ode_args)).size
     else:
         n_obs = n_x0
+    return n_t0, n_x0, n_p, n_p_full, N_x0, inputs_shape, n_obs
 
-    # The shape of the initial S matrix is given by
-    # (n_p, n_t0, n_x0, n_q0, ..., n_ql, n_times)
-    S = np.zeros((n_p_full, n_t0, N_x0, n_obs) + inputs_shape + (fsmp.times.shape[-1],))
-
-    # Do not calculate the covariance any further if both are None
-    calculate_covar = fsmp.covariance.abs is not None or fsmp.covariance.rel is not None
-    if calculate_covar:
-        uncertainty = np.zeros((n_t0, N_x0, n_obs) + inputs_shape + (fsmp.times.shape[-1],))
 
-    # Iterate over all combinations of input-Values and initial values
-    solutions = []
-    for (i_x0, x0), (i_t0, t0), index in itertools.product(
+def _experimental_conditions(fsmp: FisherModelParametrized):
+    # Gather all combinations of input-Values and initial values
+    return list(itertools.product(
         enumerate(fsmp.ode_x0),
         enumerate(fsmp.ode_t0),
         itertools.product(*[range(len(q)) for q in fsmp.inputs])
-    ):
-        # pick one pair of input values
-        Q = [fsmp.inputs[i][j] for i, j in enumerate(index)]
-        # Check if identical times are being used
-        if fsmp.identical_times==True:
-            t = fsmp.times
-        else:
-            t = fsmp.times[index]
-        
-        # solve_ivp cannot cope with repeating values.
-        # Thus we will filter for them and in post multiply them again
-        t_red, counts = np.unique(t, return_counts=True)
+    ))
 
-        # Define initial values for ode
-        if callable(fsmp.ode_dfdx0):
-            x0_full = np.concatenate((x0, np.zeros(n_x0 * n_p), np.ones(n_x0)))
-        else:
-            x0_full = np.concatenate((x0, np.zeros(n_x0 * n_p)))
 
-        # Make sure that the t_span interval is actually not empty (only for python 3.7)
-        t_max = np.max(t) if np.max(t)>t0 else t0+1e-30
+def get_S_matrix(fsmp: FisherModelParametrized, relative_sensitivities=False, solver_mode="serial", n_workers=None, solver_options=None, solution_cache: SolutionCache=None, **kwargs):
+    r"""Calculate the sensitivity matrix for a Fisher Model.
+
+    :param fsmp: The parametrized FisherModel with a chosen values for the sampled variables.
+    :type fsmp: FisherModelParametrized
+    :param relative_sensitivities: Use relative local sensitivities :math:`s_{ij} = \frac{\partial y_i}{\partial p_j} \frac{p_j}{y_i}` instead of absolute. Defaults to False.
+    :type relative_sensitivities: bool, optional
+    :param solver_mode: Choose how the ODEs for the individual experimental conditions (initial values, initial times and inputs) are solved. Defaults to "serial".
 
-        # Actually solve the ODE for the selected parameter values
-        res = integrate.solve_ivp(fun=ode_rhs, t_span=(t0, t_max), y0=x0_full, t_eval=t_red, args=(fsmp.ode_fun, fsmp.ode_dfdx, fsmp.ode_dfdp, fsmp.ode_dfdx0, Q, fsmp.parameters, fsmp.ode_args, n_x0, n_p), method="LSODA", rtol=1e-4)
-        # Obtain sensitivities dg/dp from the last components of the ode
-        # Check if t_red is made up of only initial values
+        - "serial"
+            Solve one condition after the other.
+        - "threads"
+            Solve the conditions concurrently in a ``concurrent.futures.ThreadPoolExecutor``.
+        - "processes"
+            Solve the conditions concurrently in a ``concurrent.futures.ProcessPoolExecutor``.
+            The pool is started at the first evaluation and reused by all later ones until the interpreter exits.
+            All user-defined functions need to be picklable.
+            This mode can not be used from within the worker processes of an optimization routine (eg. ``workers=-1``).
+        - "stacked"
+            Integrate all conditions which share the same initial time as one block system with :py:meth:`ode_rhs_stacked`.
+            This amortizes the overhead of the integrator across conditions.
+            If the model was defined with ``ode_vectorized=True``, the user functions are evaluated once for all conditions.
+        - ``concurrent.futures.Executor``
+            Use the supplied executor. It will not be shut down such that it can be reused across many evaluations.
 
-        # If time values were only made up of initial time,
-        # we simply set everything to zero, since these are the initial values for the sensitivities
-        if np.all(t_red == t0):
-            s = np.zeros((n_p_full, n_x0, counts[0]))
-        else:
-            r = np.array(res.y[n_x0:])
-            s = np.swapaxes(r.reshape((n_x0, n_p_full, -1)), 0, 1)
+    :type solver_mode: str, concurrent.futures.Executor, optional
+    :param n_workers: The maximum number of workers used by the "threads" and "processes" modes. Defaults to None (chosen by the executor).
+    :type n_workers: int, optional
+    :param solver_options: The integration method, tolerances and Jacobian used to solve the ODEs. See :py:class:`SolverOptions` for all options. Defaults to None (default options).
+    :type solver_options: SolverOptions, dict, optional
+    :param solution_cache: Store the dense solution of every condition and reuse it if only the times change. The solutions are not cached in the "stacked" solver mode. Defaults to None (no caching).
+    :type solution_cache: SolutionCache, optional
 
-        # If the observable was specified we will transform the result with
-        # dgdp = dgdp + dxdp * dgdx
-        x = res.y[:n_x0].reshape((n_x0, -1))
-        s, obs = _calculate_sensitivities_with_observable(fsmp, t_red, x, s, Q, n_x0, n_obs, n_p, relative_sensitivities, **kwargs)
+    The sensitivities of the observable are obtained from the states by the chain rule at all measurement times at once.
+    If the model was defined with ``obs_vectorized=True``, the functions ``obs_fun``, ``obs_dgdx``, ``obs_dgdp`` and ``obs_dgdx0`` are called once per condition
+    with an array of times of shape (n_t,) and the states of shape (n_x, n_t). They need to return arrays with the time as last axis.
+    Entries which do not depend on the time may be constants. Otherwise the functions are called once for every time point.
 
-        # Multiply the values again to obtain desired shape for sensitivity matrix
-        s = np.repeat(s, counts, axis=2)
-        obs = np.repeat(obs, counts, axis=1)
+    If the model was defined with ``ode_jit=True`` or all of ``ode_fun``, ``ode_dfdx`` and ``ode_dfdp`` are numba dispatchers, the right-hand side of the
+    states and sensitivities is compiled into a single function with :py:meth:`jit_ode_rhs` (not used in the "stacked" solver mode).
+    Likewise ``obs_jit=True`` evaluates the observable at all time points with :py:meth:`jit_observable`. Both options require numba.
+
+    :return: The sensitivity matrix S, the inverse covariance matrix C (stored as a sparse diagonal matrix), the object of type FisherResultSingle with ODEs solutions.
+    :rtype: np.ndarray, scipy.sparse.dia_matrix, FisherResultSingle
+    """
+    n_t0, n_x0, n_p, n_p_full, N_x0, inputs_shape, n_obs = _model_dimensions(fsmp)
+
+    # The shape of the initial S matrix is given by
+    # (n_p, n_t0, n_x0, n_q0, ..., n_ql, n_times)
+    S = np.zeros((n_p_full, n_t0, N_x0, n_obs) + inputs_shape + (fsmp.times.shape[-1],))
+
+    # Do not calculate the covariance any further if both are None
+    calculate_covar = fsmp.covariance.abs is not None or fsmp.covariance.rel is not None
+    if calculate_covar:
+        uncertainty = np.zeros((n_t0, N_x0, n_obs) + inputs_shape + (fsmp.times.shape[-1],))
+
+    solver_options = get_solver_options(solver_options)
+
+    conditions = _experimental_conditions(fsmp)
+    solve = functools.partial(
+        _solve_single_condition,
+        fsmp,
+        n_x0=n_x0,
+        n_p=n_p,
+        n_p_full=n_p_full,
+        n_obs=n_obs,
+        calculate_covar=calculate_covar,
+        relative_sensitivities=relative_sensitivities,
+        solver_options=solver_options,
+        solution_cache=solution_cache,
+        **kwargs
+    )
 
-        # Define constants for covariance calculation
+    # Solve all conditions and fill the results in the order of the conditions
+    if isinstance(solver_mode, str) and solver_mode == "stacked":
+        results = _solve_conditions_stacked(fsmp, conditions, n_x0, n_p, n_p_full, n_obs, calculate_covar, relative_sensitivities, solver_options, **kwargs)
+    else:
+        results = _map_conditions(solve, conditions, solver_mode, n_workers)
+    solutions = []
+    for ((i_x0, _), (i_t0, _), index), (s, unc, fsrs) in zip(conditions, results):
+        # Fill S-Matrix
+        S[(slice(None), i_t0, i_x0, slice(None)) + index] = s
         if calculate_covar:
-            c_abs = 0.0 if fsmp.covariance.abs is None else fsmp.covariance.abs
-            c_rel = 0.0 if fsmp.covariance.rel is None else fsmp.covariance.rel
-
-        # Calculate the S-Matrix from the sensitivities
-        # Depending on if we want to calculate the relative sensitivities
-        if relative_sensitivities==True:
-            # Multiply by parameter
-            if callable(fsmp.ode_dfdx0):
-                params = fsmp.parameters + (*fsmp.ode_x0[0],)
-            else:
-                params = fsmp.parameters
-            for i, p in enumerate(params):
-                s[i] *= p
-
-            # Divide by observable
-            for i, o in enumerate(obs):
-                s[(slice(None), i)] /= o
-
-            # Fill S-Matrix
-            S[(slice(None), i_t0, i_x0, slice(None)) + index] = s
-
-            # Calculate the uncertainty
-            if calculate_covar:
-                uncertainty[(i_t0, i_x0, slice(None)) + index] = c_rel + c_abs/obs
-        else:
-            S[(slice(None), i_t0, i_x0, slice(None)) + index] = s
-
-            # Calculate the uncertainty
-            if calculate_covar:
-                uncertainty[(i_t0, i_x0, slice(None)) + index] = c_rel*obs + c_abs
-
-        # Assume that the error of the measurement is 25% from the measured value r[0] n 
-        # (use for covariance matrix calculation)
-        fsrs = FisherResultSingle(
-            ode_x0=x0,
-            ode_t0=t0,
-            times=t,
-            inputs=Q,
-            parameters=fsmp.parameters,
-            ode_args=fsmp.ode_args,
-            ode_solution=res,
-            sensitivities=s,
-            identical_times=fsmp.identical_times,
-            observables = obs
-        )
+            uncertainty[(i_t0, i_x0, slice(None)) + index] = unc
         solutions.append(fsrs)
-    
-    # Calculate the covariance matrix
+
+    # Calculate the inverse covariance matrix
+    # The measurement errors are independent such that the matrix is diagonal.
+    # We store it as a sparse matrix to avoid allocating (and inverting) a dense N x N matrix.
     if calculate_covar==True:
-        uncertainty = uncertainty.flatten()
-        cov_matrix = np.eye(len(uncertainty), len(uncertainty)) * uncertainty**2
-        try:
-            C = np.linalg.inv(cov_matrix)
-        except:
-            C = np.full((len(uncertainty), len(uncertainty)), np.nan)
+        with _stage("covariance"):
+            C = _inverse_covariance_diagonal(uncertainty.flatten())
     else:
         n_datapoints = np.prod(S.shape[1:])
-        C = np.eye(n_datapoints)
+        C = sparse.identity(n_datapoints, format="dia")
 
     # Reshape to 2D Form (len(P),:)
     S = S.reshape((n_p_full,-1))
@@ -265,7 +744,7 @@ def get_S_matrix(fsmp: FisherModelParametrized, relative_sensitivities=False, **
     return S, C, solutions
 
 
-def calculate_fisher_criterion(fsmp: FisherModelParametrized, criterion=fisher_determinant, relative_sensitivities=False, verbose=False):
+def calculate_fisher_criterion(fsmp: FisherModelParametrized, criterion=fisher_determinant, relative_sensitivities=False, verbose=False, solver_mode="serial", n_workers=None, solver_options=None, solution_cache=None):
     """Calculate the Fisher information optimality criterion for a chosen Fisher model.
 
     :param fsmp: The parametrized FisherModel with a chosen values for the sampled variables.
@@ -273,6 +752,8 @@ def calculate_fisher_criterion(fsmp: FisherModelParametrized, criterion=fisher_d
 
         - fisher_determinant
             Use the D-optimality criterion that maximizes the determinant of the Fisher Information matrix.
+        - fisher_logdeterminant
+            Use the D-optimality criterion in logarithmic form. The value does not over- or underflow for large systems.
         - fisher_mineigenval
             Use the E-optimality criterion that maximizes the minimal eigenvalue of the Fisher Information matrix.
         - fisher_sumeigenval
@@ -284,22 +765,270 @@ def calculate_fisher_criterion(fsmp: FisherModelParametrized, criterion=fisher_d
     :type fsmp: FisherModelParametrized
     :param relative_sensitivities: Use relative local sensitivities :math:`s_{ij} = \dfrac{\partial y_i}{\partial p_j} \dfrac{p_j}{y_i}` instead of absolute. Defaults to False.
     :type relative_sensitivities: bool, optional
+    :param solver_mode: Choose how the ODEs of the individual experimental conditions are solved. See :py:meth:`get_S_matrix` for all available modes. Defaults to "serial".
+    :type solver_mode: str, concurrent.futures.Executor, optional
+    :param n_workers: The maximum number of workers when solving in parallel. Defaults to None.
+    :type n_workers: int, optional
+    :param solver_options: The options of the numerical integration. See :py:class:`SolverOptions` for all options. Defaults to None (default options).
+    :type solver_options: SolverOptions, dict, optional
+    :param solution_cache: Reuse the dense solutions of conditions which were already solved. See :py:class:`SolutionCache`. Defaults to None.
+    :type solution_cache: SolutionCache, optional
 
     :return: The result of the Fisher information optimality criterion represented as a FisherResults object.
     :rtype: FisherResults
     """
-    S, C, solutions = get_S_matrix(fsmp, relative_sensitivities)
-    crit = criterion(fsmp, S, C)
+    with _stage("sensitivities"):
+        S, C, solutions = get_S_matrix(fsmp, relative_sensitivities, solver_mode=solver_mode, n_workers=n_workers, solver_options=solver_options, solution_cache=solution_cache)
+    with _stage("criterion"):
+        crit = criterion(fsmp, S, C)
 
     fsmp_args = {key:value for key, value in fsmp.__dict__.items() if not key.startswith('_')}
 
-    fsr = FisherResults(
-        criterion=crit,
-        S=S,
-        C=C,
-        individual_results=solutions,
-        criterion_fun=criterion,
-        relative_sensitivities=relative_sensitivities,
-        **fsmp_args,
-    )
+    with _stage("validation"):
+        fsr = FisherResults(
+            criterion=crit,
+            S=S,
+            C=C,
+            individual_results=solutions,
+            criterion_fun=criterion,
+            relative_sensitivities=relative_sensitivities,
+            **fsmp_args,
+        )
     return fsr
+
+
+def get_S_matrix_population(fsmp: FisherModelParametrized, times_population, relative_sensitivities=False, solver_options=None, solution_cache: SolutionCache=None, **kwargs):
+    r"""Calculate the sensitivity matrices for many candidate sets of evaluation times at once.
+
+    Every experimental condition is integrated only once with dense output over the interval from its initial time
+    up to the largest candidate time (or the upper bound of the sampled times if they are defined by a :py:class:`VariableDefinition`).
+    States and sensitivities at the candidate times are obtained by evaluating the interpolant for all candidates in one call.
+    This turns the cost of one candidate from solving the ODEs into an array lookup and is used to evaluate the population of
+    ``scipy.optimize.differential_evolution`` when only the times are optimized.
+
+    :param fsmp: The parametrized FisherModel. All variables except the times are fixed.
+    :type fsmp: FisherModelParametrized
+    :param times_population: The candidate times with shape ``(n_candidates, *fsmp.times.shape)``.
+    :type times_population: np.ndarray
+    :param relative_sensitivities: Use relative local sensitivities instead of absolute. Defaults to False.
+    :type relative_sensitivities: bool, optional
+    :param solver_options: The options of the numerical integration. See :py:class:`SolverOptions`. Defaults to None (default options).
+    :type solver_options: SolverOptions, dict, optional
+    :param solution_cache: Keep the dense solutions across calls. Defaults to None (the solutions are discarded after this call).
+    :type solution_cache: SolutionCache, optional
+
+    :return: One pair of sensitivity matrix S and inverse covariance matrix C for every candidate.
+    :rtype: list
+    """
+    n_t0, n_x0, n_p, n_p_full, N_x0, inputs_shape, n_obs = _model_dimensions(fsmp)
+    conditions = _experimental_conditions(fsmp)
+    solver_options = get_solver_options(solver_options)
+    if solution_cache is None:
+        solution_cache = SolutionCache(maxsize=len(conditions))
+
+    times_population = np.asarray(times_population, dtype=float)
+    n_cand = times_population.shape[0]
+    n_times = times_population.shape[-1]
+
+    S = np.zeros((n_cand, n_p_full, n_t0, N_x0, n_obs) + inputs_shape + (n_times,))
+    calculate_covar = fsmp.covariance.abs is not None or fsmp.covariance.rel is not None
+    if calculate_covar:
+        uncertainty = np.zeros((n_cand, n_t0, N_x0, n_obs) + inputs_shape + (n_times,))
+
+    for condition in conditions:
+        (i_x0, x0), (i_t0, t0), index = condition
+        Q, _, _, _, x0_full = _prepare_single_condition(fsmp, condition, n_x0, n_p)
+
+        # Gather the times of all candidates for this condition with shape (n_cand, n_times)
+        if fsmp.identical_times==True:
+            t_cand = times_population
+        else:
+            t_cand = times_population[(slice(None),) + index]
+        t_red, inverse = np.unique(t_cand.ravel(), return_inverse=True)
+        inverse = inverse.reshape(t_cand.shape)
+
+        # Make sure that the t_span interval is actually not empty (only for python 3.7)
+        t_max = np.max(t_red) if np.max(t_red)>t0 else t0+1e-30
+
+        # Evaluate the interpolant once at the union of all candidate times
+        res = _solve_dense_cached(fsmp, x0, t0, Q, t_red, t_max, x0_full, n_x0, n_p, solver_options, solution_cache)
+        s, unc, _ = _process_single_condition(fsmp, condition, Q, t_red, t_red, np.ones(t_red.size, dtype=int), res, n_x0, n_p, n_p_full, n_obs, calculate_covar, relative_sensitivities, **kwargs)
+
+        # Distribute the values to the individual candidates
+        S[(slice(None), slice(None), i_t0, i_x0, slice(None)) + index] = np.moveaxis(s[..., inverse], 2, 0)
+        if calculate_covar:
+            uncertainty[(slice(None), i_t0, i_x0, slice(None)) + index] = np.moveaxis(unc[..., inverse], 1, 0)
+
+    results = []
+    for c in range(n_cand):
+        if calculate_covar==True:
+            with _stage("covariance"):
+                C = _inverse_covariance_diagonal(uncertainty[c].flatten())
+        else:
+            C = sparse.identity(np.prod(S.shape[2:]), format="dia")
+        results.append((S[c].reshape((n_p_full, -1)), C))
+    return results
+
+
+def calculate_fisher_criterion_population(fsmp: FisherModelParametrized, times_population, criterion=fisher_determinant, relative_sensitivities=False, solver_options=None, solution_cache: SolutionCache=None):
+    """Calculate the Fisher information optimality criterion for many candidate sets of evaluation times.
+    See :py:meth:`get_S_matrix_population` for how the ODEs are solved.
+
+    :param fsmp: The parametrized FisherModel. All variables except the times are fixed.
+    :type fsmp: FisherModelParametrized
+    :param times_population: The candidate times with shape ``(n_candidates, *fsmp.times.shape)``.
+    :type times_population: np.ndarray
+    :param criterion: The optimality criterion. See :py:meth:`calculate_fisher_criterion`. Defaults to fisher_determinant.
+    :type criterion: callable
+    :param relative_sensitivities: Use relative local sensitivities instead of absolute. Defaults to False.
+    :type relative_sensitivities: bool, optional
+    :param solver_options: The options of the numerical integration. See :py:class:`SolverOptions`. Defaults to None (default options).
+    :type solver_options: SolverOptions, dict, optional
+    :param solution_cache: Keep the dense solutions across calls. Defaults to None.
+    :type solution_cache: SolutionCache, optional
+
+    :return: The value of the criterion for every candidate.
+    :rtype: np.ndarray
+    """
+    with _stage("sensitivities"):
+        results = get_S_matrix_population(fsmp, times_population, relative_sensitivities, solver_options=solver_options, solution_cache=solution_cache)
+    with _stage("criterion"):
+        return calculate_fisher_criterion_batch(fsmp, np.array([S for S, _ in results]), [C for _, C in results], criterion)
+
+
+def _time_derivative_single_condition(fsmp: FisherModelParametrized, condition, n_x0: int, n_p: int, n_p_full: int, n_obs: int, calculate_covar: bool, relative_sensitivities=False, solver_options: SolverOptions=SolverOptions(), solution_cache: SolutionCache=None, **kwargs):
+    Q, t, t_red, counts, res = _solve_condition(fsmp, condition, n_x0, n_p, solver_options, solution_cache)
+    s, unc, _ = _process_single_condition(fsmp, condition, Q, t, t_red, counts, res, n_x0, n_p, n_p_full, n_obs, calculate_covar, relative_sensitivities, **kwargs)
+
+    # The time derivatives of the states and sensitivities are given by the right-hand side of the ODEs.
+    # If the values were obtained from a cached dense solution, the interpolant is differentiated instead
+    # such that the derivative is consistent with the values at neighbouring times.
+    y = np.asarray(res.y).reshape((-1, t_red.size))
+    if getattr(res, "sol", None) is not None:
+        h = np.sqrt(np.finfo(float).eps) * np.maximum(1.0, np.abs(t_red))
+        y_dot = (res.sol(t_red + h) - res.sol(t_red - h)) / (2*h)
+    else:
+        rhs = _condition_rhs(fsmp, Q, n_x0, n_p)
+        y_dot = np.array([rhs(ti, y[:, i]) for i, ti in enumerate(t_red)]).T
+
+    # Observables, relative sensitivities and uncertainties are differentiated by central differences
+    # along the exact derivative of the trajectory. No additional solve of the ODEs is needed.
+    # Without observable and relative sensitivities these are linear and the result is exact.
+    h = np.cbrt(np.finfo(float).eps) * np.maximum(1.0, np.abs(t_red))
+    s_h = []
+    unc_h = []
+    for sign in [1.0, -1.0]:
+        res_h = OptimizeResult(t=t_red + sign*h, y=y + sign*h*y_dot)
+        s_i, unc_i, _ = _process_single_condition(fsmp, condition, Q, t, t_red + sign*h, counts, res_h, n_x0, n_p, n_p_full, n_obs, calculate_covar, relative_sensitivities, **kwargs)
+        s_h.append(s_i)
+        unc_h.append(unc_i)
+    h = np.repeat(h, counts)
+    ds = (s_h[0] - s_h[1]) / (2*h)
+    dunc = (unc_h[0] - unc_h[1]) / (2*h) if calculate_covar else None
+    return s, unc, ds, dunc
+
+
+def get_S_matrix_time_derivative(fsmp: FisherModelParametrized, relative_sensitivities=False, solver_options=None, solution_cache: SolutionCache=None, **kwargs):
+    r"""Calculate the sensitivity matrix together with its derivative with respect to the measurement times.
+
+    Every column of the sensitivity matrix belongs to one measurement time.
+    Its derivative is obtained from the right-hand side of the ODEs :math:`\dot s = \frac{\partial f}{\partial x} s + \frac{\partial f}{\partial p}`
+    which is evaluated at the already calculated states and sensitivities.
+    If a ``solution_cache`` is supplied, the values are interpolated from dense solutions and the interpolant is differentiated instead.
+    If an observable or relative sensitivities are used, the chain rule is evaluated by central differences along this derivative.
+    The same is done for the inverse covariance matrix if the uncertainties depend on the observed values.
+
+    :param fsmp: The parametrized FisherModel with a chosen values for the sampled variables.
+    :type fsmp: FisherModelParametrized
+    :param relative_sensitivities: Use relative local sensitivities instead of absolute. Defaults to False.
+    :type relative_sensitivities: bool, optional
+    :param solver_options: The options of the numerical integration. See :py:class:`SolverOptions`. Defaults to None (default options).
+    :type solver_options: SolverOptions, dict, optional
+    :param solution_cache: Reuse the dense solutions of conditions which were already solved. See :py:class:`SolutionCache`. Defaults to None.
+    :type solution_cache: SolutionCache, optional
+
+    :return: The sensitivity matrix S, the inverse covariance matrix C and their derivatives dS and dC with respect to the time of the individual columns.
+    :rtype: np.ndarray, scipy.sparse.dia_matrix, np.ndarray, scipy.sparse.dia_matrix
+    """
+    n_t0, n_x0, n_p, n_p_full, N_x0, inputs_shape, n_obs = _model_dimensions(fsmp)
+    shape = (n_t0, N_x0, n_obs) + inputs_shape + (fsmp.times.shape[-1],)
+    S = np.zeros((n_p_full,) + shape)
+    dS = np.zeros((n_p_full,) + shape)
+
+    calculate_covar = fsmp.covariance.abs is not None or fsmp.covariance.rel is not None
+    if calculate_covar:
+        uncertainty = np.zeros(shape)
+        d_uncertainty = np.zeros(shape)
+
+    solver_options = get_solver_options(solver_options)
+    for condition in _experimental_conditions(fsmp):
+        (i_x0, _), (i_t0, _), index = condition
+        s, unc, ds, dunc = _time_derivative_single_condition(fsmp, condition, n_x0, n_p, n_p_full, n_obs, calculate_covar, relative_sensitivities, solver_options, solution_cache, **kwargs)
+        S[(slice(None), i_t0, i_x0, slice(None)) + index] = s
+        dS[(slice(None), i_t0, i_x0, slice(None)) + index] = ds
+        if calculate_covar:
+            uncertainty[(i_t0, i_x0, slice(None)) + index] = unc
+            d_uncertainty[(i_t0, i_x0, slice(None)) + index] = dunc
+
+    if calculate_covar:
+        with _stage("covariance"):
+            C = _inverse_covariance_diagonal(uncertainty.flatten())
+        # The weights are given by 1/uncertainty**2
+        dC = sparse.diags(-2.0 * C.diagonal() * d_uncertainty.flatten() / uncertainty.flatten(), format="dia")
+    else:
+        C = sparse.identity(np.prod(shape), format="dia")
+        dC = sparse.diags(np.zeros(np.prod(shape)), format="dia")
+    return S.reshape((n_p_full, -1)), C, dS.reshape((n_p_full, -1)), dC
+
+
+def calculate_fisher_criterion_gradient(fsmp: FisherModelParametrized, criterion=fisher_determinant, relative_sensitivities=False, solver_options=None, solution_cache: SolutionCache=None):
+    r"""Calculate the Fisher information optimality criterion and its gradient with respect to the measurement times.
+
+    With the derivative :math:`G` of the criterion with respect to the Fisher matrix (see :py:meth:`calculate_fisher_criterion_matrix_gradient`)
+    the derivative with respect to the time of the data point :math:`k` is given by
+
+    .. math::
+
+        \frac{\partial \Phi}{\partial t_k} = 2 c_k s_k^T G \dot s_k + \dot c_k s_k^T G s_k,
+
+    where :math:`s_k` is the column of the sensitivity matrix and :math:`c_k` the diagonal entry of the inverse covariance matrix.
+    The contributions of all data points measured at the same time are summed up.
+    The times of every experimental condition are expected in ascending order as used by the optimization routines.
+
+    :param fsmp: The parametrized FisherModel with a chosen values for the sampled variables.
+    :type fsmp: FisherModelParametrized
+    :param criterion: The optimality criterion. Only the predefined criteria are supported. Defaults to fisher_determinant.
+    :type criterion: callable
+    :param relative_sensitivities: Use relative local sensitivities instead of absolute. Defaults to False.
+    :type relative_sensitivities: bool, optional
+    :param solver_options: The options of the numerical integration. See :py:class:`SolverOptions`. Defaults to None (default options).
+    :type solver_options: SolverOptions, dict, optional
+    :param solution_cache: Reuse the dense solutions of conditions which were already solved. See :py:class:`SolutionCache`. Defaults to None.
+    :type solution_cache: SolutionCache, optional
+
+    :raises ValueError: Raised if no derivative is known for the criterion.
+    :return: The value of the criterion and its gradient with the shape of ``fsmp.times``.
+    :rtype: float, np.ndarray
+    """
+    S, C, dS, dC = get_S_matrix_time_derivative(fsmp, relative_sensitivities, solver_options=solver_options, solution_cache=solution_cache)
+    crit = criterion(fsmp, S, C)
+
+    F = FisherMatrix(S, C)
+    grad = np.zeros(fsmp.times.shape)
+    if not F.finite:
+        return crit, grad
+    G = calculate_fisher_criterion_matrix_gradient(F, criterion)
+
+    # Derivative of the criterion with respect to the time of every column
+    GS = G @ S
+    c = C.diagonal()
+    grad_columns = 2.0 * c * np.sum(GS * dS, axis=0) + dC.diagonal() * np.sum(GS * S, axis=0)
+
+    # Sum up the columns belonging to the same sampled time
+    n_t0, n_x0, n_p, n_p_full, N_x0, inputs_shape, n_obs = _model_dimensions(fsmp)
+    grad_columns = grad_columns.reshape((n_t0, N_x0, n_obs) + inputs_shape + (fsmp.times.shape[-1],))
+    if fsmp.identical_times==True:
+        grad[:] = np.sum(grad_columns, axis=tuple(range(grad_columns.ndim - 1)))
+    else:
+        grad[:] = np.sum(grad_columns, axis=(0, 1, 2))
+    return crit, grad
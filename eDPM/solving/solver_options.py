@@ -0,0 +1,145 @@
+import numpy as np
+from pydantic.dataclasses import dataclass
+from pydantic import validator
+from typing import Union, List, Optional
+import dataclasses
+
+from eDPM.model.fisher_model import _general_validator
+
+
+class Config:
+    arbitrary_types_allowed = True
+    smart_union = True
+    validate_assignment = True
+
+
+INTEGRATION_METHODS = ["RK45", "RK23", "DOP853", "Radau", "BDF", "LSODA"]
+JACOBIAN_METHODS = ["Radau", "BDF", "LSODA"]
+JACOBIAN_MODES = [None, "block", "full"]
+
+
+@dataclass(config=Config)
+class SolverOptions:
+    r"""Options of the numerical integration of the ODEs system and the sensitivities.
+    All options are passed to `scipy.integrate.solve_ivp <https://docs.scipy.org/doc/scipy/reference/generated/scipy.integrate.solve_ivp.html>`__.
+
+    :param method: The integration method. Defaults to "LSODA".
+    :type method: str
+    :param rtol: The relative tolerance of the integrator. Defaults to 1e-4.
+    :type rtol: float
+    :param atol: The absolute tolerance of the integrator. Defaults to 1e-6.
+    :type atol: float, List[float], np.ndarray
+    :param max_step: The maximum allowed step size. Defaults to np.inf.
+    :type max_step: float
+    :param first_step: The initial step size. Defaults to None (chosen by the integrator).
+    :type first_step: float, optional
+    :param dense_output: Store a continuous solution in the ``ode_solution`` of every individual result. Defaults to False.
+    :type dense_output: bool
+    :param jacobian: Choose the Jacobian of the system of state variables and sensitivities which is passed to the integrator. Defaults to None.
+
+        - None
+            No Jacobian is passed and the integrator approximates it by finite differences of the full right-hand side.
+        - "block"
+            Use the block-diagonal Jacobian built from ``ode_dfdx`` and neglect terms containing second derivatives.
+        - "full"
+            Additionally approximate the terms containing second derivatives by forward differences of ``ode_dfdx`` and ``ode_dfdp``.
+            This needs only :math:`n_x` additional evaluations of the derivatives instead of :math:`n_x (1 + n_p)` evaluations of the full right-hand side.
+
+        The Jacobian is only used by the implicit methods "Radau", "BDF" and "LSODA".
+        The "stacked" solver mode always lets the integrator approximate the Jacobian.
+    :type jacobian: str, optional
+    :param sparse_jacobian: Pass the Jacobian as sparse matrix. Only supported by "Radau" and "BDF" together with ``jacobian="block"`` or ``jacobian="full"``. Defaults to False.
+    :type sparse_jacobian: bool
+    :param coarse_factor: The factor by which the tolerances are loosened by :py:meth:`SolverOptions.coarse`.
+        The optimization routines use the coarse options during the global search and the original ones for the final result. A value of 1.0 disables this schedule. Defaults to 10.0.
+    :type coarse_factor: float
+    """
+    method: str = "LSODA"
+    rtol: float = 1e-4
+    atol: Union[float, List[float], np.ndarray] = 1e-6
+    max_step: float = np.inf
+    first_step: Optional[float] = None
+    dense_output: bool = False
+    jacobian: Optional[str] = None
+    sparse_jacobian: bool = False
+    coarse_factor: float = 10.0
+
+    @validator('method')
+    def validate_method(cls, method):
+        if method not in INTEGRATION_METHODS:
+            raise ValueError("Unknown integration method {}. Please specify one of {}.".format(method, INTEGRATION_METHODS))
+        return method
+
+    @validator('jacobian')
+    def validate_jacobian(cls, jacobian):
+        if jacobian not in JACOBIAN_MODES:
+            raise ValueError("Unknown jacobian {}. Please specify one of {}.".format(jacobian, JACOBIAN_MODES))
+        return jacobian
+
+    @validator('sparse_jacobian')
+    def validate_sparse_jacobian(cls, sparse_jacobian, values):
+        if sparse_jacobian and values.get('method') not in ["Radau", "BDF"]:
+            raise ValueError("Sparse Jacobians are only supported by the methods Radau and BDF.")
+        if sparse_jacobian and values.get('jacobian') is None:
+            raise ValueError("Sparse Jacobians require jacobian='block' or jacobian='full'.")
+        return sparse_jacobian
+
+    @validator('coarse_factor')
+    def validate_coarse_factor(cls, coarse_factor):
+        if coarse_factor < 1.0:
+            raise ValueError("The coarse_factor needs to be at least 1.0 but was {}.".format(coarse_factor))
+        return coarse_factor
+
+    def coarse(self):
+        """Create options with tolerances loosened by ``coarse_factor``.
+        The relative tolerance is not loosened above 1e-2.
+
+        :return: The coarse solver options.
+        :rtype: SolverOptions
+        """
+        return dataclasses.replace(
+            self,
+            rtol=max(self.rtol, min(1e-2, self.rtol * self.coarse_factor)),
+            atol=np.asarray(self.atol) * self.coarse_factor if type(self.atol) != float else self.atol * self.coarse_factor,
+        )
+
+    def solve_ivp_args(self, rhs=None):
+        """Collect the keyword arguments for ``scipy.integrate.solve_ivp``.
+
+        :param rhs: The right-hand side of the system. If it provides a method ``jac`` and the chosen method can use it, it is passed as Jacobian. Defaults to None.
+        :type rhs: OdeRhs, optional
+
+        :return: Keyword arguments for ``scipy.integrate.solve_ivp``.
+        :rtype: dict
+        """
+        args = {
+            "method": self.method,
+            "rtol": self.rtol,
+            "atol": self.atol,
+            "max_step": self.max_step,
+            "dense_output": self.dense_output,
+        }
+        if self.first_step is not None:
+            args["first_step"] = self.first_step
+        if self.jacobian is not None and self.method in JACOBIAN_METHODS and hasattr(rhs, "jac"):
+            args["jac"] = rhs.jac
+        return args
+
+
+_SOLVER_OPTIONS_TYPE_CASTS = {
+    dict: lambda x: SolverOptions(**x),
+    SolverOptions: lambda x: x,
+    type(None): lambda x: SolverOptions(),
+}
+
+
+def get_solver_options(solver_options) -> SolverOptions:
+    """Convert the supplied solver options to an object of type SolverOptions.
+
+    :param solver_options: The options as dictionary, SolverOptions or None (default options).
+    :type solver_options: dict, SolverOptions, None
+
+    :return: The solver options.
+    :rtype: SolverOptions
+    """
+    return _general_validator(solver_options, _SOLVER_OPTIONS_TYPE_CASTS)
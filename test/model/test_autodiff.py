@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+import pickle
+
+from eDPM import FisherModel, FisherModelParametrized, get_S_matrix
+from eDPM.model.autodiff import _ComplexStepDerivatives
+
+from test.setUp import default_model_small, pool_model_small
+from test.setUp.fisher_model import f_default, dfdx_default, dfdp_default
+
+
+def _without_derivatives(fsm, **kwargs):
+    values = {key: getattr(fsm, key) for key in fsm.__dataclass_fields__}
+    values.update(ode_dfdx=None, ode_dfdp=None, ode_autodiff=True)
+    values.update(kwargs)
+    return FisherModel(**values)
+
+
+def test_complex_step_default():
+    derivatives = _ComplexStepDerivatives(f_default)
+    rng = np.random.default_rng(0)
+    for _ in range(3):
+        x, u, p, c = rng.uniform(0.5, 2.0, 2), list(rng.uniform(0.5, 2.0, 2)), tuple(rng.uniform(0.5, 2.0, 3)), (1.0, 2.0, 1.5)
+        dfdx, dfdp = derivatives.jacobians(0.0, x, u, p, c)
+        np.testing.assert_allclose(dfdx, dfdx_default(0.0, x, u, p, c), rtol=1e-14)
+        np.testing.assert_allclose(dfdp, dfdp_default(0.0, x, u, p, c), rtol=1e-14, atol=1e-14)
+    # All directions are evaluated in one call of the function
+    assert derivatives.vectorized
+
+
+def test_complex_step_directions():
+    # The array of fixed shape can not hold the directions. Thus every direction is evaluated separately.
+    calls = []
+
+    def f(t, x, inputs, parameters, ode_args):
+        calls.append(t)
+        out = np.zeros(2, dtype=complex)
+        out[0] = parameters[0] * x[0] * x[1]
+        out[1] = -parameters[1] * x[1] + inputs[0]
+        return out
+
+    derivatives = _ComplexStepDerivatives(f)
+    x, p = np.array([2.0, 3.0]), (0.5, 0.25)
+    dfdx, dfdp = derivatives.jacobians(0.0, x, [1.0], p, None)
+    assert not derivatives.vectorized
+    np.testing.assert_allclose(dfdx, [[1.5, 1.0], [0.0, -0.25]])
+    np.testing.assert_allclose(dfdp, [[6.0, 0.0], [0.0, -3.0]])
+
+    # The derivatives with respect to the parameters reuse the evaluation of dfdx
+    n_calls = len(calls)
+    derivatives.jacobians(0.0, x, [1.0], p, None)
+    assert len(calls) == n_calls
+    derivatives.jacobians(1.0, x, [1.0], p, None)
+    assert len(calls) == n_calls + 4
+
+
+@pytest.mark.parametrize("identical_times", [True, False])
+def test_sensitivities_autodiff(pool_model_small):
+    fsm = pool_model_small.fsm
+    fsm.inputs = [np.linspace(2.0, 20.0, 3)]
+    S, C, _ = get_S_matrix(FisherModelParametrized.init_from(fsm))
+    fsm_auto = _without_derivatives(fsm)
+    S_auto, C_auto, _ = get_S_matrix(FisherModelParametrized.init_from(fsm_auto))
+    np.testing.assert_allclose(S_auto, S, rtol=1e-8, atol=1e-10*np.max(np.abs(S)))
+    np.testing.assert_allclose(C_auto.toarray(), C.toarray())
+
+
+@pytest.mark.parametrize("identical_times", [True, False])
+def test_sensitivities_autodiff_stacked(default_model_small):
+    fsm = default_model_small.fsm
+    fsm.inputs = [np.arange(2, 5), np.arange(5, 7)]
+    fsm.ode_vectorized = True
+    # Compare with the hand-written derivatives in the same solver mode such that differences of the integration cancel
+    S, _, _ = get_S_matrix(FisherModelParametrized.init_from(fsm), solver_mode="stacked")
+    fsm_auto = _without_derivatives(fsm)
+    S_auto, _, _ = get_S_matrix(FisherModelParametrized.init_from(fsm_auto), solver_mode="stacked")
+    np.testing.assert_allclose(S_auto, S, rtol=1e-8, atol=1e-10*np.max(np.abs(S)))
+    # The directions were evaluated together with all conditions in one call
+    assert fsm_auto.ode_dfdx.keywords["derivatives"].vectorized
+
+
+@pytest.mark.parametrize("identical_times", [True])
+def test_autodiff_partial(default_model_small):
+    # Only the missing derivative is generated
+    fsm = _without_derivatives(default_model_small.fsm, ode_dfdx=dfdx_default)
+    assert fsm.ode_dfdx is dfdx_default
+    dfdp = pickle.loads(pickle.dumps(fsm.ode_dfdp))
+    x, u, p, c = np.array([1.0, 2.0]), [1.0, 1.5], (0.5, 0.5, 1.0), (1.0, 2.0, 1.5)
+    np.testing.assert_allclose(dfdp(0.0, x, u, p, c), dfdp_default(0.0, x, u, p, c), atol=1e-14)
+
+
+@pytest.mark.parametrize("identical_times", [True])
+def test_missing_derivatives(default_model_small):
+    with pytest.raises(ValueError):
+        _without_derivatives(default_model_small.fsm, ode_autodiff=False)
@@ -6,7 +6,7 @@ from pydantic import ValidationError
 
 from test.setUp import default_model, model_init_params, pool_model
 
-from eDPM import FisherModelParametrized
+from eDPM import FisherModel, FisherModelParametrized, get_S_matrix
 
 
 class Test_fmsp_init_from_fsm:
@@ -273,3 +273,37 @@ class Test_fsmp_set_get:
                 np.linspace(0, 10),
                 np.linspace(3.0, 45.0)
             ]
+
+
+class Test_fsmp_with_values:
+    def test_with_values(self, default_model):
+        fsm = default_model.fsm
+        fsm.times = {"lb":0.0, "ub":10.0, "n":3}
+        fsm.inputs = [{"lb":2.0, "ub":4.0, "n":2}, fsm.inputs[1]]
+        fsmp = FisherModelParametrized.init_from(fsm)
+        times = np.copy(fsmp.times)
+        inputs = [np.copy(q) for q in fsmp.inputs]
+
+        new_times = np.full(fsmp.times.shape, [1.0, 2.0, 3.0])
+        fsmp_new = fsmp.with_values(times=new_times, inputs=[np.array([2.5, 3.5]), None])
+        np.testing.assert_almost_equal(fsmp_new.times, new_times)
+        np.testing.assert_almost_equal(fsmp_new.inputs[0], [2.5, 3.5])
+        np.testing.assert_almost_equal(fsmp_new.inputs[1], inputs[1])
+        assert fsmp_new.ode_fun is fsmp.ode_fun
+        assert fsmp_new.times_def is fsmp.times_def
+
+        # The original model is not modified
+        np.testing.assert_almost_equal(fsmp.times, times)
+        for q, q_old in zip(fsmp.inputs, inputs):
+            np.testing.assert_almost_equal(q, q_old)
+
+
+def test_positional_arguments(pool_model):
+    # The options added to the model must not change the meaning of positional arguments
+    fsm = pool_model.fsm
+    fsm_pos = FisherModel(fsm.ode_x0, fsm.ode_t0, fsm.times, fsm.inputs, fsm.parameters, fsm.ode_fun, fsm.ode_dfdx, fsm.ode_dfdp, fsm.obs_fun, fsm.obs_dgdx, fsm.obs_dgdp, fsm.ode_dfdx0, fsm.obs_dgdx0, fsm.ode_args)
+    assert fsm_pos.obs_fun is fsm.obs_fun
+    assert fsm_pos.obs_dgdx0 is fsm.obs_dgdx0
+    assert fsm_pos.ode_args == fsm.ode_args
+    assert not fsm_pos.ode_autodiff and not fsm_pos.ode_vectorized
+    np.testing.assert_allclose(get_S_matrix(FisherModelParametrized.init_from(fsm_pos))[0], get_S_matrix(FisherModelParametrized.init_from(fsm))[0])
@@ -0,0 +1,156 @@
+import pytest
+import numpy as np
+import pickle
+
+sympy = pytest.importorskip("sympy")
+
+from eDPM import FisherModelParametrized, OdeRhs, get_S_matrix, symbolic_functions, symbolic_fisher_model
+from eDPM.model import symbolic
+
+from test.setUp import default_model_small, extended_baranyi_model_small
+from test.setUp.extended_baranyi import baranyi_roberts_ode, ode_dfdp
+from test.setUp.fisher_model import f_default, g_default
+
+
+def _model_arguments(fsm):
+    return dict(
+        ode_x0=fsm.ode_x0,
+        ode_t0=fsm.ode_t0,
+        times=fsm.times,
+        inputs=fsm.inputs,
+        parameters=fsm.parameters,
+        ode_args=fsm.ode_args,
+        identical_times=fsm.identical_times,
+    )
+
+
+def _dfdx_central(x, u, p, h=1e-6):
+    # The hand-written ode_dfdx of the Baranyi model drops the factor x2/(x2+1) of df1/dy1 and df3/dx1
+    cols = []
+    for j in range(x.size):
+        e = np.zeros(x.size)
+        e[j] = h * max(1.0, abs(x[j]))
+        cols.append((np.array(baranyi_roberts_ode(0.0, x + e, u, p, None)) - np.array(baranyi_roberts_ode(0.0, x - e, u, p, None))) / (2 * e[j]))
+    return np.array(cols).T
+
+
+def test_baranyi_derivatives():
+    # The right-hand side only uses arithmetic operations and can be called with symbols directly
+    functions = symbolic_functions(baranyi_roberts_ode, n_x=4, n_inputs=1, n_parameters=5)
+    assert set(functions.keys()) == {"ode_fun", "ode_dfdx", "ode_dfdp"}
+    rng = np.random.default_rng(0)
+    p = (1e8, 0.2, 1.0, 0.2, 1.0)
+    for _ in range(5):
+        x = rng.uniform(0.1, 10.0, 4)
+        u = [rng.uniform(3.0, 10.0)]
+        np.testing.assert_allclose(np.array(functions["ode_fun"](1.0, x, u, p, None), dtype=float), baranyi_roberts_ode(1.0, x, u, p, None))
+        np.testing.assert_allclose(np.array(functions["ode_dfdx"](1.0, x, u, p, None), dtype=float), _dfdx_central(x, u, p), rtol=1e-6, atol=1e-8)
+        np.testing.assert_allclose(np.array(functions["ode_dfdp"](1.0, x, u, p, None), dtype=float), ode_dfdp(1.0, x, u, p, None), rtol=1e-12)
+
+
+@pytest.mark.parametrize("identical_times", [True, False])
+def test_sensitivities_baranyi(extended_baranyi_model_small):
+    fsm = extended_baranyi_model_small.fsm
+    S, C, _ = get_S_matrix(FisherModelParametrized.init_from(fsm))
+    fsm_sym = symbolic_fisher_model(baranyi_roberts_ode, obs_fun=[0], **_model_arguments(fsm))
+    S_sym, C_sym, _ = get_S_matrix(FisherModelParametrized.init_from(fsm_sym))
+    np.testing.assert_allclose(S_sym, S, rtol=1e-6, atol=1e-8*np.max(np.abs(S)))
+
+
+@pytest.mark.parametrize("identical_times", [True, False])
+def test_sensitivities_observable(default_model_small):
+    fsm = default_model_small.fsm
+    S, C, _ = get_S_matrix(FisherModelParametrized.init_from(fsm))
+    fsm_sym = symbolic_fisher_model(f_default, obs_fun=g_default, **_model_arguments(fsm))
+    S_sym, C_sym, _ = get_S_matrix(FisherModelParametrized.init_from(fsm_sym))
+    np.testing.assert_allclose(S_sym, S, rtol=1e-6, atol=1e-8*np.max(np.abs(S)))
+
+    # The generated functions only use numpy operations and can be evaluated for all times at once
+    fsm_sym.obs_vectorized = True
+    S_vec, _, _ = get_S_matrix(FisherModelParametrized.init_from(fsm_sym))
+    np.testing.assert_allclose(S_vec, S_sym)
+
+
+def test_x0_as_parameter():
+    def f(t, x, inputs, parameters, ode_args):
+        (n,) = x
+        (T,) = inputs
+        (a, b) = parameters
+        return [a * T * n * sympy.exp(-b * t)]
+
+    def g(t, x, inputs, parameters, ode_args):
+        return [sympy.log(x[0])]
+
+    functions = symbolic_functions(f, 1, 1, 2, obs_fun=g, x0_as_parameter=True)
+    assert set(functions.keys()) == {"ode_fun", "ode_dfdx", "ode_dfdp", "ode_dfdx0", "obs_fun", "obs_dgdx", "obs_dgdp", "obs_dgdx0"}
+    np.testing.assert_allclose(np.array(functions["obs_dgdx"](0.0, np.array([2.0]), [1.0], (1.0, 0.1), None), dtype=float), [[0.5]])
+    fsm = symbolic_fisher_model(f, obs_fun=g, x0_as_parameter=True, ode_t0=0.0, ode_x0=1.0, times={"lb": 0.0, "ub": 5.0, "n": 3}, inputs=[np.array([1.0, 2.0])], parameters=(0.5, 0.1))
+    S, _, _ = get_S_matrix(FisherModelParametrized.init_from(fsm))
+    assert S.shape == (3, 6)
+
+
+def test_cache_and_pickle(tmp_path, monkeypatch):
+    functions = symbolic_functions(baranyi_roberts_ode, 4, 1, 5, cache_dir=tmp_path)
+    assert len(list(tmp_path.glob("*.py"))) == 1
+
+    # The second call loads the generated code instead of differentiating again
+    def fail(*args, **kwargs):
+        raise AssertionError("The generated code was not loaded from the cache.")
+    monkeypatch.setattr(symbolic, "_generate_source", fail)
+    cached = symbolic_functions(baranyi_roberts_ode, 4, 1, 5, cache_dir=tmp_path)
+    assert cached["ode_dfdp"].source == functions["ode_dfdp"].source
+
+    # The functions are sent to worker processes as their source
+    dfdx = pickle.loads(pickle.dumps(cached["ode_dfdx"]))
+    x, u, p = np.array([1.0, 0.5, 2.0, 0.5]), [5.0], (1e8, 0.2, 1.0, 0.2, 1.0)
+    assert dfdx.__name__ == "ode_dfdx"
+    np.testing.assert_allclose(np.array(dfdx(0.0, x, u, p, None), dtype=float), np.array(functions["ode_dfdx"](0.0, x, u, p, None), dtype=float))
+
+
+def test_wrong_number_of_states():
+    with pytest.raises(ValueError):
+        symbolic_functions(baranyi_roberts_ode, 3, 1, 5)
+
+
+@pytest.mark.parametrize("identical_times", [True, False])
+def test_fused_rhs(extended_baranyi_model_small):
+    fsm = extended_baranyi_model_small.fsm
+    fsm_sym = symbolic_fisher_model(baranyi_roberts_ode, obs_fun=[0], **_model_arguments(fsm))
+    fsm_fused = symbolic_fisher_model(baranyi_roberts_ode, obs_fun=[0], fused=True, **_model_arguments(fsm))
+    assert fsm_fused.ode_rhs_fused is not None
+
+    # The fused function calculates the same augmented right-hand side as the separate functions
+    fsmp = FisherModelParametrized.init_from(fsm_fused)
+    Q = [fsmp.inputs[0][0]]
+    rhs = OdeRhs(fsmp.ode_fun, fsmp.ode_dfdx, fsmp.ode_dfdp, None, Q, fsmp.parameters, fsmp.ode_args, 4, 5)
+    rhs_fused = OdeRhs(fsmp.ode_fun, fsmp.ode_dfdx, fsmp.ode_dfdp, None, Q, fsmp.parameters, fsmp.ode_args, 4, 5, ode_rhs_fused=fsmp.ode_rhs_fused)
+    y = np.random.default_rng(1).uniform(0.1, 2.0, 4 + 4*5)
+    np.testing.assert_allclose(rhs_fused(0.5, y), rhs(0.5, y), rtol=1e-12)
+
+    S, _, _ = get_S_matrix(FisherModelParametrized.init_from(fsm_sym))
+    S_fused, _, _ = get_S_matrix(fsmp)
+    np.testing.assert_allclose(S_fused, S, rtol=1e-10, atol=1e-12*np.max(np.abs(S)))
+
+
+def test_fused_rhs_x0_as_parameter():
+    def f(t, x, inputs, parameters, ode_args):
+        (n, m) = x
+        (T,) = inputs
+        (a, b) = parameters
+        return [a * T * n - b * n * m, b * n * m]
+
+    args = dict(ode_t0=0.0, ode_x0=[np.array([1.0, 0.1])], times={"lb": 0.0, "ub": 5.0, "n": 3}, inputs=[np.array([1.0, 2.0])], parameters=(0.5, 0.1))
+    S, _, _ = get_S_matrix(FisherModelParametrized.init_from(symbolic_fisher_model(f, x0_as_parameter=True, **args)))
+    S_fused, _, _ = get_S_matrix(FisherModelParametrized.init_from(symbolic_fisher_model(f, x0_as_parameter=True, fused=True, **args)))
+    assert S_fused.shape == (4, 12)
+    np.testing.assert_allclose(S_fused, S, rtol=1e-10, atol=1e-12*np.max(np.abs(S)))
+
+
+def test_jit_requires_numba():
+    try:
+        import numba
+        pytest.skip("numba is installed")
+    except ImportError:
+        pass
+    with pytest.raises(ImportError):
+        symbolic_functions(baranyi_roberts_ode, 4, 1, 5, fused=True, jit=True)
@@ -0,0 +1,112 @@
+import pytest
+import numpy as np
+
+from eDPM.model import FisherResults
+from eDPM.optimization import find_optimal, Budget, BudgetExhausted
+
+from test.setUp import default_model_small
+
+
+def setup_model(fsm):
+    fsm.ode_t0 = 0.0
+    fsm.ode_x0 = [np.array([0.05, 0.001])]
+    fsm.inputs=[
+        {"lb": 2.0, "ub": 4.0, "n": 2},
+        np.arange(5, 5+2)
+    ]
+    fsm.times = {"lb":0.0, "ub":10.0, "n":2}
+    return fsm
+
+
+class Test_Budget:
+    def test_limits(self):
+        budget = Budget(max_evaluations=3, max_solves=10)
+        budget.record(np.array([1.0]), -1.0, solves=4)
+        budget.record(np.array([2.0]), -3.0, solves=4)
+        assert budget.exhausted() is None
+        np.testing.assert_equal(budget.best_x, [2.0])
+        assert budget.best_fun == -3.0
+        budget.record(np.array([3.0]), -2.0, solves=4)
+        with pytest.raises(BudgetExhausted):
+            budget.check()
+        assert budget.status == "max_evaluations"
+
+    def test_stagnation(self):
+        budget = Budget(stagnation_iterations=2, stagnation_tol=0.1)
+        for fun in [-1.0, -2.0, -2.1]:
+            budget.record(None, fun)
+            budget.iteration()
+        # The best value improved by less than 10% within the last two iterations
+        budget.record(None, -2.15)
+        with pytest.raises(BudgetExhausted):
+            budget.iteration()
+        assert budget.status == "stagnation"
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            Budget(max_time=0)
+        with pytest.raises(ValueError):
+            Budget(stagnation_tol=-1.0)
+
+
+class Test_BudgetStrategies:
+    @pytest.mark.parametrize("identical_times", [True])
+    @pytest.mark.parametrize("strategy, opt_args", [
+        ("scipy_differential_evolution", {"workers": 1}),
+        ("scipy_differential_evolution", {"workers": 2}),
+        ("scipy_brute", {"workers": 1}),
+        ("scipy_basinhopping", {}),
+        ("multistart", {"workers": 1}),
+    ])
+    def test_max_evaluations(self, default_model_small, strategy, opt_args):
+        fsm = setup_model(default_model_small.fsm)
+        fsr = find_optimal(fsm, strategy, max_evaluations=10, **opt_args)
+        assert type(fsr) == FisherResults
+        assert fsr.termination == "max_evaluations"
+
+    @pytest.mark.parametrize("identical_times", [True])
+    def test_max_solves(self, default_model_small):
+        fsm = setup_model(default_model_small.fsm)
+        budget = Budget(max_solves=20)
+        fsr = find_optimal(fsm, "scipy_differential_evolution", workers=1, polish=False, budget=budget)
+        assert fsr.termination == "max_solves"
+        # Every design needs one solve per combination of the inputs
+        assert budget.solves == 4 * budget.evaluations == 20
+
+    @pytest.mark.parametrize("identical_times", [True])
+    def test_max_time(self, default_model_small):
+        fsm = setup_model(default_model_small.fsm)
+        budget = Budget(max_time=0.5)
+        fsr = find_optimal(fsm, "scipy_differential_evolution", workers=1, budget=budget)
+        assert fsr.termination == "max_time"
+        assert budget.elapsed < 5.0
+
+    @pytest.mark.parametrize("identical_times", [True])
+    def test_stagnation(self, default_model_small):
+        fsm = setup_model(default_model_small.fsm)
+        fsm.inputs[0] = np.arange(2, 2+2)
+        fsr = find_optimal(fsm, "scipy_differential_evolution", popsize=3, polish=False, stagnation_iterations=2, stagnation_tol=0.5)
+        assert fsr.termination == "stagnation"
+
+    @pytest.mark.parametrize("identical_times", [True])
+    def test_unlimited(self, default_model_small):
+        fsm = setup_model(default_model_small.fsm)
+        fsr = find_optimal(fsm, "scipy_differential_evolution", workers=1, maxiter=1, popsize=2, max_evaluations=10**6)
+        assert fsr.termination is None
+
+    @pytest.mark.parametrize("identical_times", [True])
+    def test_fedorov_exchange(self, default_model_small):
+        fsm = setup_model(default_model_small.fsm)
+        fsm.inputs[0] = np.arange(2, 2+2)
+        fsm.times = {"lb":0.0, "ub":10.0, "n":4}
+        budget = Budget(max_evaluations=1)
+        fsr = find_optimal(fsm, "fedorov_exchange", budget=budget)
+        assert fsr.termination == "max_evaluations"
+        assert budget.solves > 0
+        assert fsr.times.size == 4
+
+    @pytest.mark.parametrize("identical_times", [True])
+    def test_budget_and_limits(self, default_model_small):
+        fsm = setup_model(default_model_small.fsm)
+        with pytest.raises(ValueError):
+            find_optimal(fsm, budget=Budget(max_time=1.0), max_evaluations=10)
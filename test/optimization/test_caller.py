@@ -1,8 +1,10 @@
 import pytest
 import numpy as np
+import itertools
 
 from eDPM.model import FisherModelParametrized, FisherResults
 from eDPM.optimization.caller import find_optimal
+from eDPM.solving import calculate_fisher_criterion, get_S_matrix, fisher_logdeterminant
 
 from test.setUp import default_model_small
 
@@ -53,3 +55,245 @@ class Test_Caller:
         # This is not about convergence, but about if the method will not fail.
         fsr = find_optimal(fsm, "scipy_brute", Ns=1, workers=1)
         assert type(fsr) == FisherResults
+
+    @pytest.mark.parametrize("identical_times", [True, False])
+    def test_minimize(self, default_model_small):
+        fsm = default_model_small.fsm
+        fsm.ode_t0 = 0.0
+        fsm.ode_x0 = [np.array([0.05, 0.001])]
+        fsm.inputs=[
+            np.arange(2, 2+2),
+            np.arange(5, 5+2)
+        ]
+        fsm.times = {"lb":0.0, "ub":10.0, "n":2}
+        fsr = find_optimal(fsm, "scipy_minimize", criterion=fisher_logdeterminant, options={"maxiter": 5})
+        assert type(fsr) == FisherResults
+
+        # The local search improves the initial guess
+        fsmp = FisherModelParametrized.init_from(fsm)
+        fsr_init = calculate_fisher_criterion(fsmp, criterion=fisher_logdeterminant)
+        assert fsr.criterion >= fsr_init.criterion
+
+    @pytest.mark.parametrize("identical_times", [True])
+    def test_minimize_sampled_inputs(self, default_model_small):
+        # The inputs are differentiated numerically while the times use the analytic gradient
+        fsm = default_model_small.fsm
+        fsm.ode_t0 = 0.0
+        fsm.ode_x0 = [np.array([0.05, 0.001])]
+        fsm.inputs=[
+            {"lb":2.0, "ub":4.0, "n":2},
+            np.arange(5, 5+2)
+        ]
+        fsm.times = {"lb":0.0, "ub":10.0, "n":2}
+        fsr = find_optimal(fsm, "scipy_minimize", options={"maxiter": 2})
+        assert type(fsr) == FisherResults
+
+    @pytest.mark.parametrize("identical_times", [True])
+    def test_minimize_trust_constr(self, default_model_small):
+        fsm = default_model_small.fsm
+        fsm.ode_t0 = 0.0
+        fsm.ode_x0 = [np.array([0.05, 0.001])]
+        fsm.inputs=[
+            np.arange(2, 2+2),
+            np.arange(5, 5+2)
+        ]
+        fsm.times = {"lb":0.0, "ub":10.0, "n":3, "min_distance":1.0}
+        fsr = find_optimal(fsm, "scipy_minimize", method="trust-constr", options={"maxiter": 20})
+        assert type(fsr) == FisherResults
+        assert np.all(np.diff(fsr.times) >= 1.0 - 1e-6)
+
+    @pytest.mark.parametrize("identical_times", [True])
+    def test_basinhopping_gradient(self, default_model_small):
+        fsm = default_model_small.fsm
+        fsm.ode_t0 = 0.0
+        fsm.ode_x0 = [np.array([0.05, 0.001])]
+        fsm.inputs=[
+            np.arange(2, 2+2),
+            np.arange(5, 5+2)
+        ]
+        fsm.times = {"lb":0.0, "ub":10.0, "n":2}
+        # Criteria without derivative fall back to numerical gradients
+        for criterion in [fisher_logdeterminant, lambda fsmp, S, C: np.trace(S @ S.T)]:
+            fsr = find_optimal(fsm, "scipy_basinhopping", niter=1, criterion=criterion)
+            assert type(fsr) == FisherResults
+
+    @pytest.mark.parametrize("identical_times", [True, False])
+    def test_multistart(self, default_model_small):
+        fsm = default_model_small.fsm
+        fsm.ode_t0 = 0.0
+        fsm.ode_x0 = [np.array([0.05, 0.001])]
+        fsm.inputs=[
+            np.arange(2, 2+2),
+            np.arange(5, 5+2)
+        ]
+        fsm.times = {"lb":0.0, "ub":10.0, "n":3, "min_distance":1.0}
+        fsr = find_optimal(fsm, "multistart", n_starts=4, workers=1, seed=0, criterion=fisher_logdeterminant, options={"maxiter": 10})
+        assert type(fsr) == FisherResults
+
+        # The best design is returned first and all local optima are distinct and satisfy the constraints
+        assert fsr.ensemble[0] is fsr
+        crits = [r.criterion for r in fsr.ensemble]
+        assert crits == sorted(crits, reverse=True)
+        for r in fsr.ensemble:
+            assert np.all(np.diff(r.times, axis=-1) >= 1.0 - 1e-6)
+
+    @pytest.mark.parametrize("identical_times", [True])
+    def test_multistart_processes(self, default_model_small):
+        fsm = default_model_small.fsm
+        fsm.ode_t0 = 0.0
+        fsm.ode_x0 = [np.array([0.05, 0.001])]
+        fsm.inputs=[
+            np.arange(2, 2+2),
+            np.arange(5, 5+2)
+        ]
+        fsm.times = {"lb":0.0, "ub":10.0, "n":2}
+        fsr_serial = find_optimal(fsm, "multistart", n_starts=3, workers=1, seed=1, options={"maxiter": 5})
+        fsr = find_optimal(fsm, "multistart", n_starts=3, workers=2, seed=1, options={"maxiter": 5})
+        np.testing.assert_allclose(fsr.criterion, fsr_serial.criterion)
+        assert len(fsr.ensemble) == len(fsr_serial.ensemble)
+
+    @pytest.mark.parametrize("identical_times", [True])
+    @pytest.mark.parametrize("strategy, opt_args", [
+        ("scipy_differential_evolution", {"workers": 1, "maxiter": 2, "popsize": 3}),
+        ("scipy_basinhopping", {"niter": 1}),
+        ("scipy_brute", {"Ns": 2, "workers": 1}),
+    ])
+    def test_parametrization(self, default_model_small, strategy, opt_args):
+        fsm = default_model_small.fsm
+        fsm.ode_t0 = 0.0
+        fsm.ode_x0 = [np.array([0.05, 0.001])]
+        fsm.inputs=[
+            {"lb": 2.0, "ub": 4.0, "n": 2, "min_distance": 0.5},
+            np.arange(5, 5+2)
+        ]
+        fsm.times = {"lb":0.0, "ub":10.0, "n":3, "min_distance":2.0}
+        fsr = find_optimal(fsm, strategy, parametrization="increments", **opt_args)
+        assert type(fsr) == FisherResults
+        # Every design of the parametrization is ordered and respects the minimal distances
+        assert np.all(np.diff(fsr.times, axis=-1) >= 2.0 - 1e-8)
+        assert np.all(np.diff(fsr.inputs[0]) >= 0.5 - 1e-8)
+        assert np.all((fsr.times >= 0.0) & (fsr.times <= 10.0))
+
+    @pytest.mark.parametrize("identical_times", [False])
+    def test_parametrization_rows(self, default_model_small):
+        # Every row of times is an ordered block of its own
+        fsm = default_model_small.fsm
+        fsm.ode_t0 = 0.0
+        fsm.ode_x0 = [np.array([0.05, 0.001])]
+        fsm.inputs=[
+            np.arange(2, 2+2),
+            np.arange(5, 5+2)
+        ]
+        fsm.times = {"lb":0.0, "ub":10.0, "n":3, "min_distance":2.0}
+        fsr = find_optimal(fsm, "scipy_differential_evolution", parametrization="increments", workers=1, maxiter=1, popsize=2)
+        assert type(fsr) == FisherResults
+        assert np.all(np.diff(fsr.times, axis=-1) >= 2.0 - 1e-8)
+
+    @pytest.mark.parametrize("identical_times", [True])
+    def test_parametrization_unknown(self, default_model_small):
+        fsm = default_model_small.fsm
+        fsm.times = {"lb":0.0, "ub":10.0, "n":2}
+        with pytest.raises(ValueError):
+            find_optimal(fsm, "scipy_differential_evolution", parametrization="simplex", maxiter=1, popsize=2)
+
+    @pytest.mark.parametrize("identical_times", [True])
+    def test_solver_options(self, default_model_small):
+        fsm = default_model_small.fsm
+        fsm.ode_t0 = 0.0
+        fsm.ode_x0 = [np.array([0.05, 0.001])]
+        fsm.inputs=[
+            np.arange(2, 2+2),
+            np.arange(5, 5+2)
+        ]
+        fsm.times = {"lb":0.0, "ub":10.0, "n":2}
+        solver_options = {"method": "BDF", "rtol": 1e-6}
+        fsr = find_optimal(fsm, "scipy_differential_evolution", workers=1, maxiter=1, popsize=2, solver_options=solver_options)
+        assert type(fsr) == FisherResults
+
+        # The final result is evaluated with the supplied (fine) tolerances
+        fsmp = FisherModelParametrized.init_from(fsm)
+        fsmp.times = fsr.times
+        fsr_ref = calculate_fisher_criterion(fsmp, solver_options=solver_options)
+        np.testing.assert_allclose(fsr.criterion, fsr_ref.criterion, rtol=1e-4)
+
+    @pytest.mark.parametrize("identical_times", [True, False])
+    def test_differential_evolution_vectorized(self, default_model_small):
+        fsm = default_model_small.fsm
+        fsm.ode_t0 = 0.0
+        fsm.ode_x0 = [np.array([0.05, 0.001])]
+        fsm.inputs=[
+            {"lb": 2.0, "ub": 4.0, "n": 2},
+            np.arange(5, 5+2)
+        ]
+        fsm.times = {"lb":0.0, "ub":10.0, "n":2}
+        # Evaluate the whole population of a design with sampled inputs at once
+        fsr = find_optimal(fsm, "scipy_differential_evolution", vectorized=True, maxiter=1, popsize=2, polish=False)
+        assert type(fsr) == FisherResults
+
+    @pytest.mark.parametrize("identical_times", [True])
+    def test_differential_evolution_threads(self, default_model_small):
+        from concurrent.futures import ThreadPoolExecutor
+        fsm = default_model_small.fsm
+        fsm.ode_t0 = 0.0
+        fsm.ode_x0 = [np.array([0.05, 0.001])]
+        fsm.inputs=[
+            {"lb": 2.0, "ub": 4.0, "n": 2},
+            np.arange(5, 5+2)
+        ]
+        fsm.times = {"lb":0.0, "ub":10.0, "n":2}
+        # The objective does not modify the shared model such that threads can evaluate it concurrently
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            fsr = find_optimal(fsm, "scipy_differential_evolution", workers=executor.map, maxiter=1, popsize=2, polish=False)
+        assert type(fsr) == FisherResults
+
+    @pytest.mark.parametrize("identical_times", [True])
+    def test_logdeterminant(self, default_model_small):
+        fsm = default_model_small.fsm
+        fsm.ode_t0 = 0.0
+        fsm.ode_x0 = [np.array([0.05, 0.001])]
+        fsm.inputs=[
+            np.arange(2, 2+2),
+            np.arange(5, 5+2)
+        ]
+        fsm.times = {"lb":0.0, "ub":10.0, "n":2}
+        fsr = find_optimal(fsm, "scipy_differential_evolution", criterion=fisher_logdeterminant, maxiter=1, popsize=2)
+        assert type(fsr) == FisherResults
+        assert fsr.criterion_fun is fisher_logdeterminant
+
+    @pytest.mark.parametrize("identical_times", [True])
+    def test_fedorov_exchange(self, default_model_small):
+        fsm = default_model_small.fsm
+        fsm.ode_t0 = 0.0
+        fsm.ode_x0 = [np.array([0.05, 0.001])]
+        fsm.inputs=[
+            np.arange(2, 2+2),
+            np.arange(5, 5+2)
+        ]
+        fsm.times = {"lb":0.0, "ub":10.0, "n":4, "discrete":0.5, "min_distance":1.0, "unique":True}
+        fsr = find_optimal(fsm, "fedorov_exchange")
+        assert type(fsr) == FisherResults
+        # The times are chosen from the discretization and respect the minimal distance
+        np.testing.assert_almost_equal(fsr.times, np.round(fsr.times * 2) / 2)
+        assert np.all(np.diff(fsr.times) >= 1.0)
+
+        # Search all admissible designs on the grid with precomputed sensitivities
+        fsmp = FisherModelParametrized.init_from(fsm)
+        grid = np.arange(0.0, 10.25, 0.5)
+        S, C, _ = get_S_matrix(fsmp.with_values(times=grid))
+        S = S.reshape((S.shape[0], -1, grid.size))
+        best = max(
+            np.linalg.det(np.einsum("pkt,qkt->pq", S[..., list(t)], S[..., list(t)]))
+            for t in itertools.combinations(range(grid.size), 4) if np.all(np.diff(grid[list(t)]) >= 1.0)
+        )
+        np.testing.assert_allclose(fsr.criterion, best, rtol=1e-3)
+
+    @pytest.mark.parametrize("identical_times", [True])
+    def test_fedorov_exchange_unsupported(self, default_model_small):
+        fsm = default_model_small.fsm
+        fsm.inputs=[
+            {"lb": 2.0, "ub": 4.0, "n": 2},
+            np.arange(5, 5+2)
+        ]
+        fsm.times = {"lb":0.0, "ub":10.0, "n":2}
+        with pytest.raises(ValueError):
+            find_optimal(fsm, "fedorov_exchange")
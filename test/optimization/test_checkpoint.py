@@ -0,0 +1,123 @@
+import pytest
+import numpy as np
+
+from eDPM.model import FisherResults
+from eDPM.optimization import find_optimal, Checkpoint, load_checkpoint, checkpoint_results
+from eDPM.optimization.checkpoint import _ResumedObjective
+
+from test.setUp import default_model_small
+
+
+def setup_model(fsm):
+    fsm.ode_t0 = 0.0
+    fsm.ode_x0 = [np.array([0.05, 0.001])]
+    fsm.inputs=[
+        np.arange(2, 2+2),
+        np.arange(5, 5+2)
+    ]
+    fsm.times = {"lb":0.0, "ub":10.0, "n":2}
+    return fsm
+
+
+class Test_Checkpoint:
+    def test_save_load(self, tmp_path):
+        path = tmp_path / "checkpoint"
+        checkpoint = Checkpoint(path)
+        # Only the most recent state needs to be written
+        for i in range(20):
+            checkpoint.save({"nit": i, "results": lambda i=i: "results_{}".format(i)})
+        checkpoint.close()
+        state = load_checkpoint(path)
+        assert state["nit"] == 19
+        assert state["results"] == "results_19"
+
+    def test_write_error(self, tmp_path):
+        checkpoint = Checkpoint(tmp_path / "missing" / "checkpoint")
+        checkpoint.save({"nit": 1})
+        with pytest.raises(FileNotFoundError):
+            checkpoint.close()
+
+    def test_invalid_interval(self, tmp_path):
+        with pytest.raises(ValueError):
+            Checkpoint(tmp_path / "checkpoint", interval=0)
+
+    @pytest.mark.parametrize("vectorized", [True, False])
+    def test_resumed_objective(self, vectorized):
+        calls = []
+        def func(x):
+            calls.append(np.array(x))
+            return np.sum(x**2, axis=0)
+        population = np.array([[1.0, 2.0], [3.0, 4.0]])
+        resumed = _ResumedObjective(func, population, [-1.0, -2.0], vectorized)
+        if vectorized:
+            X = np.array([[3.0, 0.5], [4.0, 0.5]])
+            np.testing.assert_equal(resumed(X), [-2.0, 0.5])
+            np.testing.assert_equal(calls[0], [[0.5], [0.5]])
+        else:
+            assert resumed(np.array([1.0, 2.0])) == -1.0
+            assert len(calls) == 0
+        # Every stored energy is only used once
+        if vectorized:
+            np.testing.assert_equal(resumed(population[1:].T), [25.0])
+        else:
+            assert resumed(population[0]) == 5.0
+
+    @pytest.mark.parametrize("vectorized", [True, False])
+    def test_resumed_population(self, vectorized):
+        # The optimizer scales the initial population to the unit cube and back which changes the last bits of the vectors
+        from scipy import optimize
+        calls = []
+        def func(x):
+            calls.append(np.array(x))
+            return np.sum(x**2, axis=0)
+        bounds = [(0.1, 0.7), (-3.3, 1.9), (1e-3, 7e3)]
+        rng = np.random.default_rng(1)
+        population = np.array([[rng.uniform(lb, ub) for lb, ub in bounds] for _ in range(8)])
+        energies = -np.arange(8.0)
+        resumed = _ResumedObjective(func, population, energies, vectorized)
+        opt_args = {"vectorized": True, "updating": "deferred"} if vectorized else {}
+        res = optimize.differential_evolution(resumed, bounds, init=population, maxiter=1, polish=False, seed=0, **opt_args)
+        # Only the trial vectors of the generation are evaluated
+        assert sum(np.shape(x)[-1] if vectorized else 1 for x in calls) == len(population)
+        assert res.fun <= -7.0
+
+
+class Test_Resume:
+    @pytest.mark.parametrize("identical_times", [True])
+    @pytest.mark.parametrize("sampled_inputs", [True, False])
+    def test_checkpoint_resume(self, default_model_small, tmp_path, sampled_inputs):
+        fsm = setup_model(default_model_small.fsm)
+        if sampled_inputs:
+            fsm.inputs[0] = {"lb": 2.0, "ub": 4.0, "n": 2}
+        path = tmp_path / "checkpoint"
+        opt_args = {"workers": 1, "popsize": 3, "polish": False, "tol": 0, "seed": 2}
+        find_optimal(fsm, maxiter=2, checkpoint=path, **opt_args)
+        state = load_checkpoint(path)
+        assert state["nit"] == 2
+        assert state["population"].shape == state["population_energies"].shape + (state["x"].size,)
+        assert state["fun"] == np.min(state["population_energies"])
+        # The results of the best design are only calculated on demand
+        fsr_checkpoint = checkpoint_results(path, fsm)
+        assert type(fsr_checkpoint) == FisherResults
+        assert np.isfinite(fsr_checkpoint.criterion)
+
+        # The resumed run keeps the best member and only runs the remaining generations
+        path_resumed = tmp_path / "checkpoint_resumed"
+        fsr = find_optimal(fsm, maxiter=4, resume_from=path, checkpoint=Checkpoint(path_resumed), **opt_args)
+        assert type(fsr) == FisherResults
+        state_resumed = load_checkpoint(path_resumed)
+        assert state_resumed["nit"] == 4
+        assert state_resumed["fun"] <= state["fun"]
+
+    @pytest.mark.parametrize("identical_times", [True])
+    def test_resume_mismatch(self, default_model_small, tmp_path):
+        fsm = setup_model(default_model_small.fsm)
+        path = tmp_path / "checkpoint"
+        find_optimal(fsm, workers=1, maxiter=1, popsize=2, polish=False, checkpoint=path)
+        with pytest.raises(ValueError):
+            find_optimal(fsm, "scipy_basinhopping", resume_from=path)
+        with pytest.raises(ValueError):
+            find_optimal(fsm, maxiter=2, popsize=2, resume_from=path, parametrization="increments")
+        fsm.times = {"lb":0.0, "ub":10.0, "n":3}
+        with pytest.raises(ValueError):
+            find_optimal(fsm, maxiter=2, popsize=2, resume_from=path)
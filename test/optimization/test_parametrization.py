@@ -0,0 +1,40 @@
+import pytest
+import numpy as np
+
+from eDPM.optimization.parametrization import OrderedParametrization
+
+
+def create_parametrization():
+    bounds = [(0.0, 10.0)] * 4 + [(2.0, 4.0)]
+    blocks = [(np.arange(4), 0.0, 10.0, 1.5)]
+    return OrderedParametrization(bounds, blocks)
+
+
+class Test_OrderedParametrization:
+    def test_bounds(self):
+        param = create_parametrization()
+        assert param.bounds == [(0.0, 1.0)] * 4 + [(2.0, 4.0)]
+
+    def test_feasible_designs(self):
+        param = create_parametrization()
+        rng = np.random.default_rng(0)
+        U = rng.uniform(0.0, 1.0, (4, 50))
+        U = np.vstack([U, rng.uniform(2.0, 4.0, (1, 50))])
+        X = param.to_design(U)
+        assert np.all(np.diff(X[:4], axis=0) >= 1.5 - 1e-12)
+        assert np.all(X[:4] >= 0.0) and np.all(X[:4] <= 10.0)
+        # Variables which are not part of a block are passed through
+        np.testing.assert_equal(X[4], U[4])
+        # A single design gives the same result as a column of many
+        np.testing.assert_almost_equal(param.to_design(U[:, 3]), X[:, 3])
+
+    def test_round_trip(self):
+        param = create_parametrization()
+        X = np.array([0.5, 3.0, 4.5, 9.0, 3.0])
+        np.testing.assert_almost_equal(param.to_design(param.from_design(X)), X)
+        # Unsorted designs are represented by their sorted counterpart
+        np.testing.assert_almost_equal(param.to_design(param.from_design(X[[3, 1, 0, 2, 4]])), X)
+
+    def test_infeasible(self):
+        with pytest.raises(ValueError):
+            OrderedParametrization([(0.0, 1.0)] * 3, [(np.arange(3), 0.0, 1.0, 0.6)])
@@ -0,0 +1,112 @@
+import pytest
+import numpy as np
+import itertools
+
+from eDPM.model import FisherModelParametrized
+from eDPM.optimization.sequential import SequentialDesign, _cholesky_update
+from eDPM.solving import get_S_matrix, calculate_fisher_matrix, fisher_determinant, fisher_logdeterminant, fisher_sumeigenval, fisher_mineigenval
+
+from test.setUp import default_model_small
+
+
+def random_candidates(n_p=3, n_candidates=40, k=2, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(size=(n_p, n_candidates, k)), rng.uniform(0.5, 2.0, (n_candidates, k))
+
+
+class Test_SequentialDesign:
+    def test_cholesky_update(self):
+        rng = np.random.default_rng(0)
+        A = rng.normal(size=(4, 4))
+        F = A @ A.T + np.eye(4)
+        x = rng.normal(size=4)
+        L = _cholesky_update(np.linalg.cholesky(F), x)
+        np.testing.assert_almost_equal(L, np.linalg.cholesky(F + np.outer(x, x)))
+        L = _cholesky_update(L, x, downdate=True)
+        np.testing.assert_almost_equal(L, np.linalg.cholesky(F))
+
+    def test_add_remove(self):
+        S, w = random_candidates()
+        sd = SequentialDesign(S, w)
+        for i in [3, 7, 11, 20]:
+            sd.add(i)
+        sd.remove(7)
+        F = sd.epsilon * np.eye(3) + sum(np.einsum("pk,k,qk->pq", S[:, i], w[i], S[:, i]) for i in [3, 11, 20])
+        np.testing.assert_almost_equal(sd.F, F)
+        np.testing.assert_almost_equal(sd.L @ sd.L.T, F)
+        np.testing.assert_almost_equal(sd.logdet, np.linalg.slogdet(F)[1])
+        np.testing.assert_equal(sd.selected, [3, 11, 20])
+        with pytest.raises(ValueError):
+            sd.remove(7)
+
+    def test_gains(self):
+        S, w = random_candidates()
+        sd = SequentialDesign(S, w)
+        sd.greedy(4)
+        gains = sd.gains()
+        for j in [0, 5, 13]:
+            if sd.counts[j] > 0:
+                assert gains[j] == -np.inf
+                continue
+            F = sd.F + np.einsum("pk,k,qk->pq", S[:, j], w[j], S[:, j])
+            np.testing.assert_almost_equal(gains[j], np.linalg.slogdet(F)[1] - sd.logdet)
+
+    @pytest.mark.parametrize("criterion", [fisher_determinant, fisher_logdeterminant, fisher_sumeigenval])
+    def test_greedy_exchange(self, criterion):
+        S, w = random_candidates(n_candidates=12, k=1)
+        sd = SequentialDesign(S, w, criterion=criterion)
+        sd.greedy(4)
+        value_greedy = sd.value
+        sd.exchange()
+        assert sd.value >= value_greedy - 1e-12
+        assert len(sd.selected) == 4
+
+        # The exchange algorithm finds the optimum of this small problem
+        def crit(subset):
+            F = sd.epsilon * np.eye(3) + sum(w[i, 0] * np.outer(S[:, i, 0], S[:, i, 0]) for i in subset)
+            return np.trace(F) if criterion is fisher_sumeigenval else np.linalg.slogdet(F)[1]
+        best = max(itertools.combinations(range(12), 4), key=crit)
+        np.testing.assert_almost_equal(crit(sd.selected), crit(best))
+
+    def test_replace(self):
+        S, w = random_candidates(n_candidates=3, k=1)
+        sd = SequentialDesign(S, w, replace=True)
+        sd.greedy(6)
+        assert np.sum(sd.counts) == 6
+        sd = SequentialDesign(S, w, replace=False)
+        with pytest.raises(ValueError):
+            sd.greedy(4)
+
+    def test_invalid_weights(self):
+        S, w = random_candidates(n_candidates=5, k=1)
+        w[2] = np.nan
+        sd = SequentialDesign(S, w)
+        assert sd.gains()[2] == -np.inf
+
+    def test_invalid_criterion(self):
+        S, w = random_candidates()
+        with pytest.raises(ValueError):
+            SequentialDesign(S, w, criterion=fisher_mineigenval)
+
+    @pytest.mark.parametrize("identical_times", [True])
+    def test_from_model(self, default_model_small):
+        fsmp = default_model_small.fsmp
+        candidate_times = np.linspace(0.5, 10.0, 40)
+        solver_options = {"rtol": 1e-8, "atol": 1e-10}
+        sd = SequentialDesign.from_model(fsmp, candidate_times, solver_options=solver_options)
+        sd.greedy(5)
+        sd.exchange()
+        times = sd.design_times
+        assert times.size == 5
+        assert np.all(np.isin(times, candidate_times))
+
+        # The incrementally updated Fisher matrix and criterion match the direct calculation
+        S, C, _ = get_S_matrix(fsmp.with_values(times=times), solver_options=solver_options)
+        F = calculate_fisher_matrix(S, C)
+        np.testing.assert_allclose(sd.F - sd.epsilon * np.eye(sd.n_p), F, rtol=1e-8, atol=1e-8*np.max(np.abs(F)))
+        np.testing.assert_allclose(sd.value, np.linalg.slogdet(F + sd.epsilon * np.eye(sd.n_p))[1], rtol=1e-6)
+
+    @pytest.mark.parametrize("identical_times", [False])
+    def test_from_model_not_identical(self, default_model_small):
+        with pytest.raises(ValueError):
+            SequentialDesign.from_model(default_model_small.fsmp, np.linspace(0.5, 10.0, 10))
@@ -27,9 +27,9 @@ class TestCovariance:
 
         S, C, _ = get_S_matrix(fsmp, relative_sensitivities)
         if cov_rel_abs==relative_sensitivities:
-            np.testing.assert_allclose(np.diag(C), np.full(C.shape[0], 1/cov_def["rel"]**2 if cov_rel_abs else 1/cov_def["abs"]**2))
+            np.testing.assert_allclose(C.diagonal(), np.full(C.shape[0], 1/cov_def["rel"]**2 if cov_rel_abs else 1/cov_def["abs"]**2))
         else:
-            np.testing.assert_allclose(np.diag(C)!=1, np.ones(C.shape[0]))
+            np.testing.assert_allclose(C.diagonal()!=1, np.ones(C.shape[0]))
     
     @pytest.mark.parametrize("identical_times,relative_sensitivities,cov_rel_abs,cov_val", comb_gen_covar())
     def test_covariance_def_2(self, pool_model_small, relative_sensitivities, cov_rel_abs, cov_val):
@@ -48,6 +48,6 @@ class TestCovariance:
 
         S, C, _ = get_S_matrix(fsmp, relative_sensitivities)
         if cov_rel_abs==relative_sensitivities:
-            np.testing.assert_allclose(np.diag(C), np.full(C.shape[0], 1/cov_def["rel"]**2 if cov_rel_abs else 1/cov_def["abs"]**2))
+            np.testing.assert_allclose(C.diagonal(), np.full(C.shape[0], 1/cov_def["rel"]**2 if cov_rel_abs else 1/cov_def["abs"]**2))
         else:
-            np.testing.assert_allclose(np.diag(C)!=1, np.ones(C.shape[0]))
+            np.testing.assert_allclose(C.diagonal()!=1, np.ones(C.shape[0]))
@@ -1,4 +1,6 @@
 import numpy as np
+import scipy as sp
+import scipy.sparse
 
 from eDPM.model import FisherModelParametrized
 from eDPM.solving import *
@@ -39,3 +41,79 @@ class Test_Criteria:
         eigvals = np.linalg.eigvals(F)
         r2 = np.min(eigvals) / np.max(eigvals)
         np.testing.assert_almost_equal(r1, r2)
+
+    def test_fisher_matrix_sparse_weights(self):
+        S, C, F = self.define_matrices()
+        w = np.array([0.5, 2.0, 3.0])
+        F_dense = S @ np.diag(w) @ S.T
+        np.testing.assert_almost_equal(calculate_fisher_matrix(S, np.diag(w)), F_dense)
+        np.testing.assert_almost_equal(calculate_fisher_matrix(S, w), F_dense)
+        np.testing.assert_almost_equal(calculate_fisher_matrix(S, sp.sparse.diags(w)), F_dense)
+        np.testing.assert_almost_equal(fisher_determinant(None, S, sp.sparse.diags(w)), np.linalg.det(F_dense))
+
+    def test_fisher_criterion_batch(self):
+        rng = np.random.default_rng(0)
+        S = rng.uniform(-1, 1, (5, 3, 8))
+        C_sparse = [sp.sparse.diags(rng.uniform(0.5, 2.0, 8), format="dia") for _ in range(5)]
+        C_dense = [Ck.toarray() for Ck in C_sparse]
+        F = calculate_fisher_matrices(S, C_sparse)
+        np.testing.assert_almost_equal(F, calculate_fisher_matrices(S, C_dense))
+        for criterion in [fisher_determinant, fisher_logdeterminant, fisher_sumeigenval, fisher_mineigenval, fisher_ratioeigenval, lambda fsmp, S, C: np.trace(S @ C @ S.T)]:
+            crits = [criterion(None, Sk, Ck) for Sk, Ck in zip(S, C_dense)]
+            np.testing.assert_almost_equal(calculate_fisher_criterion_batch(None, S, C_sparse, criterion), crits)
+            np.testing.assert_almost_equal(calculate_fisher_criterion_batch(None, S, C_dense, criterion), crits)
+
+    def test_fisher_logdeterminant(self):
+        S, C, F = self.define_matrices()
+        np.testing.assert_almost_equal(fisher_logdeterminant(None, S, C), np.log(np.linalg.det(F)))
+        # Large systems do not overflow
+        S_large = 1e3 * np.eye(200)
+        np.testing.assert_almost_equal(fisher_logdeterminant(None, S_large, np.eye(200)), 200 * np.log(1e6))
+        assert fisher_determinant(None, S_large, np.eye(200)) == np.inf
+
+    def test_fisher_matrix_factorizations(self):
+        S, C, F = self.define_matrices()
+        fm = FisherMatrix(S, C)
+        np.testing.assert_almost_equal(fm.F, F)
+        np.testing.assert_almost_equal(fm.cholesky @ fm.cholesky.T, F)
+        np.testing.assert_almost_equal(fm.eigvalsh, np.sort(np.linalg.eigvals(F)))
+        np.testing.assert_almost_equal(fm.determinant, np.linalg.det(F))
+        np.testing.assert_almost_equal(fm.trace, np.sum(np.linalg.eigvals(F)))
+        # The factorizations are only computed once
+        assert fm.cholesky is fm.cholesky
+        assert fm.eigvalsh is fm.eigvalsh
+
+    def test_fisher_matrix_singular(self):
+        S = np.array([[1.0, 2.0], [2.0, 4.0]])
+        fm = FisherMatrix(S, np.eye(2))
+        assert fm.cholesky is None
+        np.testing.assert_almost_equal(fm.determinant, 0.0)
+        assert fisher_logdeterminant(None, S, np.eye(2)) == -np.inf
+        np.testing.assert_almost_equal(fisher_mineigenval(None, S, np.eye(2)), 0.0)
+
+    def test_fisher_matrix_non_finite(self):
+        S, C, F = self.define_matrices()
+        C_nan = sp.sparse.diags([1.0, np.nan, 1.0])
+        for criterion in [fisher_determinant, fisher_sumeigenval, fisher_mineigenval, fisher_ratioeigenval]:
+            assert criterion(None, S, C_nan) == 0.0
+        assert fisher_logdeterminant(None, S, C_nan) == -np.inf
+        np.testing.assert_almost_equal(calculate_fisher_criterion_batch(None, np.array([S, S]), [C_nan, sp.sparse.diags([1.0, 1.0, 1.0])]), [0.0, np.linalg.det(F)])
+
+    def test_fisher_criterion_matrix_gradient(self):
+        S, C, F = self.define_matrices()
+        fm = FisherMatrix(S, C)
+        h = 1e-6
+        for criterion in [fisher_determinant, fisher_logdeterminant, fisher_sumeigenval, fisher_mineigenval, fisher_ratioeigenval]:
+            G = calculate_fisher_criterion_matrix_gradient(fm, criterion)
+            # Compare the directional derivative along a symmetric perturbation of the Fisher matrix
+            dF = np.array([[1.0, 0.5, 0.0], [0.5, 0.0, 0.2], [0.0, 0.2, 2.0]])
+            L_p = np.linalg.cholesky(F + h*dF)
+            L_m = np.linalg.cholesky(F - h*dF)
+            d_fd = (criterion(None, L_p, np.eye(3)) - criterion(None, L_m, np.eye(3))) / (2*h)
+            np.testing.assert_allclose(np.sum(G * dF), d_fd, rtol=1e-6)
+
+    def test_fisher_matrix_inverse(self):
+        S, C, F = self.define_matrices()
+        np.testing.assert_almost_equal(FisherMatrix(S, C).inverse, np.linalg.inv(F))
+        S_singular = np.array([[1.0, 2.0], [0.0, 0.0]])
+        np.testing.assert_almost_equal(FisherMatrix(S_singular, np.eye(2)).inverse, np.linalg.pinv(S_singular @ S_singular.T))
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+import types
+
+from eDPM import *
+from eDPM.solving import jit
+
+from test.setUp import default_model_small
+from test.setUp.pool_model import ModelParamInitialValues
+
+
+def _plain_njit(fun=None, **kwargs):
+    # Stand-in for numba.njit which keeps the functions in python
+    return fun
+
+
+@pytest.fixture()
+def plain_numba(monkeypatch):
+    monkeypatch.setattr(jit, "_import_numba", lambda: types.SimpleNamespace(njit=_plain_njit))
+    monkeypatch.setattr(jit, "_KERNELS", {})
+
+
+def _jit_model(fsm, **kwargs):
+    for key, value in kwargs.items():
+        setattr(fsm, key, value)
+    return FisherModelParametrized.init_from(fsm)
+
+
+@pytest.mark.parametrize("identical_times", [True, False])
+def test_jit_kernels_pool(plain_numba, identical_times):
+    fsm = ModelParamInitialValues(n_times=3, n_temps=2, identical_times=identical_times).fsm
+    S, C, _ = get_S_matrix(FisherModelParametrized.init_from(fsm))
+    S_jit, C_jit, _ = get_S_matrix(_jit_model(fsm, ode_jit=True, obs_jit=True))
+    np.testing.assert_allclose(S_jit, S, rtol=1e-12)
+    np.testing.assert_allclose(C_jit.toarray(), C.toarray())
+
+
+@pytest.mark.parametrize("identical_times", [True, False])
+def test_jit_kernels_default(plain_numba, default_model_small):
+    fsm = default_model_small.fsm
+    S, _, _ = get_S_matrix(FisherModelParametrized.init_from(fsm))
+    S_jit, _, _ = get_S_matrix(_jit_model(fsm, ode_jit=True, obs_jit=True))
+    np.testing.assert_allclose(S_jit, S, rtol=1e-12)
+
+
+def test_jit_kernel_cache(plain_numba):
+    fsmp = _jit_model(ModelParamInitialValues(n_times=3, n_temps=2).fsm, ode_jit=True)
+    get_S_matrix(fsmp)
+    kernels = dict(jit._KERNELS)
+    assert len(kernels) == 1
+
+    # Later evaluations reuse the compiled kernel
+    get_S_matrix(fsmp)
+    assert jit._KERNELS == kernels
+
+
+def test_jit_requires_numba():
+    try:
+        import numba
+        pytest.skip("numba is installed")
+    except ImportError:
+        pass
+    fsmp = _jit_model(ModelParamInitialValues().fsm, ode_jit=True)
+    with pytest.raises(ImportError):
+        get_S_matrix(fsmp)
+
+
+def test_numba_dispatchers():
+    numba = pytest.importorskip("numba")
+
+    @numba.njit
+    def f(t, x, inputs, parameters, ode_args):
+        return np.array([parameters[0] * inputs[0] * x[0] * (1 - x[0] / parameters[1])])
+
+    @numba.njit
+    def dfdx(t, x, inputs, parameters, ode_args):
+        return np.array([[parameters[0] * inputs[0] * (1 - 2 * x[0] / parameters[1])]])
+
+    @numba.njit
+    def dfdp(t, x, inputs, parameters, ode_args):
+        return np.array([[inputs[0] * x[0] * (1 - x[0] / parameters[1]), parameters[0] * inputs[0] * x[0]**2 / parameters[1]**2]])
+
+    assert jit.is_jitted(f)
+    fsm = FisherModel(ode_fun=f, ode_dfdx=dfdx, ode_dfdp=dfdp, ode_t0=0.0, ode_x0=0.1, times=np.linspace(1.0, 10.0, 4), inputs=[np.array([0.5, 1.0])], parameters=(0.8, 2.0))
+    S_jit, _, _ = get_S_matrix(FisherModelParametrized.init_from(fsm))
+    fsm.ode_fun, fsm.ode_dfdx, fsm.ode_dfdp = f.py_func, dfdx.py_func, dfdp.py_func
+    assert not jit.is_jitted(fsm.ode_fun)
+    S, _, _ = get_S_matrix(FisherModelParametrized.init_from(fsm))
+    np.testing.assert_allclose(S_jit, S, rtol=1e-10)
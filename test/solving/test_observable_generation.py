@@ -4,7 +4,8 @@ import pytest
 from eDPM.model import FisherModelParametrized
 from eDPM.solving import *
 
-from test.setUp import extended_baranyi_model, extended_baranyi_model_small, extended_baranyi_model_parametrized
+from test.setUp import extended_baranyi_model, extended_baranyi_model_small, extended_baranyi_model_parametrized, default_model_small
+from test.setUp.pool_model import ModelParamInitialValues
 
 
 class TestObservableGeneration:
@@ -24,3 +25,72 @@ class TestObservableGeneration:
                 results[j][2]
             ):
                 np.testing.assert_allclose(res_1.ode_solution.y, res_2.ode_solution.y)
+
+
+def pool_log_vectorized(t, y, Q, P, Const):
+    n0, c, n_max = Const
+    return [np.log((y[0]+n0)/n0)]
+
+
+def pool_log_dgdx_vectorized(t, y, Q, P, Const):
+    n0, c, n_max = Const
+    return [[1 / (y[0]+n0)]]
+
+
+def pool_log_dgdx0_vectorized(t, y, Q, P, Const):
+    n0, c, n_max = Const
+    return [[- y[0] / (n0*(y[0]+n0))]]
+
+
+class TestObservableVectorized:
+    @pytest.mark.parametrize("identical_times", [True, False])
+    def test_default_model(self, default_model_small):
+        # The observable of the default model only uses numpy operations and can be evaluated for all times at once
+        fsm = default_model_small.fsm
+        fsm.times = np.linspace(0.1, 10.0, 7)
+        S, C, _ = get_S_matrix(FisherModelParametrized.init_from(fsm), relative_sensitivities=True)
+        fsm.obs_vectorized = True
+        S_vec, C_vec, solutions = get_S_matrix(FisherModelParametrized.init_from(fsm), relative_sensitivities=True)
+        np.testing.assert_allclose(S_vec, S)
+        np.testing.assert_allclose(C_vec.toarray(), C.toarray())
+        assert solutions[0].observables.shape == (1, 7)
+
+    @pytest.mark.parametrize("identical_times", [True, False])
+    def test_x0_as_parameter(self, identical_times):
+        # The pool model uses the initial value as parameter and thus also obs_dgdx0
+        model = ModelParamInitialValues(n_times=5, n_temps=2, identical_times=identical_times)
+        fsm = model.fsm
+        S, _, _ = get_S_matrix(FisherModelParametrized.init_from(fsm))
+        fsm.obs_fun = pool_log_vectorized
+        fsm.obs_dgdx = pool_log_dgdx_vectorized
+        fsm.obs_dgdx0 = pool_log_dgdx0_vectorized
+        fsm.obs_vectorized = True
+        S_vec, _, _ = get_S_matrix(FisherModelParametrized.init_from(fsm))
+        assert S_vec.shape == S.shape == (3, 10)
+        np.testing.assert_allclose(S_vec, S)
+
+    @pytest.mark.parametrize("identical_times", [True])
+    def test_obs_dgdx_called_once(self, extended_baranyi_model_small):
+        fsm = extended_baranyi_model_small.fsm
+        fsm.times = np.linspace(0.1, 10.0, 5)
+        calls = []
+        def g(t, x, u, p, ode_args):
+            return [x[0], x[2]]
+        def dgdx(t, x, u, p, ode_args):
+            calls.append(t)
+            return [[1, 0, 0, 0], [0, 0, 1, 0]]
+        def dgdp(t, x, u, p, ode_args):
+            return np.zeros((2, 5))
+        fsm.obs_fun = g
+        fsm.obs_dgdx = dgdx
+        fsm.obs_dgdp = dgdp
+        fsmp = FisherModelParametrized.init_from(fsm)
+        n_conditions = len(fsmp.ode_x0) * len(fsmp.ode_t0) * len(fsmp.inputs[0])
+        get_S_matrix(fsmp)
+        assert len(calls) == 5 * n_conditions
+
+        # The vectorized observable is called once per condition
+        calls.clear()
+        fsm.obs_vectorized = True
+        get_S_matrix(FisherModelParametrized.init_from(fsm))
+        assert len(calls) == n_conditions
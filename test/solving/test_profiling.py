@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+import json
+
+from eDPM.solving import *
+from eDPM.solving.profiling import _WorkerCall, _merge_profile, _count
+from eDPM.optimization import find_optimal
+
+from test.setUp import default_model_small
+
+
+@pytest.mark.parametrize("identical_times", [True, False])
+def test_profiling_stages(default_model_small):
+    fsmp = default_model_small.fsmp
+    n_conditions = len(fsmp.ode_x0) * len(fsmp.ode_t0) * np.prod([len(q) for q in fsmp.inputs])
+
+    with profiling() as profiler:
+        calculate_fisher_criterion(fsmp)
+    data = profiler.as_dict()
+    for stage in ["sensitivities", "ode_integration", "criterion", "validation"]:
+        assert data["timers"][stage]["calls"] > 0
+        assert data["timers"][stage]["time"] >= 0.0
+    assert data["timers"]["ode_integration"]["calls"] == n_conditions
+    assert data["counters"]["ode_solves"] == n_conditions
+    assert data["counters"]["nfev"] > 0
+
+    # Nothing is measured outside of the block
+    assert get_profiler() is None
+    calculate_fisher_criterion(fsmp)
+    assert profiler.as_dict() == data
+
+
+def test_profiler_merge_and_output(tmp_path):
+    profiler = Profiler()
+    profiler.add_time("criterion", 0.5)
+    profiler.count("nfev", 10)
+    other = Profiler()
+    other.add_time("criterion", 0.25, calls=2)
+    other.add_time("ode_integration", 1.0)
+    other.count("nfev", 5)
+    profiler.merge(other.as_dict())
+
+    data = profiler.as_dict()
+    assert data["timers"]["criterion"] == {"calls": 3, "time": 0.75}
+    assert data["timers"]["ode_integration"] == {"calls": 1, "time": 1.0}
+    assert data["counters"] == {"nfev": 15}
+
+    out = tmp_path / "profile.json"
+    profiler.to_json(str(out))
+    assert json.loads(out.read_text()) == data
+    summary = profiler.summary()
+    assert "ode_integration" in summary and "nfev" in summary
+
+    profiler.reset()
+    assert profiler.as_dict() == {"timers": {}, "counters": {}}
+
+
+def test_worker_call_same_process():
+    # Calls within the creating process are measured by its profiler directly
+    def double(x):
+        _count("calls")
+        return 2 * x
+
+    with profiling() as profiler:
+        call = _WorkerCall(double)
+        value, solves, profile = call(3)
+        _merge_profile(profile)
+    assert value == 6
+    assert solves == 0
+    assert profile is None
+    # The call is recorded once and not merged a second time
+    assert profiler.as_dict()["counters"]["calls"] == 1
+
+
+@pytest.mark.parametrize("identical_times", [True])
+def test_profiling_processes(default_model_small):
+    fsmp = default_model_small.fsmp
+    n_conditions = len(fsmp.ode_x0) * len(fsmp.ode_t0) * np.prod([len(q) for q in fsmp.inputs])
+
+    # The measurements of the worker processes are merged into the profiler of the main process
+    with profiling() as profiler:
+        calculate_fisher_criterion(fsmp, solver_mode="processes", n_workers=2)
+    data = profiler.as_dict()
+    assert data["counters"]["ode_solves"] == n_conditions
+    assert data["timers"]["ode_integration"]["calls"] == n_conditions
+    assert data["counters"]["nfev"] > 0
+
+
+@pytest.mark.parametrize("identical_times", [True])
+def test_find_optimal_profile(default_model_small, tmp_path):
+    fsm = default_model_small.fsm
+    fsm.inputs = [{"lb": 2.0, "ub": 4.0, "n": 2}, np.arange(5, 5+2)]
+    fsm.times = {"lb": 0.0, "ub": 10.0, "n": 2}
+    out = tmp_path / "profile.json"
+    fsr = find_optimal(fsm, "scipy_differential_evolution", maxiter=2, popsize=4, polish=False, workers=2, verbose=False, profile=str(out))
+    data = fsr.profile.as_dict()
+    assert data["counters"]["evaluations"] > 0
+    assert data["counters"]["nfev"] > 0
+    assert data["timers"]["objective"]["calls"] == data["counters"]["evaluations"]
+    assert json.loads(out.read_text()) == data
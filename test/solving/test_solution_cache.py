@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+import pickle
+
+from eDPM.model import FisherModelParametrized
+from eDPM.solving import *
+
+from test.setUp import default_model_small
+
+
+def _change_times(default_model_small, times):
+    fsm = default_model_small.fsm
+    fsm.times = times
+    return FisherModelParametrized.init_from(fsm)
+
+
+@pytest.mark.parametrize("identical_times", [True, False])
+def test_solution_cache_hits(default_model_small):
+    fsmp = default_model_small.fsmp
+    n_conditions = len(fsmp.ode_x0) * len(fsmp.ode_t0) * np.prod([len(q) for q in fsmp.inputs])
+    cache = SolutionCache()
+
+    S_ref, C_ref, _ = get_S_matrix(fsmp, solver_options={"rtol": 1e-8, "atol": 1e-10})
+    S, C, _ = get_S_matrix(fsmp, solver_options={"rtol": 1e-8, "atol": 1e-10}, solution_cache=cache)
+    np.testing.assert_allclose(S, S_ref, rtol=1e-5, atol=1e-8*np.max(np.abs(S_ref)))
+    assert cache.cache_info() == CacheInfo(0, n_conditions, 128, n_conditions)
+
+    # Evaluating again does not solve the ODEs but interpolates the stored solutions
+    S_cached, _, solutions = get_S_matrix(fsmp, solver_options={"rtol": 1e-8, "atol": 1e-10}, solution_cache=cache)
+    np.testing.assert_allclose(S_cached, S)
+    assert cache.cache_info() == CacheInfo(n_conditions, n_conditions, 128, n_conditions)
+    assert all(fsrs.ode_solution.nfev == 0 for fsrs in solutions)
+
+    # Different solver options are stored separately
+    get_S_matrix(fsmp, solution_cache=cache)
+    assert cache.cache_info().currsize == 2 * n_conditions
+
+
+@pytest.mark.parametrize("identical_times", [True])
+def test_solution_cache_changed_times(default_model_small):
+    # The solutions are integrated up to the upper bound of the sampled times
+    fsmp = _change_times(default_model_small, {"lb": 0.0, "ub": 10.0, "n": 3})
+    cache = SolutionCache()
+    get_S_matrix(fsmp, solver_options={"rtol": 1e-8, "atol": 1e-10}, solution_cache=cache)
+    misses = cache.misses
+
+    # Only the times change such that all conditions are served by the cache
+    fsmp.times = np.array([0.5, 4.0, 9.5])
+    S_ref, _, _ = get_S_matrix(fsmp, solver_options={"rtol": 1e-8, "atol": 1e-10})
+    S, _, _ = get_S_matrix(fsmp, solver_options={"rtol": 1e-8, "atol": 1e-10}, solution_cache=cache)
+    assert cache.misses == misses
+    np.testing.assert_allclose(S, S_ref, rtol=1e-5, atol=1e-8*np.max(np.abs(S_ref)))
+
+
+@pytest.mark.parametrize("identical_times", [True])
+def test_solution_cache_exceeding_times(default_model_small):
+    fsmp = default_model_small.fsmp
+    cache = SolutionCache()
+    get_S_matrix(fsmp, solution_cache=cache)
+    hits, misses = cache.hits, cache.misses
+
+    # Times beyond the stored solution need to be solved again
+    fsmp_new = _change_times(default_model_small, np.max(fsmp.times) + np.arange(1.0, 4.0))
+    S_ref, _, _ = get_S_matrix(fsmp_new)
+    S, _, _ = get_S_matrix(fsmp_new, solution_cache=cache)
+    assert cache.hits == hits
+    assert cache.misses == 2 * misses
+    np.testing.assert_allclose(S, S_ref, rtol=1e-2, atol=1e-3*np.max(np.abs(S_ref)))
+
+
+def test_solution_cache_lru():
+    cache = SolutionCache(maxsize=2)
+    res = lambda t: type("Res", (), {"t": np.array([0.0, t])})
+    cache.put("a", res(1.0))
+    cache.put("b", res(1.0))
+    assert cache.get("a", 0.5) is not None
+    cache.put("c", res(1.0))
+    # "b" was used least recently
+    assert cache.get("b", 0.5) is None
+    assert cache.get("a", 0.5) is not None
+    assert cache.get("c", 2.0) is None
+    assert cache.cache_info() == CacheInfo(2, 2, 2, 2)
+    cache.clear()
+    assert cache.cache_info() == CacheInfo(0, 0, 2, 0)
+    with pytest.raises(ValueError):
+        SolutionCache(maxsize=0)
+
+
+def test_solution_cache_pickle():
+    cache = SolutionCache(maxsize=3)
+    # Caches restored in the same process are identical such that workers keep their solutions
+    cache_restored = pickle.loads(pickle.dumps(cache))
+    assert cache_restored.maxsize == 3
+    assert pickle.loads(pickle.dumps(cache)) is cache_restored
@@ -6,7 +6,8 @@ import itertools
 from eDPM.model import FisherModelParametrized
 from eDPM.solving import *
 
-from test.setUp import default_model, default_model_parametrized, default_model_small, pool_model_small
+from test.setUp import default_model, default_model_parametrized, default_model_small, pool_model, pool_model_small, model_init_params_small
+from test.setUp.fisher_model import ModelDefault
 
 
 def comb_gen_solving():
@@ -88,3 +89,240 @@ def test_calculate_criterion(default_model_small, criterion, relative_sensitivit
 def test_use_initial_value_as_parameter(pool_model_small, criterion, relative_sensitivities):
     fsmp = pool_model_small.fsmp
     fsr = calculate_fisher_criterion(fsmp, criterion=criterion, relative_sensitivities=relative_sensitivities)
+
+
+@pytest.mark.parametrize("identical_times,solver_mode", list(itertools.product([True, False], ["threads", "processes"])))
+def test_solver_mode_parallel(default_model_small, solver_mode):
+    fsm = default_model_small.fsm
+    fsm.inputs = [np.arange(2, 5), np.arange(5, 7)]
+    fsmp = FisherModelParametrized.init_from(fsm)
+    S_serial, C_serial, solutions_serial = get_S_matrix(fsmp)
+    S, C, solutions = get_S_matrix(fsmp, solver_mode=solver_mode, n_workers=2)
+    np.testing.assert_allclose(S, S_serial)
+    np.testing.assert_allclose(C.diagonal(), C_serial.diagonal())
+    for sol, sol_serial in zip(solutions, solutions_serial):
+        np.testing.assert_allclose(sol.inputs, sol_serial.inputs)
+        np.testing.assert_allclose(sol.ode_solution.y, sol_serial.ode_solution.y)
+
+
+@pytest.mark.parametrize("identical_times", [True])
+def test_solver_mode_processes_reuses_pool(default_model_small):
+    from eDPM.solving import solve_fsm
+    fsmp = default_model_small.fsmp
+    S_serial, _, _ = get_S_matrix(fsmp)
+    S, _, _ = get_S_matrix(fsmp, solver_mode="processes", n_workers=2)
+    executor = solve_fsm._PROCESS_POOLS[2][1]
+    S_again, _, _ = get_S_matrix(fsmp, solver_mode="processes", n_workers=2)
+    assert solve_fsm._PROCESS_POOLS[2][1] is executor
+    np.testing.assert_allclose(S, S_serial)
+    np.testing.assert_allclose(S_again, S_serial)
+
+
+@pytest.mark.parametrize("identical_times", [True])
+def test_solver_mode_unknown(default_model_small):
+    with pytest.raises(ValueError):
+        get_S_matrix(default_model_small.fsmp, solver_mode="unknown")
+
+
+@pytest.mark.parametrize("identical_times,ode_vectorized", list(itertools.product([True, False], [True, False])))
+def test_solver_mode_stacked(default_model_small, ode_vectorized):
+    fsm = default_model_small.fsm
+    fsm.inputs = [np.arange(2, 5), np.arange(5, 7)]
+    fsm.ode_vectorized = ode_vectorized
+    fsmp = FisherModelParametrized.init_from(fsm)
+    S_serial, C_serial, solutions_serial = get_S_matrix(fsmp)
+    S, C, solutions = get_S_matrix(fsmp, solver_mode="stacked")
+    np.testing.assert_allclose(S, S_serial, rtol=1e-2, atol=1e-3*np.max(np.abs(S_serial)))
+    for sol, sol_serial in zip(solutions, solutions_serial):
+        np.testing.assert_allclose(sol.inputs, sol_serial.inputs)
+        np.testing.assert_allclose(sol.ode_solution.t, sol_serial.ode_solution.t)
+
+
+@pytest.mark.parametrize("identical_times", [True, False])
+def test_solver_mode_stacked_initial_value_as_parameter(pool_model_small):
+    fsm = pool_model_small.fsm
+    fsm.inputs = [np.linspace(2.0, 20.0, 3)]
+    fsm.ode_vectorized = True
+    fsmp = FisherModelParametrized.init_from(fsm)
+    S_serial, _, _ = get_S_matrix(fsmp)
+    S, _, _ = get_S_matrix(fsmp, solver_mode="stacked")
+    np.testing.assert_allclose(S, S_serial, rtol=1e-2, atol=1e-3*np.max(np.abs(S_serial)))
+
+
+def test_ode_rhs_initial_values_as_parameter():
+    from test.setUp.fisher_model import f_init_vals, dfdx_init_vals, dfdp_init_vals, dfdx0_init_vals
+    t0 = 0.3
+    Q = [0.4]
+    params = (2.0, 0.8)
+    ode_args = (0.3,)
+    n_x, n_p = 3, 2
+    x = np.array([1.0, 0.6, 0.3])
+    s = np.arange(n_x * n_p, dtype=float).reshape((n_x, n_p))
+    s_x0 = np.arange(n_x * n_x, dtype=float).reshape((n_x, n_x)) / 10
+    rhs = OdeRhs(f_init_vals, dfdx_init_vals, dfdp_init_vals, dfdx0_init_vals, Q, params, ode_args, n_x, n_p)
+    res = rhs(t0, np.concatenate((x, s.flatten(), s_x0.flatten())))
+
+    dfdx = np.array(dfdx_init_vals(t0, x, Q, params, ode_args))
+    np.testing.assert_almost_equal(res[:n_x], f_init_vals(t0, x, Q, params, ode_args))
+    np.testing.assert_almost_equal(res[n_x:n_x + n_x*n_p], (dfdx @ s + np.array(dfdp_init_vals(t0, x, Q, params, ode_args))).flatten())
+    np.testing.assert_almost_equal(res[n_x + n_x*n_p:], (dfdx @ s_x0 + np.array(dfdx0_init_vals(t0, x, Q, params, ode_args))).flatten())
+
+    # The returned array must not be overwritten by subsequent calls
+    res_2 = rhs(t0, np.zeros(res.size))
+    assert not np.shares_memory(res, res_2)
+
+
+@pytest.mark.parametrize("identical_times", [True, False])
+def test_get_S_matrix_initial_values_as_parameter_multidimensional(model_init_params_small):
+    fsm = model_init_params_small.fsm
+    fsm.inputs = [np.array([0.2, 0.5])]
+    fsm.times = np.array([0.0, 1.0, 2.0])
+    fsmp = FisherModelParametrized.init_from(fsm)
+    S, C, solutions = get_S_matrix(fsmp)
+    n_x, n_p = 3, 2
+    assert S.shape[0] == n_p + n_x
+    for sol in solutions:
+        # At the initial time the sensitivities with respect to the initial values are the identity
+        np.testing.assert_allclose(sol.ode_solution.y[n_x + n_x*n_p:, 0], np.eye(n_x).flatten())
+
+
+@pytest.mark.parametrize("with_x0,sparse_jacobian", list(itertools.product([True, False], [True, False])))
+def test_ode_rhs_jacobian(with_x0, sparse_jacobian):
+    from test.setUp.fisher_model import f_default, dfdx_default, dfdp_default, dfdx0_default
+    t0 = 0.3
+    Q = [2.0, 5.0]
+    params = (2.95, 8.4768, 0.001)
+    ode_args = (1.0, 2.0, 1.5)
+    n_x, n_p = 2, 3
+    rhs = OdeRhs(f_default, dfdx_default, dfdp_default, dfdx0_default if with_x0 else None, Q, params, ode_args, n_x, n_p, jacobian="full", sparse_jacobian=sparse_jacobian)
+    x = np.linspace(0.2, 1.0, rhs.n_total)
+
+    J = rhs.jac(t0, x)
+    if sparse_jacobian:
+        assert sp.sparse.issparse(J)
+        J = J.toarray()
+
+    # Compare against central differences of the full right-hand side
+    h = 1e-6
+    J_fd = np.array([(rhs(t0, x + h*e) - rhs(t0, x - h*e)) / (2*h) for e in np.eye(rhs.n_total)]).T
+    np.testing.assert_allclose(J, J_fd, atol=1e-5)
+
+    # The block Jacobian only neglects the coupling of sensitivities to the state variables
+    rhs_block = OdeRhs(f_default, dfdx_default, dfdp_default, dfdx0_default if with_x0 else None, Q, params, ode_args, n_x, n_p, jacobian="block")
+    J_block = rhs_block.jac(t0, x)
+    np.testing.assert_allclose(J_block[:, n_x:], J_fd[:, n_x:], atol=1e-5)
+    np.testing.assert_allclose(J_block[n_x:, :n_x], 0.0)
+
+
+@pytest.mark.parametrize("identical_times,jacobian", list(itertools.product([True, False], JACOBIAN_MODES)))
+def test_get_S_matrix_jacobian(default_model_small, jacobian):
+    fsmp = default_model_small.fsmp
+    S_fd, _, _ = get_S_matrix(fsmp, solver_options={"jacobian": None})
+    S, _, _ = get_S_matrix(fsmp, solver_options={"jacobian": jacobian})
+    np.testing.assert_allclose(S, S_fd, rtol=1e-2, atol=1e-3*np.max(np.abs(S_fd)))
+
+
+@pytest.mark.parametrize("identical_times,relative_sensitivities,covariance", list(itertools.product([True, False], [True, False], [None, {"rel": 0.1, "abs": 0.01}])))
+def test_get_S_matrix_population(relative_sensitivities, covariance, identical_times):
+    model = ModelDefault(N_x0=1, n_t0=1, n_times=3, n_inputs_0=2, n_inputs_1=1, identical_times=identical_times)
+    fsm = model.fsm
+    fsm.times = {"lb": 0.0, "ub": 10.0, "n": 3}
+    fsm.covariance = covariance
+    fsmp = FisherModelParametrized.init_from(fsm)
+
+    rng = np.random.default_rng(0)
+    times_population = np.sort(rng.uniform(0.1, 10.0, (3,) + fsmp.times.shape), axis=-1)
+    solver_options = {"rtol": 1e-7, "atol": 1e-10}
+    results = get_S_matrix_population(fsmp, times_population, relative_sensitivities, solver_options=solver_options)
+    crits = calculate_fisher_criterion_population(fsmp, times_population, relative_sensitivities=relative_sensitivities, solver_options=solver_options)
+
+    # Every candidate agrees with solving the ODEs directly at its times
+    for (S_pop, C_pop), crit, times in zip(results, crits, times_population):
+        fsmp.times = times
+        fsr = calculate_fisher_criterion(fsmp, relative_sensitivities=relative_sensitivities, solver_options=solver_options)
+        np.testing.assert_allclose(S_pop, fsr.S, rtol=1e-4, atol=1e-7*np.max(np.abs(fsr.S)))
+        np.testing.assert_allclose(C_pop.diagonal(), fsr.C.diagonal(), rtol=1e-4)
+        np.testing.assert_allclose(crit, fsr.criterion, rtol=1e-3)
+
+
+@pytest.mark.parametrize("identical_times,relative_sensitivities,covariance", [
+    (True, False, None),
+    (False, False, None),
+    (True, True, {"rel": 0.1, "abs": 0.01}),
+    (False, True, {"rel": 0.1, "abs": 0.01}),
+])
+def test_calculate_fisher_criterion_gradient(relative_sensitivities, covariance, identical_times):
+    criterion = fisher_logdeterminant
+    model = ModelDefault(N_x0=1, n_t0=1, n_times=3, n_inputs_0=2, n_inputs_1=1, identical_times=identical_times)
+    fsm = model.fsm
+    fsm.times = {"lb": 0.0, "ub": 3.0, "n": 3}
+    fsm.covariance = covariance
+    fsmp = FisherModelParametrized.init_from(fsm)
+    fsmp.times = np.sort(np.random.default_rng(0).uniform(0.2, 3.0, fsmp.times.shape), axis=-1)
+    solver_options = {"rtol": 1e-10, "atol": 1e-12}
+
+    crit, grad = calculate_fisher_criterion_gradient(fsmp, criterion, relative_sensitivities, solver_options=solver_options)
+    assert grad.shape == fsmp.times.shape
+    np.testing.assert_allclose(crit, calculate_fisher_criterion(fsmp, criterion, relative_sensitivities, solver_options=solver_options).criterion)
+
+    # Compare with central differences of the criterion
+    times = np.array(fsmp.times)
+    grad_fd = np.zeros(times.shape)
+    h = 1e-4
+    for i in np.ndindex(times.shape):
+        crits = []
+        for sign in [1.0, -1.0]:
+            times_h = times.copy()
+            times_h[i] += sign*h
+            crits.append(calculate_fisher_criterion(fsmp.with_values(times=times_h), criterion, relative_sensitivities, solver_options=solver_options).criterion)
+        grad_fd[i] = (crits[0] - crits[1]) / (2*h)
+    np.testing.assert_allclose(grad, grad_fd, rtol=1e-4, atol=1e-6*np.max(np.abs(grad_fd)))
+
+
+@pytest.mark.parametrize("identical_times", [True, False])
+def test_calculate_fisher_criterion_gradient_cached(identical_times):
+    # With cached dense solutions the gradient is consistent with the interpolated criterion
+    model = ModelDefault(N_x0=1, n_t0=1, n_times=3, n_inputs_0=2, n_inputs_1=1, identical_times=identical_times)
+    fsm = model.fsm
+    fsm.times = {"lb": 0.0, "ub": 10.0, "n": 3}
+    fsmp = FisherModelParametrized.init_from(fsm)
+    fsmp.times = np.sort(np.random.default_rng(0).uniform(0.5, 9.5, fsmp.times.shape), axis=-1)
+    solution_cache = SolutionCache()
+
+    crit, grad = calculate_fisher_criterion_gradient(fsmp, fisher_logdeterminant, solution_cache=solution_cache)
+    times = np.array(fsmp.times)
+    grad_fd = np.zeros(times.shape)
+    h = 1e-3
+    for i in np.ndindex(times.shape):
+        crits = []
+        for sign in [1.0, -1.0]:
+            times_h = times.copy()
+            times_h[i] += sign*h
+            crits.append(calculate_fisher_criterion(fsmp.with_values(times=times_h), fisher_logdeterminant, solution_cache=solution_cache).criterion)
+        grad_fd[i] = (crits[0] - crits[1]) / (2*h)
+    np.testing.assert_allclose(grad, grad_fd, rtol=1e-4, atol=1e-5*np.max(np.abs(grad_fd)))
+    assert solution_cache.cache_info().misses == len(solution_cache)
+
+
+def test_calculate_fisher_criterion_gradient_initial_values(pool_model):
+    # The observable and the sensitivities with respect to the initial values are differentiated as well
+    fsmp = pool_model.fsmp.with_values(times=np.array([3.0, 9.0]))
+    solver_options = {"rtol": 1e-10, "atol": 1e-12}
+    crit, grad = calculate_fisher_criterion_gradient(fsmp, fisher_sumeigenval, solver_options=solver_options)
+
+    h = 1e-4
+    for i in range(2):
+        times_p = np.array(fsmp.times)
+        times_p[i] += h
+        times_m = np.array(fsmp.times)
+        times_m[i] -= h
+        crit_p = calculate_fisher_criterion(fsmp.with_values(times=times_p), fisher_sumeigenval, solver_options=solver_options).criterion
+        crit_m = calculate_fisher_criterion(fsmp.with_values(times=times_m), fisher_sumeigenval, solver_options=solver_options).criterion
+        np.testing.assert_allclose(grad[i], (crit_p - crit_m) / (2*h), rtol=1e-5)
+
+
+@pytest.mark.parametrize("identical_times", [True])
+def test_calculate_fisher_criterion_gradient_unknown_criterion(default_model_small):
+    fsmp = default_model_small.fsmp
+    with pytest.raises(ValueError):
+        calculate_fisher_criterion_gradient(fsmp, lambda fsmp, S, C: 1.0)
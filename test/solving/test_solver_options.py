@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+import itertools
+
+from eDPM.solving import *
+
+from test.setUp import default_model_small
+
+
+@pytest.mark.parametrize("identical_times,method", list(itertools.product([True, False], ["RK45", "DOP853", "Radau", "BDF", "LSODA"])))
+def test_get_S_matrix_methods(default_model_small, method):
+    fsmp = default_model_small.fsmp
+    S_ref, _, _ = get_S_matrix(fsmp, solver_options=SolverOptions(rtol=1e-8, atol=1e-10))
+    S, _, _ = get_S_matrix(fsmp, solver_options={"method": method, "rtol": 1e-6, "atol": 1e-8})
+    np.testing.assert_allclose(S, S_ref, rtol=1e-3, atol=1e-5*np.max(np.abs(S_ref)))
+
+
+@pytest.mark.parametrize("identical_times,solver_mode", list(itertools.product([True, False], ["serial", "stacked"])))
+def test_solver_options_dense_output(default_model_small, solver_mode):
+    fsmp = default_model_small.fsmp
+    fsr = calculate_fisher_criterion(fsmp, solver_mode=solver_mode, solver_options={"dense_output": True, "max_step": 1.0})
+    for fsrs in fsr.individual_results:
+        assert fsrs.ode_solution.sol is not None
+        np.testing.assert_allclose(fsrs.ode_solution.sol(fsrs.ode_solution.t), fsrs.ode_solution.y, rtol=1e-8)
+
+
+@pytest.mark.parametrize("identical_times", [True])
+def test_solver_options_sparse_jacobian(default_model_small):
+    fsmp = default_model_small.fsmp
+    S_ref, _, _ = get_S_matrix(fsmp, solver_options={"method": "BDF", "jacobian": "full"})
+    S, _, _ = get_S_matrix(fsmp, solver_options={"method": "BDF", "jacobian": "full", "sparse_jacobian": True})
+    np.testing.assert_allclose(S, S_ref)
+
+
+def test_solver_options_default_jacobian():
+    # By default the integrator approximates the Jacobian itself
+    rhs = OdeRhs(None, None, None, None, [], (), None, 1, 1)
+    assert SolverOptions().jacobian is None
+    assert "jac" not in SolverOptions().solve_ivp_args(rhs)
+    assert "jac" in SolverOptions(jacobian="full").solve_ivp_args(rhs)
+
+
+def test_solver_options_invalid():
+    with pytest.raises(ValueError):
+        SolverOptions(method="Euler")
+    with pytest.raises(ValueError):
+        SolverOptions(jacobian="exact")
+    with pytest.raises(ValueError):
+        SolverOptions(method="LSODA", sparse_jacobian=True)
+    with pytest.raises(ValueError):
+        SolverOptions(method="BDF", sparse_jacobian=True)
+    with pytest.raises(ValueError):
+        SolverOptions(coarse_factor=0.5)
+    with pytest.raises(TypeError):
+        get_solver_options(1e-4)
+
+
+def test_solver_options_coarse():
+    so = SolverOptions(rtol=1e-6, atol=1e-8, method="BDF")
+    so_coarse = so.coarse()
+    assert so_coarse.rtol == pytest.approx(1e-5)
+    assert so_coarse.atol == pytest.approx(1e-7)
+    assert so_coarse.method == "BDF"
+    # The original options are not modified
+    assert so.rtol == 1e-6
+
+    # The relative tolerance is not loosened beyond 1e-2 and never tightened
+    assert SolverOptions(rtol=5e-3).coarse().rtol == pytest.approx(1e-2)
+    assert SolverOptions(rtol=5e-2).coarse().rtol == pytest.approx(5e-2)
+    assert SolverOptions(coarse_factor=1.0).coarse() == SolverOptions(coarse_factor=1.0)
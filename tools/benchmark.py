@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+
+#################################
+# THESE LINES ARE ONLY NEEDED   #
+# WHEN eDPM IS NOT INSTALLED #
+# OTHERWISE REMOVE THEM         #
+#################################
+import os, sys
+sys.path.insert(0, os.getcwd())
+#################################
+
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+import numpy as np
+
+from eDPM import *
+from eDPM.solving.profiling import Profiler, profiling
+
+from test.setUp.fisher_model import ModelDefault
+from test.setUp.extended_baranyi import ModelExtendedBaranyi
+from test.setUp.pool_model import ModelParamInitialValues as ModelPool
+from examples.damped_oscillator import damped_osci, damped_osci_dfdx, damped_osci_dfdp
+
+
+# Linear chain of reactions x_0 -> x_1 -> ... -> x_n whose rates are the parameters.
+# Used to scale the number of parameters (and states) of the model.
+def chain(t, x, inputs, params, consts):
+    (T,) = inputs
+    flux = T * np.asarray(params) * np.asarray(x)[:-1]
+    return np.concatenate([[0.0], flux]) - np.concatenate([flux, [0.0]])
+
+
+def chain_dfdx(t, x, inputs, params, consts):
+    (T,) = inputs
+    n = len(params)
+    dfdx = np.zeros((n+1, n+1))
+    for i, p in enumerate(params):
+        dfdx[i, i] -= T * p
+        dfdx[i+1, i] += T * p
+    return dfdx
+
+
+def chain_dfdp(t, x, inputs, params, consts):
+    (T,) = inputs
+    n = len(params)
+    dfdp = np.zeros((n+1, n))
+    for i in range(n):
+        dfdp[i, i] -= T * x[i]
+        dfdp[i+1, i] += T * x[i]
+    return dfdp
+
+
+def model_default(n_inputs=1, n_times=5):
+    return ModelDefault(N_x0=1, n_t0=1, n_times=n_times, n_inputs_0=n_inputs, n_inputs_1=1, identical_times=True).fsm
+
+
+def model_baranyi(n_inputs=2, n_times=5):
+    return ModelExtendedBaranyi(N_x0=1, n_t0=1, n_times=n_times, n_inputs=n_inputs, identical_times=True).fsm
+
+
+def model_pool(n_inputs=2, n_times=4):
+    return ModelPool(n_times=n_times, n_temps=n_inputs).fsm
+
+
+def model_damped_oscillator(n_inputs=1, n_times=3):
+    return FisherModel(
+        ode_fun=damped_osci,
+        ode_dfdx=damped_osci_dfdx,
+        ode_dfdp=damped_osci_dfdp,
+        ode_t0=0.0,
+        ode_x0=[6.0, 20.0],
+        times={"lb": 0.0, "ub": 10.0, "n": n_times},
+        inputs=[np.linspace(0.08, 0.12, n_inputs)],
+        parameters=(3.0, 1.0, 5.0),
+    )
+
+
+def model_chain(n_parameters=2, n_inputs=2, n_times=5):
+    x0 = np.zeros(n_parameters + 1)
+    x0[0] = 1.0
+    return FisherModel(
+        ode_fun=chain,
+        ode_dfdx=chain_dfdx,
+        ode_dfdp=chain_dfdp,
+        ode_t0=0.0,
+        ode_x0=[x0],
+        times=np.linspace(0.5, 10.0, n_times),
+        inputs=[np.linspace(0.5, 2.0, n_inputs)],
+        parameters=tuple(0.3 + 0.1 * np.arange(n_parameters)),
+        identical_times=True,
+    )
+
+
+# Formulation of the pool model which is compatible with the nopython mode of numba.
+# The functions return arrays with the documented shapes instead of (nested) lists.
+def pool_nb(t, y, Q, P, Const):
+    a, b = P
+    n0, c, n_max = Const
+    return np.array([(a*Q[0] + c) * (y[0] - n0*np.exp(-b*Q[0]*t))*(1-y[0]/n_max)])
+
+
+def pool_nb_dfdx(t, y, Q, P, Const):
+    a, b = P
+    n0, c, n_max = Const
+    return np.array([[(a*Q[0] + c) * (1-y[0]/n_max) - (a*Q[0] + c) * (y[0] - n0*np.exp(-b*Q[0]*t))/n_max]])
+
+
+def pool_nb_dfdp(t, y, Q, P, Const):
+    a, b = P
+    n0, c, n_max = Const
+    return np.array([[
+        Q[0] * (y[0] - n0*np.exp(-b*Q[0]*t))*(1-y[0]/n_max),
+        (a*Q[0] + c) * (Q[0]*t*n0*np.exp(-b*Q[0]*t))*(1-y[0]/n_max)
+    ]])
+
+
+def pool_nb_dfdx0(t, y, Q, P, Const):
+    a, b = P
+    n0, c, n_max = Const
+    return np.array([[-(a*Q[0] + c) * np.exp(-b*Q[0]*t)*(1-y[0]/n_max)]])
+
+
+def pool_nb_log(t, y, Q, P, Const):
+    return np.array([np.log((y[0]+Const[0])/Const[0])])
+
+
+def pool_nb_log_dgdx(t, y, Q, P, Const):
+    return np.array([[1 / (y[0]+Const[0])]])
+
+
+def pool_nb_log_dgdp(t, y, Q, P, Const):
+    return np.zeros((1, 2))
+
+
+def pool_nb_log_dgdx0(t, y, Q, P, Const):
+    return np.array([[-y[0] / (Const[0]*(y[0]+Const[0]))]])
+
+
+def model_pool_jit(n_inputs=2, n_times=4, jit=True):
+    fsm = model_pool(n_inputs=n_inputs, n_times=n_times)
+    fsm.ode_fun, fsm.ode_dfdx, fsm.ode_dfdp, fsm.ode_dfdx0 = pool_nb, pool_nb_dfdx, pool_nb_dfdp, pool_nb_dfdx0
+    fsm.obs_fun, fsm.obs_dgdx, fsm.obs_dgdp, fsm.obs_dgdx0 = pool_nb_log, pool_nb_log_dgdx, pool_nb_log_dgdp, pool_nb_log_dgdx0
+    fsm.ode_jit, fsm.obs_jit = jit, jit
+    return fsm
+
+
+def _numba_available():
+    try:
+        import numba
+    except ImportError:
+        return False
+    return True
+
+
+def sample_times(fsm, n_times):
+    # Let the optimizers sample the times of the model
+    fsm.times = {"lb": 0.0, "ub": 10.0, "n": n_times}
+    fsm.identical_times = True
+    return fsm
+
+
+def criterion_cases(quick=False):
+    """The benchmarks of :py:meth:`calculate_fisher_criterion` as a dictionary of names and functions creating the FisherModel."""
+    sizes = [1, 4] if quick else [1, 4, 16, 64]
+    times = [5, 20] if quick else [5, 20, 80]
+    parameters = [2, 4] if quick else [2, 4, 8, 16]
+    cases = {}
+    for n in sizes:
+        cases["criterion/default/inputs={}".format(n)] = lambda n=n: model_default(n_inputs=n)
+    for n in times:
+        cases["criterion/default/times={}".format(n)] = lambda n=n: model_default(n_times=n)
+    for n in parameters:
+        cases["criterion/chain/parameters={}".format(n)] = lambda n=n: model_chain(n_parameters=n)
+    cases["criterion/baranyi"] = model_baranyi
+    cases["criterion/pool"] = model_pool
+    cases["criterion/damped_oscillator"] = model_damped_oscillator
+    if _numba_available():
+        cases["criterion/pool/jit"] = model_pool_jit
+    return cases
+
+
+def rhs_cases(quick=False):
+    """The benchmarks of a single evaluation of the right-hand side of the ODEs as used by the integrator.
+    The compiled variant is only included if numba is installed."""
+    cases = {"rhs/pool": lambda: model_pool_jit(jit=False)}
+    if _numba_available():
+        cases["rhs/pool/jit"] = model_pool_jit
+    return cases
+
+
+def _rhs_and_state(fsm):
+    from eDPM.solving.solve_fsm import _condition_rhs, _model_dimensions
+    fsmp = FisherModelParametrized.init_from(fsm)
+    n_t0, n_x0, n_p, n_p_full, N_x0, inputs_shape, n_obs = _model_dimensions(fsmp)
+    rhs = _condition_rhs(fsmp, [q[0] for q in fsmp.inputs], n_x0, n_p)
+    y = np.concatenate([fsmp.ode_x0[0], np.zeros(rhs.n_total - n_x0)])
+    return rhs, y
+
+
+def optimization_cases(quick=False):
+    """The benchmarks of :py:meth:`find_optimal` as a dictionary of names and tuples of a function creating the FisherModel and the arguments."""
+    de_args = {"optimization_strategy": "scipy_differential_evolution", "maxiter": 2 if quick else 5, "popsize": 5, "polish": False, "seed": 0, "disp": False}
+    cases = {
+        "optimize/damped_oscillator/de": (lambda: model_damped_oscillator(), de_args),
+        "optimize/pool/de": (lambda: model_pool(n_inputs=1, n_times=3), de_args),
+        "optimize/chain/de": (lambda: sample_times(model_chain(n_parameters=3), 4), de_args),
+        "optimize/pool/multistart": (lambda: model_pool(n_inputs=1, n_times=3), {"optimization_strategy": "multistart", "n_starts": 2, "workers": 1, "seed": 0}),
+    }
+    return cases
+
+
+def _measure(run, repeat: int):
+    # Time the repetitions, count the evaluations with a profiler and measure the peak memory in a separate run
+    # since tracemalloc slows down the execution considerably.
+    times = []
+    profiler = Profiler()
+    for _ in range(repeat):
+        profiler.reset()
+        with profiling(profiler):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return float(np.median(times)), float(np.min(times)), peak, profiler.as_dict()["counters"]
+
+
+def run_benchmarks(quick=False, repeat: int=3, pattern: str=None) -> dict:
+    """Run all benchmarks whose name contains the pattern.
+
+    :return: The results of every benchmark with its median and minimal time, the evaluations per second, the peak memory in MiB and the number of evaluations of the right-hand side of the ODEs.
+    :rtype: dict
+    """
+    results = {}
+    for name, create in criterion_cases(quick).items():
+        if pattern is not None and pattern not in name:
+            continue
+        fsmp = FisherModelParametrized.init_from(create())
+        # Exclude one-time costs such as the compilation of kernels
+        calculate_fisher_criterion(fsmp)
+        median, best, peak, counters = _measure(lambda: calculate_fisher_criterion(fsmp), repeat)
+        results[name] = {"time": median, "time_min": best, "evals_per_sec": 1 / median, "peak_memory_mb": peak / 2**20, "nfev": counters.get("nfev", 0)}
+        _print_result(name, results[name])
+
+    n_calls = 1000 if quick else 10000
+    for name, create in rhs_cases(quick).items():
+        if pattern is not None and pattern not in name:
+            continue
+        rhs, y = _rhs_and_state(create())
+        rhs(0.0, y)
+        def run():
+            for _ in range(n_calls):
+                rhs(1.0, y)
+        median, best, peak, counters = _measure(run, repeat)
+        results[name] = {"time": median, "time_min": best, "evals_per_sec": n_calls / median, "peak_memory_mb": peak / 2**20, "nfev": n_calls}
+        _print_result(name, results[name])
+
+    for name, (create, args) in optimization_cases(quick).items():
+        if pattern is not None and pattern not in name:
+            continue
+        fsm = create()
+        median, best, peak, counters = _measure(lambda: find_optimal(fsm, verbose=False, **args), repeat)
+        results[name] = {"time": median, "time_min": best, "evals_per_sec": counters.get("evaluations", 0) / median, "peak_memory_mb": peak / 2**20, "nfev": counters.get("nfev", 0)}
+        _print_result(name, results[name])
+    return results
+
+
+def _print_result(name, result):
+    print("{:<40}  {:>12.5f}  {:>12.1f}  {:>10.2f}  {:>10}".format(name, result["time"], result["evals_per_sec"], result["peak_memory_mb"], result["nfev"]), flush=True)
+
+
+def compare(results: dict, baseline: dict, tolerance: float=0.25) -> list:
+    """Compare the results with a stored baseline.
+
+    :param results: The results of :py:meth:`run_benchmarks`.
+    :type results: dict
+    :param baseline: The results of a previous run.
+    :type baseline: dict
+    :param tolerance: The relative increase of the time or peak memory which is reported as regression. Defaults to 0.25.
+    :type tolerance: float, optional
+    :return: The names of the benchmarks which regressed.
+    :rtype: list
+    """
+    print()
+    print("{:<40}  {:>12}  {:>12}  {:>12}".format("benchmark", "time ratio", "memory ratio", "status"))
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        # The minimal time is least affected by other processes running on the machine
+        time_ratio = result["time_min"] / base["time_min"]
+        memory_ratio = result["peak_memory_mb"] / base["peak_memory_mb"] if base["peak_memory_mb"] > 0 else 1.0
+        regressed = time_ratio > 1 + tolerance or memory_ratio > 1 + tolerance
+        if regressed:
+            regressions.append(name)
+        print("{:<40}  {:>12.3f}  {:>12.3f}  {:>12}".format(name, time_ratio, memory_ratio, "REGRESSION" if regressed else "ok"))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the throughput of the solver and the optimizers of eDPM.")
+    parser.add_argument("--quick", action="store_true", help="Use smaller problem sizes and fewer iterations.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed repetitions of every benchmark.")
+    parser.add_argument("-k", "--filter", default=None, help="Only run the benchmarks whose name contains this string.")
+    parser.add_argument("--save", default=None, help="Store the results as json in this file (eg. as a new baseline).")
+    parser.add_argument("--compare", default=None, help="Compare the results with the baseline stored in this file.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Relative slowdown or memory increase which is reported as regression.")
+    args = parser.parse_args()
+
+    print("{:<40}  {:>12}  {:>12}  {:>10}  {:>10}".format("benchmark", "time [s]", "evals/s", "peak [MiB]", "nfev"))
+    results = run_benchmarks(args.quick, args.repeat, args.filter)
+
+    if args.save is not None:
+        with open(args.save, "w") as fp:
+            json.dump({"python": platform.python_version(), "numpy": np.__version__, "results": results}, fp, indent=4)
+
+    if args.compare is not None:
+        with open(args.compare) as fp:
+            baseline = json.load(fp)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if len(regressions) > 0:
+            print("\n{} benchmark(s) regressed by more than {:.0%}.".format(len(regressions), args.tolerance))
+            sys.exit(1)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+#################################
+# THESE LINES ARE ONLY NEEDED   #
+# WHEN eDPM IS NOT INSTALLED #
+# OTHERWISE REMOVE THEM         #
+#################################
+import os, sys
+sys.path.append(os.getcwd())
+#################################
+
+import numpy as np
+import time
+
+from eDPM import *
+
+
+def f(t, x, inputs, params, consts):
+    A, B = x
+    (T,) = inputs
+    (p, q) = params
+    return [
+        - p * T * A + q * B,
+        p * T * A - q * B
+    ]
+
+
+def dfdx(t, x, inputs, params, consts):
+    A, B = x
+    (T,) = inputs
+    (p, q) = params
+    return [
+        [- p * T, q],
+        [p * T, - q]
+    ]
+
+
+def dfdp(t, x, inputs, params, consts):
+    A, B = x
+    (T,) = inputs
+    (p, q) = params
+    return [
+        [- T * A, B],
+        [T * A, - B]
+    ]
+
+
+def create_model(n_inputs, n_times, ode_vectorized):
+    fsm = FisherModel(
+        ode_fun=f,
+        ode_dfdx=dfdx,
+        ode_dfdp=dfdp,
+        ode_x0=[np.array([1.0, 0.0])],
+        ode_t0=0.0,
+        times=np.linspace(0.5, 10.0, n_times),
+        inputs=[np.linspace(0.5, 2.0, n_inputs)],
+        parameters=(0.3, 0.1),
+        identical_times=True,
+        ode_vectorized=ode_vectorized,
+    )
+    return FisherModelParametrized.init_from(fsm)
+
+
+def time_solver_mode(fsmp, solver_mode, N):
+    start = time.time()
+    for _ in range(N):
+        get_S_matrix(fsmp, solver_mode=solver_mode)
+    return (time.time() - start) / N
+
+
+if __name__ == "__main__":
+    # Define number of iterations
+    N = 5
+    n_times = 10
+
+    print("{:>8}  {:>12}  {:>12}  {:>12}  {:>8}".format("n_inputs", "serial", "stacked", "stacked+vec", "speedup"))
+    for n_inputs in [1, 4, 16, 64]:
+        t_serial = time_solver_mode(create_model(n_inputs, n_times, False), "serial", N)
+        t_stacked = time_solver_mode(create_model(n_inputs, n_times, False), "stacked", N)
+        t_stacked_vec = time_solver_mode(create_model(n_inputs, n_times, True), "stacked", N)
+        print("{:>8}  {:>12.5f}  {:>12.5f}  {:>12.5f}  {:>8.2f}".format(n_inputs, t_serial, t_stacked, t_stacked_vec, t_serial/t_stacked_vec))